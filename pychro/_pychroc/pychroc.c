@@ -16,12 +16,32 @@
  *
  */
 
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <structmember.h>
+#include <stdint.h>
+#include <string.h>
 #include <unistd.h>
 #include <sys/syscall.h>
 #include <sys/types.h>
 #include <sys/mman.h>
 #include <sys/stat.h>
+#include <linux/futex.h>
+#include <limits.h>
+#include <math.h>
+#include <time.h>
+#include <sched.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#define CPU_RELAX() __builtin_ia32_pause()
+#elif defined(__aarch64__)
+#define CPU_RELAX() __asm__ __volatile__("yield")
+#else
+#define CPU_RELAX() __asm__ __volatile__("" ::: "memory")
+#endif
+
+#define FILENUM_FROM_POS_SHIFT 26
+#define POS_MASK ((1ULL << FILENUM_FROM_POS_SHIFT) - 1)
 
 static PyObject *
 get_thread_id(PyObject *self, PyObject *args) {
@@ -71,6 +91,1142 @@ try_atomic_write_mmap(PyObject *self, PyObject *args) {
     return PyLong_FromUnsignedLongLong(__sync_val_compare_and_swap(valp, prev, val));
 }
 
+/* Raises the 8 byte value at valp to val if lower, returning the previous value */
+static unsigned long long
+atomic_max(unsigned long long *valp, unsigned long long val) {
+    unsigned long long cur = __atomic_load_n(valp, __ATOMIC_RELAXED);
+    while (cur < val && !__atomic_compare_exchange_n(valp, &cur, val, 1, __ATOMIC_RELEASE, __ATOMIC_RELAXED))
+        ;
+    return cur;
+}
+
+/*
+ * Notification: a 32 bit sequence at seqp, followed by a 32 bit count of waiters.
+ * Waking is only attempted (a syscall) when there are waiters.
+ */
+static uint32_t
+notify(uint32_t *seqp) {
+    uint32_t seq = __atomic_add_fetch(seqp, 1, __ATOMIC_SEQ_CST);
+    if (__atomic_load_n(seqp+1, __ATOMIC_SEQ_CST))
+        syscall(SYS_futex, seqp, FUTEX_WAKE, INT_MAX, NULL, NULL, 0);
+    return seq;
+}
+
+/*
+ * Publishes an index entry for a single (exclusive) writer, which need not compare and swap: writes val at
+ * index_offset and hwm at hwm_offset of control with ordered plain stores, then notifies at notify_offset of
+ * control (as notify_mmap).
+ */
+static PyObject *
+publish_index_slot(PyObject *self, PyObject *args) {
+    void *index;
+    unsigned int index_offset;
+    unsigned long long val;
+    void *control;
+    unsigned int hwm_offset;
+    unsigned long long hwm;
+    unsigned int notify_offset;
+    if (!PyArg_ParseTuple(args, "KIKKIKI", &index, &index_offset, &val, &control, &hwm_offset, &hwm,
+                          &notify_offset))
+        return NULL;
+    __atomic_store_n((unsigned long long*)((unsigned char*)index+index_offset), val, __ATOMIC_RELEASE);
+    __atomic_store_n((unsigned long long*)((unsigned char*)control+hwm_offset), hwm, __ATOMIC_RELEASE);
+    notify((uint32_t*)((unsigned char*)control+notify_offset));
+    Py_RETURN_NONE;
+}
+
+/*
+ * Mapping(address, size, writable) - owns size bytes mapped at address (by open_read_mmap or open_write_mmap),
+ * exporting them as a buffer. close() unmaps them once no buffer of them remains (e.g. a memoryview slice or
+ * numpy array, or a wait in progress), and otherwise they are unmapped when the last is released, so a buffer
+ * never refers to unmapped memory.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    char *data;
+    Py_ssize_t size;
+    int writable;
+    Py_ssize_t exports;
+    int closed;
+} MappingObject;
+
+static void
+mapping_unmap(MappingObject *self) {
+    if (self->data) {
+        munmap(self->data, self->size);
+        self->data = NULL;
+    }
+}
+
+static int
+Mapping_init(MappingObject *self, PyObject *args, PyObject *kwds) {
+    void *data;
+    Py_ssize_t size;
+    int writable;
+    if (!PyArg_ParseTuple(args, "Knp", &data, &size, &writable))
+        return -1;
+    mapping_unmap(self);
+    self->data = (char *)data;
+    self->size = size;
+    self->writable = writable;
+    self->closed = 0;
+    return 0;
+}
+
+static void
+Mapping_dealloc(MappingObject *self) {
+    mapping_unmap(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static int
+Mapping_getbuffer(MappingObject *self, Py_buffer *view, int flags) {
+    if (self->closed) {
+        PyErr_SetString(PyExc_ValueError, "mapping closed");
+        return -1;
+    }
+    if (PyBuffer_FillInfo(view, (PyObject *)self, self->data, self->size, !self->writable, flags) == -1)
+        return -1;
+    self->exports++;
+    return 0;
+}
+
+static void
+Mapping_releasebuffer(MappingObject *self, Py_buffer *view) {
+    if (--self->exports == 0 && self->closed)
+        mapping_unmap(self);
+}
+
+static PyObject *
+Mapping_close(MappingObject *self, PyObject *unused) {
+    self->closed = 1;
+    if (self->exports == 0)
+        mapping_unmap(self);
+    Py_RETURN_NONE;
+}
+
+static PyBufferProcs Mapping_as_buffer = {
+    .bf_getbuffer = (getbufferproc)Mapping_getbuffer,
+    .bf_releasebuffer = (releasebufferproc)Mapping_releasebuffer,
+};
+
+static PyMethodDef Mapping_methods[] = {
+    {"close", (PyCFunction)Mapping_close, METH_NOARGS, NULL},
+    {NULL}
+};
+
+static PyTypeObject MappingType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "pychro.pychroc.Mapping",
+    .tp_basicsize = sizeof(MappingObject),
+    .tp_dealloc = (destructor)Mapping_dealloc,
+    .tp_as_buffer = &Mapping_as_buffer,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_methods = Mapping_methods,
+    .tp_init = (initproc)Mapping_init,
+    .tp_new = PyType_GenericNew,
+};
+
+#ifndef MADV_POPULATE_WRITE
+#define MADV_POPULATE_WRITE 23
+#endif
+
+/*
+ * Faults in (writable) every page of size bytes at data, without changing the contents, so that later
+ * writes by any thread or process mapping the same file do not page fault. Falls back to an atomic add of
+ * zero to each page where MADV_POPULATE_WRITE is not supported (before linux 5.14).
+ */
+static void
+populate(char *data, size_t size) {
+    long page_size = sysconf(_SC_PAGESIZE);
+    if (madvise(data, size, MADV_POPULATE_WRITE) == 0)
+        return;
+    for (size_t offset = 0; offset < size; offset += page_size)
+        __sync_fetch_and_add((uint64_t *)(data + offset), 0);
+}
+
+static PyObject *
+populate_mmap(PyObject *self, PyObject *args) {
+    void *data;
+    unsigned int size;
+    if (!PyArg_ParseTuple(args, "KI", &data, &size))
+        return NULL;
+    Py_BEGIN_ALLOW_THREADS
+    populate(data, size);
+    Py_END_ALLOW_THREADS
+    Py_RETURN_NONE;
+}
+
+/* As populate_mmap, for a writable buffer such as an mmap.mmap */
+static PyObject *
+populate_buffer(PyObject *self, PyObject *arg) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(arg, &view, PyBUF_WRITABLE) == -1)
+        return NULL;
+    Py_BEGIN_ALLOW_THREADS
+    populate(view.buf, view.len);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+/*
+ * Decodes the run of consecutive non-zero index slots starting at offset (up to count of them)
+ * into a list of (filenum, pos, thread) tuples. Stops at the first empty slot.
+ */
+static PyObject *
+read_index_range(PyObject *self, PyObject *args) {
+    void *data;
+    unsigned int offset;
+    unsigned int count;
+    unsigned int thread_id_bits;
+    if (!PyArg_ParseTuple(args, "KIII", &data, &offset, &count, &thread_id_bits))
+        return NULL;
+    unsigned int data_offset_bits = 64 - thread_id_bits;
+    unsigned long long data_offset_mask = (1ULL << data_offset_bits) - 1;
+    unsigned long long *slots = (unsigned long long*)((unsigned char*)data+offset);
+    PyObject *ret = PyList_New(0);
+    if (ret == NULL)
+        return NULL;
+    unsigned int i;
+    for (i = 0; i < count; i++) {
+        unsigned long long val = __atomic_load_n(slots+i, __ATOMIC_ACQUIRE);
+        unsigned long long pos = val & data_offset_mask;
+        if (!pos)
+            break;
+        PyObject *item = Py_BuildValue("(KKK)", pos >> FILENUM_FROM_POS_SHIFT, pos & POS_MASK,
+                                       val >> data_offset_bits);
+        if (item == NULL || PyList_Append(ret, item) == -1) {
+            Py_XDECREF(item);
+            Py_DECREF(ret);
+            return NULL;
+        }
+        Py_DECREF(item);
+    }
+    return ret;
+}
+
+/*
+ * Scans the first count index slots of the buffer backwards for the last entry written by thread, returning its
+ * slot, or -1 if there is none. The buffer is held while scanning without the GIL, as wait_mmap.
+ */
+static PyObject *
+find_last_thread_slot(PyObject *self, PyObject *args) {
+    Py_buffer buf;
+    unsigned int count;
+    unsigned long long thread;
+    unsigned int thread_id_bits;
+    if (!PyArg_ParseTuple(args, "y*IKI", &buf, &count, &thread, &thread_id_bits))
+        return NULL;
+    if ((Py_ssize_t)count*8 > buf.len) {
+        PyBuffer_Release(&buf);
+        PyErr_SetString(PyExc_ValueError, "count out of range");
+        return NULL;
+    }
+    unsigned int data_offset_bits = 64 - thread_id_bits;
+    unsigned long long *slots = (unsigned long long*)buf.buf;
+    long long slot = -1;
+    Py_BEGIN_ALLOW_THREADS
+    long long i;
+    for (i = (long long)count - 1; i >= 0; i--) {
+        unsigned long long val = __atomic_load_n(slots+i, __ATOMIC_ACQUIRE);
+        if (val && (val >> data_offset_bits) == thread) {
+            slot = i;
+            break;
+        }
+    }
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&buf);
+    return PyLong_FromLongLong(slot);
+}
+
+/*
+ * After claiming index slots up to (but excluding) end, raises the high-water mark at hwm_offset of control to
+ * first_index + end (first_index being the index of slot 0), and notifies at notify_offset of control.
+ */
+static void
+publish_claimed(void *control, unsigned int hwm_offset, unsigned long long first_index, unsigned int end,
+                unsigned int notify_offset) {
+    if (!control)
+        return;
+    atomic_max((unsigned long long*)((unsigned char*)control+hwm_offset), first_index + end);
+    notify((uint32_t*)((unsigned char*)control+notify_offset));
+}
+
+/*
+ * Claims the first free index slot at or after slot (of count), by atomically writing val there, returning the
+ * slot claimed, or -1 if the remaining slots are all taken (by other writers) and the next index file is needed.
+ * If control is given, the high-water mark is raised and readers notified there (as publish_claimed).
+ */
+static PyObject *
+claim_index_slot(PyObject *self, PyObject *args) {
+    void *data;
+    unsigned int slot;
+    unsigned int count;
+    unsigned long long val;
+    void *control = NULL;
+    unsigned int hwm_offset = 0;
+    unsigned long long first_index = 0;
+    unsigned int notify_offset = 0;
+    if (!PyArg_ParseTuple(args, "KIIK|KIKI", &data, &slot, &count, &val, &control, &hwm_offset, &first_index,
+                          &notify_offset))
+        return NULL;
+    unsigned long long *slots = (unsigned long long*)data;
+    for (; slot < count; slot++) {
+        unsigned long long expected = 0;
+        if (__atomic_load_n(slots+slot, __ATOMIC_RELAXED) == 0 &&
+                __atomic_compare_exchange_n(slots+slot, &expected, val, 0, __ATOMIC_SEQ_CST, __ATOMIC_RELAXED)) {
+            publish_claimed(control, hwm_offset, first_index, slot + 1, notify_offset);
+            return PyLong_FromLong(slot);
+        }
+    }
+    return PyLong_FromLong(-1);
+}
+
+/*
+ * As claim_index_slot, for each of the 8 byte values of vals in turn, so consecutive messages take consecutive
+ * free slots. Returns the number of values written and the slot following the last one claimed (or count, when
+ * the next index file is needed for the rest). The high-water mark is raised once, for the last slot claimed.
+ */
+static PyObject *
+claim_index_slots(PyObject *self, PyObject *args) {
+    void *data;
+    unsigned int slot;
+    unsigned int count;
+    Py_buffer vals;
+    void *control = NULL;
+    unsigned int hwm_offset = 0;
+    unsigned long long first_index = 0;
+    unsigned int notify_offset = 0;
+    if (!PyArg_ParseTuple(args, "KIIy*|KIKI", &data, &slot, &count, &vals, &control, &hwm_offset, &first_index,
+                          &notify_offset))
+        return NULL;
+    unsigned long long *slots = (unsigned long long*)data;
+    const unsigned long long *values = (const unsigned long long*)vals.buf;
+    Py_ssize_t num_values = vals.len / 8;
+    Py_ssize_t claimed = 0;
+    unsigned int end = 0;
+    for (; slot < count && claimed < num_values; slot++) {
+        unsigned long long expected = 0;
+        if (__atomic_load_n(slots+slot, __ATOMIC_RELAXED) == 0 &&
+                __atomic_compare_exchange_n(slots+slot, &expected, values[claimed], 0, __ATOMIC_SEQ_CST,
+                                            __ATOMIC_RELAXED)) {
+            claimed++;
+            end = slot + 1;
+        }
+    }
+    PyBuffer_Release(&vals);
+    if (claimed)
+        publish_claimed(control, hwm_offset, first_index, end, notify_offset);
+    return Py_BuildValue("nI", claimed, slot);
+}
+
+/*
+ * RawByteReader - reads fields straight from the underlying buffer (mmap or bytes).
+ *
+ * The buffer is acquired only for the duration of each read, so that holding a reader
+ * never prevents the chronicle from closing its memory maps.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    Py_ssize_t offset;
+    PyObject *bytes;
+} RawByteReaderObject;
+
+static const char *
+reader_acquire(RawByteReaderObject *self, Py_buffer *view, Py_ssize_t offset, Py_ssize_t size) {
+    view->obj = NULL;
+    if (PyBytes_CheckExact(self->bytes)) {
+        if (offset < 0 || offset + size > PyBytes_GET_SIZE(self->bytes)) {
+            PyErr_SetString(PyExc_IndexError, "read beyond end of buffer");
+            return NULL;
+        }
+        return PyBytes_AS_STRING(self->bytes) + offset;
+    }
+    if (PyObject_GetBuffer(self->bytes, view, PyBUF_SIMPLE) == -1)
+        return NULL;
+    if (offset < 0 || offset + size > view->len) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_IndexError, "read beyond end of buffer");
+        return NULL;
+    }
+    return (const char *)view->buf + offset;
+}
+
+static void
+reader_release(Py_buffer *view) {
+    if (view->obj != NULL)
+        PyBuffer_Release(view);
+}
+
+static int
+reader_decode_stopbit(RawByteReaderObject *self, Py_ssize_t *offset, unsigned long long *value) {
+    Py_buffer view;
+    const unsigned char *p = (const unsigned char *)reader_acquire(self, &view, *offset, 1);
+    if (p == NULL)
+        return -1;
+    Py_ssize_t remaining = (view.obj ? view.len : PyBytes_GET_SIZE(self->bytes)) - *offset;
+    unsigned long long v = 0;
+    unsigned int shift = 0;
+    Py_ssize_t i = 0;
+    while (1) {
+        if (i >= remaining) {
+            reader_release(&view);
+            PyErr_SetString(PyExc_IndexError, "read beyond end of buffer");
+            return -1;
+        }
+        if (shift >= 64) {
+            reader_release(&view);
+            PyErr_SetString(PyExc_OverflowError, "stop-bit value too large");
+            return -1;
+        }
+        unsigned char b = p[i++];
+        v += (unsigned long long)(b & 0x7f) << shift;
+        shift += 7;
+        if ((b & 0x80) == 0)
+            break;
+    }
+    reader_release(&view);
+    *offset += i;
+    *value = v;
+    return 0;
+}
+
+static PyObject *
+reader_decode_string(RawByteReaderObject *self, Py_ssize_t *offset) {
+    unsigned long long l;
+    if (reader_decode_stopbit(self, offset, &l) == -1)
+        return NULL;
+    Py_buffer view;
+    const char *p = reader_acquire(self, &view, *offset, (Py_ssize_t)l);
+    if (p == NULL)
+        return NULL;
+    PyObject *ret = PyUnicode_DecodeUTF8(p, (Py_ssize_t)l, NULL);
+    reader_release(&view);
+    if (ret != NULL)
+        *offset += (Py_ssize_t)l;
+    return ret;
+}
+
+static int
+RawByteReader_init(RawByteReaderObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"offset", "_bytes", NULL};
+    Py_ssize_t offset;
+    PyObject *bytes;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "nO", kwlist, &offset, &bytes))
+        return -1;
+    Py_INCREF(bytes);
+    Py_XSETREF(self->bytes, bytes);
+    self->offset = offset;
+    return 0;
+}
+
+static void
+RawByteReader_dealloc(RawByteReaderObject *self) {
+    Py_XDECREF(self->bytes);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+#define READER_FIXED(NAME, TYPE, CONVERT, ADVANCE)                                  \
+static PyObject *                                                                   \
+RawByteReader_##NAME(RawByteReaderObject *self, PyObject *unused) {                \
+    Py_buffer view;                                                                 \
+    TYPE val;                                                                       \
+    const char *p = reader_acquire(self, &view, self->offset, sizeof(TYPE));        \
+    if (p == NULL)                                                                  \
+        return NULL;                                                                \
+    memcpy(&val, p, sizeof(TYPE));                                                  \
+    reader_release(&view);                                                          \
+    if (ADVANCE)                                                                    \
+        self->offset += sizeof(TYPE);                                               \
+    return CONVERT(val);                                                            \
+}
+
+READER_FIXED(read_int, int32_t, PyLong_FromLong, 1)
+READER_FIXED(read_short, int16_t, PyLong_FromLong, 1)
+READER_FIXED(read_long, int64_t, PyLong_FromLongLong, 1)
+READER_FIXED(read_double, double, PyFloat_FromDouble, 1)
+READER_FIXED(read_float, float, PyFloat_FromDouble, 1)
+READER_FIXED(read_byte, uint8_t, PyLong_FromLong, 1)
+READER_FIXED(read_boolean, uint8_t, PyBool_FromLong, 1)
+READER_FIXED(peek_int, int32_t, PyLong_FromLong, 0)
+READER_FIXED(peek_short, int16_t, PyLong_FromLong, 0)
+READER_FIXED(peek_long, int64_t, PyLong_FromLongLong, 0)
+READER_FIXED(peek_double, double, PyFloat_FromDouble, 0)
+READER_FIXED(peek_byte, uint8_t, PyLong_FromLong, 0)
+READER_FIXED(peek_boolean, uint8_t, PyBool_FromLong, 0)
+
+static PyObject *
+reader_decode_char(RawByteReaderObject *self, int advance) {
+    Py_buffer view;
+    int byteorder = 0;
+    const char *p = reader_acquire(self, &view, self->offset, 2);
+    if (p == NULL)
+        return NULL;
+    PyObject *ret = PyUnicode_DecodeUTF16(p, 2, NULL, &byteorder);
+    reader_release(&view);
+    if (ret != NULL && advance)
+        self->offset += 2;
+    return ret;
+}
+
+static PyObject *
+RawByteReader_read_char(RawByteReaderObject *self, PyObject *unused) {
+    return reader_decode_char(self, 1);
+}
+
+static PyObject *
+RawByteReader_peek_char(RawByteReaderObject *self, PyObject *unused) {
+    return reader_decode_char(self, 0);
+}
+
+static PyObject *
+RawByteReader_read_stopbit(RawByteReaderObject *self, PyObject *unused) {
+    unsigned long long value;
+    if (reader_decode_stopbit(self, &self->offset, &value) == -1)
+        return NULL;
+    return PyLong_FromUnsignedLongLong(value);
+}
+
+static PyObject *
+RawByteReader_read_string(RawByteReaderObject *self, PyObject *unused) {
+    return reader_decode_string(self, &self->offset);
+}
+
+static PyObject *
+RawByteReader_read_fixed_string(RawByteReaderObject *self, PyObject *arg) {
+    Py_ssize_t size = PyLong_AsSsize_t(arg);
+    if (size == -1 && PyErr_Occurred())
+        return NULL;
+    Py_ssize_t offset = self->offset;
+    PyObject *ret = reader_decode_string(self, &offset);
+    if (ret != NULL)
+        self->offset += size;
+    return ret;
+}
+
+static PyObject *
+RawByteReader_peek_string(RawByteReaderObject *self, PyObject *unused) {
+    Py_ssize_t offset = self->offset;
+    return reader_decode_string(self, &offset);
+}
+
+static PyObject *
+RawByteReader_peek_string_undef_offset(RawByteReaderObject *self, PyObject *unused) {
+    return reader_decode_string(self, &self->offset);
+}
+
+static PyObject *
+RawByteReader_get_length(RawByteReaderObject *self, PyObject *unused) {
+    Py_buffer view;
+    int32_t val;
+    const char *p = reader_acquire(self, &view, self->offset - 4, 4);
+    if (p == NULL)
+        return NULL;
+    memcpy(&val, p, 4);
+    reader_release(&view);
+    return PyLong_FromLong(~val);
+}
+
+static PyObject *
+RawByteReader_get_offset(RawByteReaderObject *self, PyObject *unused) {
+    return PyLong_FromSsize_t(self->offset);
+}
+
+static PyObject *
+RawByteReader_get_bytes(RawByteReaderObject *self, PyObject *unused) {
+    Py_INCREF(self->bytes);
+    return self->bytes;
+}
+
+static PyObject *
+RawByteReader_set_offset(RawByteReaderObject *self, PyObject *arg) {
+    Py_ssize_t offset = PyLong_AsSsize_t(arg);
+    if (offset == -1 && PyErr_Occurred())
+        return NULL;
+    self->offset = offset;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+RawByteReader_advance(RawByteReaderObject *self, PyObject *arg) {
+    Py_ssize_t num_bytes = PyLong_AsSsize_t(arg);
+    if (num_bytes == -1 && PyErr_Occurred())
+        return NULL;
+    self->offset += num_bytes;
+    Py_RETURN_NONE;
+}
+
+#define READER_METHOD(NAME, FLAGS) {#NAME, (PyCFunction)RawByteReader_##NAME, FLAGS, NULL}
+
+static PyMethodDef RawByteReader_methods[] = {
+    READER_METHOD(get_length, METH_NOARGS),
+    READER_METHOD(get_offset, METH_NOARGS),
+    READER_METHOD(get_bytes, METH_NOARGS),
+    READER_METHOD(set_offset, METH_O),
+    READER_METHOD(advance, METH_O),
+    READER_METHOD(read_int, METH_NOARGS),
+    READER_METHOD(read_short, METH_NOARGS),
+    READER_METHOD(read_long, METH_NOARGS),
+    READER_METHOD(read_double, METH_NOARGS),
+    READER_METHOD(read_float, METH_NOARGS),
+    READER_METHOD(read_char, METH_NOARGS),
+    READER_METHOD(read_byte, METH_NOARGS),
+    READER_METHOD(read_boolean, METH_NOARGS),
+    READER_METHOD(read_stopbit, METH_NOARGS),
+    READER_METHOD(read_string, METH_NOARGS),
+    READER_METHOD(read_fixed_string, METH_O),
+    READER_METHOD(peek_int, METH_NOARGS),
+    READER_METHOD(peek_short, METH_NOARGS),
+    READER_METHOD(peek_long, METH_NOARGS),
+    READER_METHOD(peek_double, METH_NOARGS),
+    READER_METHOD(peek_char, METH_NOARGS),
+    READER_METHOD(peek_byte, METH_NOARGS),
+    READER_METHOD(peek_boolean, METH_NOARGS),
+    READER_METHOD(peek_string, METH_NOARGS),
+    READER_METHOD(peek_string_undef_offset, METH_NOARGS),
+    {NULL}
+};
+
+static PyTypeObject RawByteReaderType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "pychro.pychroc.RawByteReader",
+    .tp_basicsize = sizeof(RawByteReaderObject),
+    .tp_dealloc = (destructor)RawByteReader_dealloc,
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+    .tp_methods = RawByteReader_methods,
+    .tp_init = (initproc)RawByteReader_init,
+    .tp_new = PyType_GenericNew,
+};
+
+/*
+ * Appender - base of pychro.Appender, encoding fields directly into the data file mmap at a write cursor.
+ *
+ * _start() (implemented by the python subclass) is called before the first write of each message
+ * and must set _mm and _started. As with RawByteReader, the buffer is only held while writing.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *mm;
+    Py_ssize_t pos;
+    Py_ssize_t start_pos;
+    Py_ssize_t limit;
+    int started;
+} AppenderObject;
+
+/* Exceptions of pychro.common, looked up when the module is initialised */
+static PyObject *NoSpace;
+static PyObject *InvalidArgumentError;
+
+static int
+appender_ensure_started(AppenderObject *self) {
+    if (self->started && self->mm != NULL && self->mm != Py_None)
+        return 0;
+    PyObject *res = PyObject_CallMethod((PyObject *)self, "_start", NULL);
+    if (res == NULL)
+        return -1;
+    Py_DECREF(res);
+    if (self->mm == NULL || self->mm == Py_None) {
+        PyErr_SetString(PyExc_RuntimeError, "_start() did not set _mm");
+        return -1;
+    }
+    return 0;
+}
+
+/* Returns pointer to size writable bytes at the cursor, or NULL with an exception set. */
+static char *
+appender_reserve(AppenderObject *self, Py_buffer *view, Py_ssize_t size) {
+    if (appender_ensure_started(self) == -1)
+        return NULL;
+    if (self->pos + size >= self->limit) {
+        PyErr_SetNone(NoSpace);
+        return NULL;
+    }
+    if (PyObject_GetBuffer(self->mm, view, PyBUF_WRITABLE) == -1)
+        return NULL;
+    if (self->pos < 0 || self->pos + size > view->len) {
+        PyBuffer_Release(view);
+        PyErr_SetNone(NoSpace);
+        return NULL;
+    }
+    return (char *)view->buf + self->pos;
+}
+
+static int
+appender_write(AppenderObject *self, const void *src, Py_ssize_t size) {
+    Py_buffer view;
+    char *p = appender_reserve(self, &view, size);
+    if (p == NULL)
+        return -1;
+    memcpy(p, src, size);
+    PyBuffer_Release(&view);
+    self->pos += size;
+    return 0;
+}
+
+static int
+encode_stopbit(unsigned char *buf, unsigned long long val) {
+    int n = 0;
+    while (val > 127) {
+        buf[n++] = 0x80 | (val & 0x7f);
+        val >>= 7;
+    }
+    buf[n++] = (unsigned char)val;
+    return n;
+}
+
+static int
+appender_write_stopbit(AppenderObject *self, PyObject *arg) {
+    unsigned char buf[10];
+    if (!PyLong_Check(arg)) {
+        PyErr_SetString(PyExc_TypeError, "an integer is required");
+        return -1;
+    }
+    int overflow;
+    long long sval = PyLong_AsLongLongAndOverflow(arg, &overflow);
+    if (sval == -1 && PyErr_Occurred())
+        return -1;
+    if (overflow < 0 || (overflow == 0 && sval < 0)) {
+        PyErr_SetString(PyExc_ValueError, "Stop-bit encoding does not support negative values");
+        return -1;
+    }
+    unsigned long long val = PyLong_AsUnsignedLongLong(arg);
+    if (val == (unsigned long long)-1 && PyErr_Occurred())
+        return -1;
+    return appender_write(self, buf, encode_stopbit(buf, val));
+}
+
+static int
+Appender_init(AppenderObject *self, PyObject *args, PyObject *kwds) {
+    return 0;
+}
+
+static void
+Appender_dealloc(AppenderObject *self) {
+    Py_XDECREF(self->mm);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static long long
+appender_long_in_range(PyObject *arg, long long min, long long max) {
+    long long val = PyLong_AsLongLong(arg);
+    if (val == -1 && PyErr_Occurred())
+        return -1;
+    if (val < min || val > max) {
+        PyErr_SetString(PyExc_OverflowError, "value out of range");
+        return -1;
+    }
+    return val;
+}
+
+#define APPENDER_WRITE_INTEGER(NAME, TYPE, MIN, MAX)                                \
+static PyObject *                                                                   \
+Appender_##NAME(AppenderObject *self, PyObject *arg) {                             \
+    long long val = appender_long_in_range(arg, MIN, MAX);                          \
+    if (val == -1 && PyErr_Occurred())                                              \
+        return NULL;                                                                \
+    TYPE v = (TYPE)val;                                                             \
+    if (appender_write(self, &v, sizeof(TYPE)) == -1)                               \
+        return NULL;                                                                \
+    Py_RETURN_NONE;                                                                 \
+}
+
+APPENDER_WRITE_INTEGER(write_byte, uint8_t, 0, 255)
+APPENDER_WRITE_INTEGER(write_short, int16_t, INT16_MIN, INT16_MAX)
+APPENDER_WRITE_INTEGER(write_int, int32_t, INT32_MIN, INT32_MAX)
+APPENDER_WRITE_INTEGER(write_long, int64_t, INT64_MIN, INT64_MAX)
+
+static PyObject *
+Appender_write_double(AppenderObject *self, PyObject *arg) {
+    double v = PyFloat_AsDouble(arg);
+    if (v == -1.0 && PyErr_Occurred())
+        return NULL;
+    if (appender_write(self, &v, sizeof(v)) == -1)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_write_float(AppenderObject *self, PyObject *arg) {
+    double d = PyFloat_AsDouble(arg);
+    if (d == -1.0 && PyErr_Occurred())
+        return NULL;
+    float v = (float)d;
+    if (isinf(v) && !isinf(d)) {
+        PyErr_SetString(PyExc_OverflowError, "float too large to pack with f format");
+        return NULL;
+    }
+    if (appender_write(self, &v, sizeof(v)) == -1)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_write_boolean(AppenderObject *self, PyObject *arg) {
+    int truth = PyObject_IsTrue(arg);
+    if (truth == -1)
+        return NULL;
+    uint8_t v = truth ? 1 : 0;
+    if (appender_write(self, &v, 1) == -1)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_write_stopbit(AppenderObject *self, PyObject *arg) {
+    if (appender_write_stopbit(self, arg) == -1)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_write_string(AppenderObject *self, PyObject *arg) {
+    Py_ssize_t l;
+    const char *encoded = PyUnicode_AsUTF8AndSize(arg, &l);
+    if (encoded == NULL)
+        return NULL;
+    unsigned char hdr[10];
+    int hdr_len = encode_stopbit(hdr, (unsigned long long)l);
+    Py_buffer view;
+    char *p = appender_reserve(self, &view, hdr_len + l);
+    if (p == NULL)
+        return NULL;
+    memcpy(p, hdr, hdr_len);
+    memcpy(p + hdr_len, encoded, l);
+    PyBuffer_Release(&view);
+    self->pos += hdr_len + l;
+    Py_RETURN_NONE;
+}
+
+/* will add filler to size, else if serialises to larger, is an error */
+static PyObject *
+Appender_write_fixed_string(AppenderObject *self, PyObject *args) {
+    PyObject *val;
+    Py_ssize_t size;
+    if (!PyArg_ParseTuple(args, "On", &val, &size))
+        return NULL;
+    Py_ssize_t l;
+    const char *encoded = PyUnicode_AsUTF8AndSize(val, &l);
+    if (encoded == NULL)
+        return NULL;
+    unsigned char hdr[10];
+    int hdr_len = encode_stopbit(hdr, (unsigned long long)l);
+    if (hdr_len + l > size) {
+        PyErr_SetNone(InvalidArgumentError);
+        return NULL;
+    }
+    Py_buffer view;
+    char *p = appender_reserve(self, &view, size);
+    if (p == NULL)
+        return NULL;
+    memcpy(p, hdr, hdr_len);
+    memcpy(p + hdr_len, encoded, l);
+    PyBuffer_Release(&view);
+    self->pos += size;
+    Py_RETURN_NONE;
+}
+
+/* copies length bytes (default to the end) of a bytes-like object (e.g. a data file mmap) from offset */
+static PyObject *
+Appender_write_raw(AppenderObject *self, PyObject *args) {
+    Py_buffer src;
+    Py_ssize_t offset = 0, length = -1;
+    if (!PyArg_ParseTuple(args, "y*|nn", &src, &offset, &length))
+        return NULL;
+    if (length < 0)
+        length = src.len - offset;
+    if (offset < 0 || length < 0 || offset + length > src.len) {
+        PyBuffer_Release(&src);
+        PyErr_SetString(PyExc_IndexError, "read past end of buffer");
+        return NULL;
+    }
+    int ret = appender_write(self, (char *)src.buf + offset, length);
+    PyBuffer_Release(&src);
+    if (ret == -1)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_fill(AppenderObject *self, PyObject *args) {
+    Py_ssize_t size;
+    Py_buffer ch;
+    if (!PyArg_ParseTuple(args, "ny*", &size, &ch))
+        return NULL;
+    if (ch.len != 1) {
+        PyBuffer_Release(&ch);
+        PyErr_SetString(PyExc_ValueError, "fill character must be a single byte");
+        return NULL;
+    }
+    Py_buffer view;
+    char *p = appender_reserve(self, &view, size);
+    if (p == NULL) {
+        PyBuffer_Release(&ch);
+        return NULL;
+    }
+    memset(p, ((unsigned char *)ch.buf)[0], size);
+    PyBuffer_Release(&view);
+    PyBuffer_Release(&ch);
+    self->pos += size;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_advance(AppenderObject *self, PyObject *arg) {
+    Py_ssize_t size = PyLong_AsSsize_t(arg);
+    if (size == -1 && PyErr_Occurred())
+        return NULL;
+    if (appender_ensure_started(self) == -1)
+        return NULL;
+    if (self->pos + size >= self->limit) {
+        PyErr_SetNone(NoSpace);
+        return NULL;
+    }
+    self->pos += size;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Appender_get_offset(AppenderObject *self, PyObject *unused) {
+    return PyLong_FromSsize_t(self->pos);
+}
+
+static PyObject *
+Appender_bytes_written(AppenderObject *self, PyObject *unused) {
+    return PyLong_FromSsize_t(self->pos - self->start_pos);
+}
+
+/* Writes the (inverted) length header of the current message. Returns the length. */
+static PyObject *
+Appender__write_length(AppenderObject *self, PyObject *unused) {
+    if (appender_ensure_started(self) == -1)
+        return NULL;
+    Py_buffer view;
+    if (PyObject_GetBuffer(self->mm, &view, PyBUF_WRITABLE) == -1)
+        return NULL;
+    if (self->start_pos < 4 || self->start_pos > view.len) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_IndexError, "invalid message start position");
+        return NULL;
+    }
+    int32_t length = (int32_t)(self->pos - self->start_pos);
+    int32_t header = ~length;
+    memcpy((char *)view.buf + self->start_pos - 4, &header, 4);
+    PyBuffer_Release(&view);
+    return PyLong_FromLong(length);
+}
+
+#define APPENDER_METHOD(NAME, FLAGS) {#NAME, (PyCFunction)Appender_##NAME, FLAGS, NULL}
+
+static PyMethodDef Appender_methods[] = {
+    APPENDER_METHOD(write_byte, METH_O),
+    APPENDER_METHOD(write_short, METH_O),
+    APPENDER_METHOD(write_int, METH_O),
+    APPENDER_METHOD(write_long, METH_O),
+    APPENDER_METHOD(write_double, METH_O),
+    APPENDER_METHOD(write_float, METH_O),
+    APPENDER_METHOD(write_boolean, METH_O),
+    APPENDER_METHOD(write_stopbit, METH_O),
+    APPENDER_METHOD(write_string, METH_O),
+    APPENDER_METHOD(write_fixed_string, METH_VARARGS),
+    APPENDER_METHOD(write_raw, METH_VARARGS),
+    APPENDER_METHOD(fill, METH_VARARGS),
+    APPENDER_METHOD(advance, METH_O),
+    APPENDER_METHOD(get_offset, METH_NOARGS),
+    APPENDER_METHOD(bytes_written, METH_NOARGS),
+    APPENDER_METHOD(_write_length, METH_NOARGS),
+    {NULL}
+};
+
+static PyMemberDef Appender_members[] = {
+    {"_mm", T_OBJECT, offsetof(AppenderObject, mm), 0, NULL},
+    {"_pos", T_PYSSIZET, offsetof(AppenderObject, pos), 0, NULL},
+    {"_start_pos", T_PYSSIZET, offsetof(AppenderObject, start_pos), 0, NULL},
+    {"_limit", T_PYSSIZET, offsetof(AppenderObject, limit), 0, NULL},
+    {"_started", T_INT, offsetof(AppenderObject, started), 0, NULL},
+    {NULL}
+};
+
+static PyTypeObject AppenderType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "pychro.pychroc.Appender",
+    .tp_basicsize = sizeof(AppenderObject),
+    .tp_dealloc = (destructor)Appender_dealloc,
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+    .tp_methods = Appender_methods,
+    .tp_members = Appender_members,
+    .tp_init = (initproc)Appender_init,
+    .tp_new = PyType_GenericNew,
+};
+
+/* Atomically raises the 8 byte value at offset to val if lower. Returns the previous value. */
+static PyObject *
+atomic_max_mmap(PyObject *self, PyObject *args) {
+    void *data;
+    unsigned long long val;
+    unsigned int offset;
+    if (!PyArg_ParseTuple(args, "KKI", &data, &val, &offset))
+        return NULL;
+    return PyLong_FromUnsignedLongLong(atomic_max((unsigned long long*)((unsigned char*)data+offset), val));
+}
+
+/* Notifies at offset (as notify), returning the new sequence */
+static PyObject *
+notify_mmap(PyObject *self, PyObject *args) {
+    void *data;
+    unsigned int offset;
+    if (!PyArg_ParseTuple(args, "KI", &data, &offset))
+        return NULL;
+    return PyLong_FromUnsignedLong(notify((uint32_t*)((unsigned char*)data+offset)));
+}
+
+/* Longest wait without the GIL before checking for signals (e.g. KeyboardInterrupt) */
+#define SIGNAL_CHECK_NS 50000000LL
+
+static long long
+elapsed_ns(const struct timespec *start) {
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (now.tv_sec - start->tv_sec)*1000000000LL + (now.tv_nsec - start->tv_nsec);
+}
+
+/*
+ * Waits, without the GIL, until the sequence at offset of the (writable) buffer differs from seq, spinning
+ * for up to spin checks then blocking for up to timeout seconds (indefinitely if negative). Returns the
+ * current sequence. The buffer is held throughout, so a Mapping closed meanwhile stays mapped until the wait
+ * returns.
+ *
+ * The waiter count is raised only for each futex wait of at most SIGNAL_CHECK_NS, so a waiter killed
+ * (e.g. SIGKILL) leaves it at most 1 too high. That costs writers only a futile wake syscall per
+ * notification, and the count starts from 0 again with the control file of the next cycle.
+ */
+static PyObject *
+wait_notify_mmap(PyObject *self, PyObject *args) {
+    Py_buffer buf;
+    unsigned int offset;
+    unsigned int seq;
+    double timeout;
+    unsigned int spin;
+    if (!PyArg_ParseTuple(args, "w*IIdI", &buf, &offset, &seq, &timeout, &spin))
+        return NULL;
+    if ((Py_ssize_t)offset + 8 > buf.len) {
+        PyBuffer_Release(&buf);
+        PyErr_SetString(PyExc_ValueError, "offset out of range");
+        return NULL;
+    }
+    uint32_t *seqp = (uint32_t*)((unsigned char*)buf.buf+offset);
+    long long timeout_ns = timeout < 0 ? -1 : (long long)(timeout*1e9);
+    struct timespec start;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    uint32_t cur;
+    while (1) {
+        Py_BEGIN_ALLOW_THREADS
+        unsigned int i;
+        for (i = 0; i < spin; i++) {
+            if (__atomic_load_n(seqp, __ATOMIC_ACQUIRE) != seq)
+                break;
+            CPU_RELAX();
+        }
+        spin = 0;
+        cur = __atomic_load_n(seqp, __ATOMIC_ACQUIRE);
+        if (cur == seq) {
+            long long wait_ns = timeout_ns < 0 ? SIGNAL_CHECK_NS : timeout_ns - elapsed_ns(&start);
+            if (wait_ns > SIGNAL_CHECK_NS)
+                wait_ns = SIGNAL_CHECK_NS;
+            if (wait_ns > 0) {
+                struct timespec ts = {wait_ns / 1000000000LL, wait_ns % 1000000000LL};
+                __atomic_add_fetch(seqp+1, 1, __ATOMIC_SEQ_CST);
+                if (__atomic_load_n(seqp, __ATOMIC_SEQ_CST) == seq)
+                    syscall(SYS_futex, seqp, FUTEX_WAIT, seq, &ts, NULL, 0);
+                __atomic_sub_fetch(seqp+1, 1, __ATOMIC_SEQ_CST);
+                cur = __atomic_load_n(seqp, __ATOMIC_ACQUIRE);
+            }
+        }
+        Py_END_ALLOW_THREADS
+        if (PyErr_CheckSignals() == -1) {
+            PyBuffer_Release(&buf);
+            return NULL;
+        }
+        if (cur != seq || (timeout_ns >= 0 && elapsed_ns(&start) >= timeout_ns))
+            break;
+    }
+    PyBuffer_Release(&buf);
+    return PyLong_FromUnsignedLong(cur);
+}
+
+/*
+ * Waits, without the GIL, until the 8 byte slot at offset of the buffer is non-zero (in its bits selected by
+ * mask). Backs off from spinning (spin checks with pause hints) to sched_yield (yields times) to sleeping
+ * (doubling up to 1ms), checking the timeout every 256 spins and for signals every SIGNAL_CHECK_NS. A negative
+ * timeout waits indefinitely. Returns the slot value, 0 on timeout. The buffer is held throughout, as
+ * wait_notify_mmap.
+ */
+static PyObject *
+wait_mmap(PyObject *self, PyObject *args) {
+    Py_buffer buf;
+    unsigned int offset;
+    unsigned long long mask;
+    double timeout;
+    unsigned int spin;
+    unsigned int yields;
+    if (!PyArg_ParseTuple(args, "y*IKdII", &buf, &offset, &mask, &timeout, &spin, &yields))
+        return NULL;
+    if ((Py_ssize_t)offset + 8 > buf.len) {
+        PyBuffer_Release(&buf);
+        PyErr_SetString(PyExc_ValueError, "offset out of range");
+        return NULL;
+    }
+    unsigned long long *slotp = (unsigned long long*)((unsigned char*)buf.buf+offset);
+    long long timeout_ns = timeout < 0 ? -1 : (long long)(timeout*1e9);
+    unsigned long long val;
+    struct timespec start;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    unsigned long long iteration = 0;
+    long sleep_ns = 1000;
+    int done = 0;
+    while (!done) {
+        Py_BEGIN_ALLOW_THREADS
+        long long check_ns = elapsed_ns(&start) + SIGNAL_CHECK_NS;
+        while (1) {
+            val = __atomic_load_n(slotp, __ATOMIC_ACQUIRE);
+            if (val & mask) {
+                done = 1;
+                break;
+            }
+            if (iteration++ < spin) {
+                CPU_RELAX();
+                if (iteration & 255)
+                    continue;
+            } else if (iteration <= (unsigned long long)spin + yields) {
+                sched_yield();
+            } else {
+                struct timespec ts = {0, sleep_ns};
+                nanosleep(&ts, NULL);
+                if (sleep_ns < 1000000)
+                    sleep_ns *= 2;
+            }
+            long long ns = elapsed_ns(&start);
+            if (timeout_ns >= 0 && ns >= timeout_ns) {
+                val = 0;
+                done = 1;
+                break;
+            }
+            if (ns >= check_ns)
+                break;
+        }
+        Py_END_ALLOW_THREADS
+        if (PyErr_CheckSignals() == -1) {
+            PyBuffer_Release(&buf);
+            return NULL;
+        }
+    }
+    PyBuffer_Release(&buf);
+    return PyLong_FromUnsignedLongLong(val);
+}
+
 static PyMethodDef Methods[] = {
     {"get_thread_id", get_thread_id, METH_NOARGS, NULL },
     {"open_write_mmap", open_write_mmap, METH_VARARGS, NULL },
@@ -78,6 +1234,17 @@ static PyMethodDef Methods[] = {
     {"close_mmap", close_mmap, METH_VARARGS, NULL },
     {"read_mmap", read_mmap, METH_VARARGS, NULL },
     {"try_atomic_write_mmap", try_atomic_write_mmap, METH_VARARGS, NULL },
+    {"publish_index_slot", publish_index_slot, METH_VARARGS, NULL },
+    {"read_index_range", read_index_range, METH_VARARGS, NULL },
+    {"find_last_thread_slot", find_last_thread_slot, METH_VARARGS, NULL },
+    {"claim_index_slot", claim_index_slot, METH_VARARGS, NULL },
+    {"claim_index_slots", claim_index_slots, METH_VARARGS, NULL },
+    {"atomic_max_mmap", atomic_max_mmap, METH_VARARGS, NULL },
+    {"notify_mmap", notify_mmap, METH_VARARGS, NULL },
+    {"wait_notify_mmap", wait_notify_mmap, METH_VARARGS, NULL },
+    {"wait_mmap", wait_mmap, METH_VARARGS, NULL },
+    {"populate_mmap", populate_mmap, METH_VARARGS, NULL },
+    {"populate_buffer", populate_buffer, METH_O, NULL },
     {NULL, NULL, 0, NULL}
 };
 
@@ -92,5 +1259,43 @@ static struct PyModuleDef module = {
 PyMODINIT_FUNC
 PyInit_pychroc(void)
 {
-    return PyModule_Create(&module);
+    if (PyType_Ready(&RawByteReaderType) < 0 || PyType_Ready(&AppenderType) < 0 || PyType_Ready(&MappingType) < 0)
+        return NULL;
+    PyObject *m = PyModule_Create(&module);
+    if (m == NULL)
+        return NULL;
+    /* defined before pychro.common imports the modules using this one */
+    PyObject *common = PyImport_ImportModule("pychro.common");
+    if (common == NULL) {
+        Py_DECREF(m);
+        return NULL;
+    }
+    NoSpace = PyObject_GetAttrString(common, "NoSpace");
+    InvalidArgumentError = PyObject_GetAttrString(common, "InvalidArgumentError");
+    Py_DECREF(common);
+    if (NoSpace == NULL || InvalidArgumentError == NULL) {
+        Py_XDECREF(NoSpace);
+        Py_XDECREF(InvalidArgumentError);
+        Py_DECREF(m);
+        return NULL;
+    }
+    Py_INCREF(&RawByteReaderType);
+    if (PyModule_AddObject(m, "RawByteReader", (PyObject *)&RawByteReaderType) < 0) {
+        Py_DECREF(&RawByteReaderType);
+        Py_DECREF(m);
+        return NULL;
+    }
+    Py_INCREF(&AppenderType);
+    if (PyModule_AddObject(m, "Appender", (PyObject *)&AppenderType) < 0) {
+        Py_DECREF(&AppenderType);
+        Py_DECREF(m);
+        return NULL;
+    }
+    Py_INCREF(&MappingType);
+    if (PyModule_AddObject(m, "Mapping", (PyObject *)&MappingType) < 0) {
+        Py_DECREF(&MappingType);
+        Py_DECREF(m);
+        return NULL;
+    }
+    return m;
 }
\ No newline at end of file
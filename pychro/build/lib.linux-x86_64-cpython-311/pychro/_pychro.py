@@ -0,0 +1,126 @@
+#
+#  Copyright 2015 Jon Turner 
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from . import pychroc
+
+
+class PychroCError(Exception):
+    pass
+
+
+def get_thread_id():
+    return pychroc.get_thread_id()
+
+
+def open_read_mmap(fh, size):
+    fh.flush()
+    fileno = fh.fileno()
+    res = pychroc.open_read_mmap(fileno, size)
+    if res == 0xffffffffffffffff:
+        raise PychroCError
+    return res
+
+
+def open_write_mmap(fh, size):
+    fh.flush()
+    fileno = fh.fileno()
+    res = pychroc.open_write_mmap(fileno, size)
+    if res == 0xffffffffffffffff:
+        raise PychroCError
+    return res
+
+
+def close_mmap(mh, size):
+    if pychroc.close_mmap(mh, size) == -1:
+        raise PychroCError
+
+
+def read_mmap(mh, offset):
+    return pychroc.read_mmap(mh, offset)
+
+
+# memoryview of 8 byte words over the mapping, which it then owns: unmapped by close_view() rather than
+# close_mmap(), once no slice (or other export) of it remains
+def mmap_view(mh, size, writable=False):
+    return memoryview(pychroc.Mapping(mh, size, writable)).cast('Q')
+
+
+def close_view(view):
+    mapping = view.obj
+    try:
+        view.release()
+    except BufferError:
+        # still exported (e.g. by a numpy array), so unmapped once released
+        pass
+    mapping.close()
+
+
+def read_index_range(mh, offset, count, thread_id_bits):
+    return pychroc.read_index_range(mh, offset, count, thread_id_bits)
+
+
+# Takes a view (of mmap_view), held while scanning, as the waits
+def find_last_thread_slot(view, count, thread, thread_id_bits):
+    return pychroc.find_last_thread_slot(view, count, thread, thread_id_bits)
+
+
+# When control_mh is given, also raises the high-water mark at hwm_offset to first_index + the slot after that
+# claimed, and notifies at notify_offset
+def claim_index_slot(mh, slot, count, val, control_mh=0, hwm_offset=0, first_index=0, notify_offset=0):
+    return pychroc.claim_index_slot(mh, slot, count, val, control_mh, hwm_offset, first_index, notify_offset)
+
+
+def publish_index_slot(index_mh, index_offset, val, control_mh, hwm_offset, hwm, notify_offset):
+    pychroc.publish_index_slot(index_mh, index_offset, val, control_mh, hwm_offset, hwm, notify_offset)
+
+
+# vals is a buffer of 8 byte values, e.g. array.array('Q'), control_mh etc. as claim_index_slot()
+def claim_index_slots(mh, slot, count, vals, control_mh=0, hwm_offset=0, first_index=0, notify_offset=0):
+    return pychroc.claim_index_slots(mh, slot, count, vals, control_mh, hwm_offset, first_index, notify_offset)
+
+
+def try_atomic_write_mmap(mh, prev, val, offset):
+    return pychroc.try_atomic_write_mmap(mh, prev, val, offset)
+
+
+def atomic_max_mmap(mh, val, offset):
+    return pychroc.atomic_max_mmap(mh, val, offset)
+
+
+def notify_mmap(mh, offset):
+    return pychroc.notify_mmap(mh, offset)
+
+
+# The waits take a view (of mmap_view) rather than an address, which keeps the file mapped until they return
+def wait_notify_mmap(view, offset, seq, timeout, spin=0):
+    return pychroc.wait_notify_mmap(view, offset, seq, timeout, spin)
+
+
+def wait_mmap(view, offset, mask, timeout=-1, spin=0, yields=0):
+    return pychroc.wait_mmap(view, offset, mask, timeout, spin, yields)
+
+
+# Pre-faults every page of the mapping (or writable buffer) without changing it
+def populate_mmap(mh, size):
+    pychroc.populate_mmap(mh, size)
+
+
+def populate_buffer(buf):
+    pychroc.populate_buffer(buf)
+
+
+def unsafe_write_mmap(mh, val, offset):
+    pychroc.try_atomic_write_mmap(mh, pychroc.read_mmap(mh, offset), val, offset)
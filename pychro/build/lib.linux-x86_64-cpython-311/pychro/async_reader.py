@@ -0,0 +1,379 @@
+#
+#  Copyright 2015 Jon Turner
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from .common import *
+from . import _pychro
+
+import asyncio
+import collections
+import datetime
+import os
+import struct
+import threading
+import time
+
+
+class ChronicleWatcher(threading.Thread):
+    # One thread per chronicle (base_dir), shared by all asyncio readers of it in the process.
+    # Blocks (without the GIL) on the writers' notification sequence of today's cycle and wakes
+    # all registered waiters when it changes, or every NOTIFY_MAX_WAIT so they can notice
+    # rollovers. Runs while any reader holds it (acquire() to release()), so a single thread and
+    # reader serve every wait.
+
+    _watchers = dict()
+    _watchers_lock = threading.Lock()
+
+    def __init__(self, base_dir, utcnow):
+        super().__init__(name='pychro-watcher:%s' % base_dir, daemon=True)
+        self._base_dir = base_dir
+        self._key = os.path.realpath(base_dir)
+        self._utcnow = utcnow
+        self._refs = 0
+        self._waiters = []
+        # guards _waiters and the control file of _chron, which add_waiter() reads
+        self._lock = threading.Lock()
+        self._chron = None
+
+    # Returns the watcher of the chronicle at base_dir, started if not already running
+    @staticmethod
+    def acquire(base_dir, utcnow=datetime.datetime.utcnow):
+        key = os.path.realpath(base_dir)
+        with ChronicleWatcher._watchers_lock:
+            watcher = ChronicleWatcher._watchers.get(key)
+            if watcher is None:
+                watcher = ChronicleWatcher(base_dir, utcnow)
+                ChronicleWatcher._watchers[key] = watcher
+                watcher._refs += 1
+                watcher.start()
+            else:
+                watcher._refs += 1
+        return watcher
+
+    # Stops the thread (within NOTIFY_MAX_WAIT) once no reader holds it
+    def release(self):
+        with ChronicleWatcher._watchers_lock:
+            self._refs -= 1
+            if not self._refs:
+                del ChronicleWatcher._watchers[self._key]
+
+    # Returns a future of loop, resolved on the next notification after this call
+    def add_waiter(self, loop):
+        future = loop.create_future()
+        self.add_callback(lambda: loop.call_soon_threadsafe(ChronicleWatcher._wake, future))
+        return future
+
+    # Calls callback (from the watcher thread) on the next notification after this call. The sequence is
+    # sampled now, so a message written before the caller checks the chronicle again is not missed
+    # even if the thread has not yet seen today's control file.
+    def add_callback(self, callback):
+        with self._lock:
+            self._waiters += [(callback, self._get_seq())]
+
+    # The notification sequence of today's control file, or None if not open
+    def _get_seq(self):
+        chron = self._chron
+        if chron is None or chron._control_view is None or chron.get_date() != self._utcnow().date():
+            return None
+        return self._chron._control_view[CONTROL_NOTIFY_SLOT] & 0xffffffff
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    def _wake_all(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for callback, _ in waiters:
+            try:
+                callback()
+            except RuntimeError:
+                # loop closed
+                pass
+
+    # Whether today's control file is mapped writable (as required to wait on it)
+    def _open_today(self):
+        date = self._utcnow().date()
+        if self._chron is None:
+            self._chron = VanillaChronicleReader(self._base_dir, utcnow=self._utcnow)
+        if self._chron.get_date() != date:
+            try:
+                self._chron.set_date(date)
+            except NoData:
+                return False
+        return self._chron.get_date() == date and self._chron._open_control() and self._chron._control_writable
+
+    def run(self):
+        try:
+            while self._refs:
+                with self._lock:
+                    opened = self._open_today()
+                    seq = self._get_seq() if opened else None
+                    # those registered with another sequence (or before the file was open) may have missed it
+                    stale = any(waiter_seq != seq for _, waiter_seq in self._waiters)
+                if not opened:
+                    time.sleep(NOTIFY_MAX_WAIT/10)
+                    self._wake_all()
+                    continue
+                if stale:
+                    self._wake_all()
+                _pychro.wait_notify_mmap(self._chron._control_view, CONTROL_NOTIFY_SLOT*8, seq, NOTIFY_MAX_WAIT)
+                self._wake_all()
+        finally:
+            with self._lock:
+                if self._chron is not None:
+                    self._chron.close()
+                    self._chron = None
+
+
+class AsyncVanillaChronicleReader:
+    # asyncio equivalent of a polling VanillaChronicleReader, for use within a running event loop.
+    #
+    # next_reader() and next_batch() wait for messages without threads or polling per reader, woken by
+    # a ChronicleWatcher shared by all readers of the chronicle. The remaining arguments are as
+    # VanillaChronicleReader.
+    #
+    # async for iterates over readers indefinitely.
+    #
+
+    def __init__(self, base_dir, batch_size=1024, **kwargs):
+        kwargs['polling_interval'] = None
+        self._base_dir = base_dir
+        self._utcnow = kwargs.get('utcnow', datetime.datetime.utcnow)
+        self._chron = VanillaChronicleReader(base_dir, **kwargs)
+        self._batch_size = batch_size
+        self._pending = collections.deque()
+        self._watcher = ChronicleWatcher.acquire(base_dir, self._utcnow)
+
+    def __str__(self):
+        return '<AsyncVanillaChronicleReader %s>' % self._chron
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._pending.clear()
+        self._chron.close()
+        if self._watcher is not None:
+            self._watcher.release()
+            self._watcher = None
+
+    def get_chronicle(self):
+        return self._chron
+
+    def get_index(self):
+        return self._chron.get_index() - len(self._pending)
+
+    def _try_fill(self, max_messages):
+        try:
+            self._pending.extend(self._chron.next_batch(max_messages))
+            return True
+        except NoData:
+            return False
+
+    async def _wait(self, max_messages):
+        while not self._pending and not self._try_fill(max_messages):
+            if self._watcher is None:
+                raise PychroException('AsyncVanillaChronicleReader closed')
+            future = self._watcher.add_waiter(asyncio.get_running_loop())
+            # check again, as a message may have been written before registering
+            if self._try_fill(max_messages):
+                future.cancel()
+                break
+            await future
+
+    async def next_reader(self):
+        await self._wait(self._batch_size)
+        return self._pending.popleft()
+
+    # Returns all messages available (up to max_messages), waiting for at least one
+    async def next_batch(self, max_messages=None):
+        max_messages = max_messages or self._batch_size
+        await self._wait(max_messages)
+        batch = []
+        while self._pending and len(batch) < max_messages:
+            batch += [self._pending.popleft()]
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.next_reader()
+
+
+class RemoteChronicleProtocol(asyncio.Protocol):
+    def __init__(self, reader):
+        self._reader = reader
+
+    def connection_made(self, transport):
+        self._reader._connection_made(transport)
+
+    def data_received(self, data):
+        self._reader._data_received(data)
+
+    def connection_lost(self, exc):
+        self._reader._connection_lost(exc)
+
+
+class AsyncRemoteChronicleReader:
+    # asyncio equivalent of RemoteChronicleReader. Create with:
+    #
+    #     reader = await AsyncRemoteChronicleReader.connect(host, port, where)
+    #
+    # Frames are parsed from a single receive buffer, and readers are views onto it, so there is
+    # no copy or join per message. Reading is paused when max_pending messages are unconsumed.
+    #
+
+    def __init__(self, host, port, where, max_pending=64*1024):
+        self._host = host
+        self._port = port
+        self._where = where
+        self._startidx = RemoteChronicleReader.get_start_index(where)
+        self._idx = None
+        self._max_pending = max_pending
+        self._transport = None
+        self._buf = bytearray()
+        self._pending = collections.deque()
+        self._synced = None
+        self._waiter = None
+        self._exception = None
+        self._paused = False
+
+    @staticmethod
+    async def connect(host, port, where, max_pending=64*1024):
+        reader = AsyncRemoteChronicleReader(host, port, where, max_pending)
+        loop = asyncio.get_running_loop()
+        reader._synced = loop.create_future()
+        await loop.create_connection(lambda: RemoteChronicleProtocol(reader), host, port)
+        try:
+            await reader._synced
+            if where == 'now':  # consume last message which we get with end..
+                await reader.next_reader()
+        except BaseException:
+            reader.close()
+            raise
+        return reader
+
+    def __str__(self):
+        return '<AsyncRemoteChronicleReader host:%s port:%s idx:%s>' % (self._host, self._port, self._idx)
+
+    def get_index(self):
+        return self._idx
+
+    def close(self):
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def _connection_made(self, transport):
+        self._transport = transport
+        transport.write(struct.pack('qq', RemoteChronicleReader.SUBSCRIBE, self._startidx))
+
+    def _connection_lost(self, exc):
+        self._exception = exc or ConnectionResetError('Connection to %s:%s closed' % (self._host, self._port))
+        self._transport = None
+        if not self._synced.done():
+            self._synced.set_exception(self._exception)
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _fail(self, exc):
+        if not self._synced.done():
+            self._synced.set_exception(exc)
+        self._exception = exc
+        self.close()
+        self._wake()
+
+    def _data_received(self, data):
+        self._buf += data
+        pos = 0
+        if not self._synced.done():
+            pos = self._parse_sync()
+            if pos is None:
+                return
+        try:
+            frames, pos = RemoteChronicleReader._parse_frames(self._buf, pos, len(self._buf))
+        except PychroException as e:
+            self._fail(e)
+            return
+        if frames:
+            # the readers keep the current buffer, only the remaining partial frame is copied
+            buf, self._buf = self._buf, self._buf[pos:]
+            self._pending.extend([(RawByteReader(offset, buf), index) for offset, index in frames])
+            self._wake()
+            if len(self._pending) >= self._max_pending and self._transport and not self._paused:
+                self._paused = True
+                self._transport.pause_reading()
+        elif pos:
+            del self._buf[:pos]
+
+    # Returns the offset following the synced OK frame, or None if not yet received
+    def _parse_sync(self):
+        pos = 0
+        while len(self._buf) - pos >= RemoteChronicleReader.HEADER_LENGTH:
+            length, index = RemoteChronicleReader.HEADER.unpack_from(self._buf, pos)
+            pos += RemoteChronicleReader.HEADER_LENGTH
+            if length in (RemoteChronicleReader.IN_SYNC, RemoteChronicleReader.PAD):
+                continue
+            elif length == RemoteChronicleReader.SYNCED_OK:
+                self._idx = index
+                self._synced.set_result(None)
+                return pos
+            else:
+                self._fail(PychroException('In-Sync not received as expected (length:%s, index:%s)'
+                                           % (length, index)))
+                return None
+        del self._buf[:pos]
+        return None
+
+    async def _wait(self):
+        while not self._pending:
+            if self._exception is not None:
+                raise self._exception
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+    def _pop(self):
+        reader, self._idx = self._pending.popleft()
+        if self._paused and len(self._pending) < self._max_pending//2 and self._transport:
+            self._paused = False
+            self._transport.resume_reading()
+        return reader
+
+    async def next_reader(self):
+        await self._wait()
+        return self._pop()
+
+    # Returns all messages received (up to max_messages), waiting for at least one
+    async def next_batch(self, max_messages=1024):
+        await self._wait()
+        return [self._pop() for _ in range(min(max_messages, len(self._pending)))]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.next_reader()
@@ -0,0 +1,122 @@
+
+# Index is 24bits cycle (days since 1970), 16bits index file number, 24bits sequence of the cycle (day)
+
+import sys
+
+FILENUM_FROM_POS_SHIFT = 26
+POS_MASK = eval('0b'+'1'*FILENUM_FROM_POS_SHIFT)
+DEFAULT_MAX_MAPPED_MEMORY_PER_READER = 1024*1024*1024
+DATA_FILE_SIZE = 64*1024*1024 # 64MB
+FILENUM_FROM_INDEX_SHIFT = 24 # 16MB
+CYCLE_INDEX_POS = 40
+INDEX_FILE_SIZE = 16*1024*1024
+ENTRIES_PER_INDEX_FILE = INDEX_FILE_SIZE//8
+INDEX_OFFSET_MASK = eval('0b'+'1'*FILENUM_FROM_INDEX_SHIFT)
+
+# Per cycle (day) pychro control file, of 8 byte slots. Ignored by Java Chronicle.
+CONTROL_FILE_NAME = 'pychro-control'
+CONTROL_FILE_SIZE = 4096
+# Advisory high-water mark: an index below which all index entries are known to be written. Raised by writers
+# in the same native call that claims a slot, so it never leads the end of the index. It lags by the slots of
+# writers between the two steps (or which stopped there), and of writers which do not keep it (Java Chronicle).
+CONTROL_HWM_SLOT = 0
+# Entries scanned forward from the high-water mark before resorting to a binary search: more than the lag of
+# the concurrently claiming pychro writers, so the search is only needed after other writers
+HWM_SCAN_LIMIT = 64
+# Notification sequence (32 bits) bumped by writers after each index entry, followed by
+# a 32 bit count of waiting readers. On its own cache line. A reader killed while waiting leaves the
+# count 1 too high (waits register for at most 50ms at a time), which costs writers only a futile wake
+# syscall per notification until the control file of the next cycle.
+CONTROL_NOTIFY_SLOT = 8
+
+# Per cycle file of the next write position of each writing thread (tid), so appenders resume without
+# searching the index. A hash table of 16 byte entries: tid+1 (claimed atomically), then
+# filenum << FILENUM_FROM_POS_SHIFT | pos. Ignored by Java Chronicle.
+POSITIONS_FILE_NAME = 'pychro-positions'
+POSITIONS_FILE_SIZE = 64*1024
+
+# File in base_dir of the logical writer ids (tids) leased by writers with leased_ids, an 8 byte slot per id
+# holding the pid of the process leasing it (claimed atomically), or 0 when free.
+LEASE_FILE_NAME = 'pychro-leases'
+LEASE_FILE_SIZE = 4096
+
+# Strategies for readers waiting for new messages (when polling_interval is not None)
+# sleep: time.sleep(polling_interval) between checks, or spin in python for 0
+WAIT_SLEEP = 'sleep'
+# notify: block on the writers' notification sequence, for at most polling_interval (or
+# NOTIFY_MAX_WAIT if 0), after spinning for spin_count checks
+WAIT_NOTIFY = 'notify'
+NOTIFY_MAX_WAIT = 1.0
+# spin: wait natively (releasing the GIL) on the next index slot, spinning for spin_count checks, then
+# yielding SPIN_YIELDS times, then sleeping with backoff, for at most polling_interval (or NOTIFY_MAX_WAIT if 0)
+WAIT_SPIN = 'spin'
+SPIN_YIELDS = 100
+
+# Seconds before the end of a cycle that a preallocating writer prepares the files of the next
+ROLLOVER_PREPARE_AHEAD = 60
+
+# Durability policies of writers, which otherwise rely on the kernel writing back the memory maps
+# none: never sync
+DURABILITY_NONE = 'none'
+# periodic: a background thread syncs the files written every sync_interval seconds
+DURABILITY_PERIODIC = 'periodic'
+# batch: every finish() or publish() syncs before returning
+DURABILITY_BATCH = 'batch'
+DEFAULT_SYNC_INTERVAL = 0.1
+
+
+class PychroException(Exception):
+    pass
+
+
+class UnsupportedPlatformException(Exception):
+    pass
+
+
+if sys.version_info.major != 3:
+    raise UnsupportedPlatformException('Only python3 is supported')
+
+
+class NoData(PychroException):
+    pass
+
+
+class ConfigError(PychroException):
+    pass
+
+
+class NoSpace(PychroException):
+    pass
+
+
+class PartialWriteLostOnRollover(PychroException):
+    pass
+
+
+# A writer cannot write to a cycle held by an exclusive writer (of another process)
+class ChronicleLocked(PychroException):
+    pass
+
+
+class InvalidArgumentError(PychroException):
+    pass
+
+
+# No data file or incorrect thread_id_bits. Copied from different platform or change in settings?
+class CorruptData(PychroException):
+    pass
+
+
+# Differs from NoData, as may happen even when following
+# as no Chronicle has been created for that date.
+class EndOfIndexfile(PychroException):
+    pass
+
+
+from .vanilla_reader import *
+from .vanilla_writer import *
+from .schema import *
+from .async_reader import *
+from .server import *
+from .replicator import *
+from .queued_writer import *
\ No newline at end of file
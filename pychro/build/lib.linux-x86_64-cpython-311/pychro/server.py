@@ -0,0 +1,314 @@
+#
+#  Copyright 2015 Jon Turner
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from .common import *
+
+import datetime
+import logging
+import selectors
+import socket
+import struct
+import sys
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+# buffers per sendmsg, each message being a header and a body
+SERVER_MAX_IOV = 1024
+SERVER_HEARTBEAT_INTERVAL = 2.5
+
+
+class ChronicleSubscription:
+    # A subscriber's reader and the buffers still to be sent to it. Bodies are memoryviews of the
+    # reader's data files, released once sent.
+
+    def __init__(self, soc):
+        self.soc = soc
+        self.request = b''
+        self.chron = None
+        # the index subscribed from, while its cycle does not exist
+        self.start_index = None
+        self.buffers = []
+        self.views = []
+        self.last_sent = time.monotonic()
+
+    def subscribe(self, base_dir, start_index, reader_kwargs):
+        self.chron = VanillaChronicleReader(base_dir, **reader_kwargs)
+        try:
+            if start_index == RemoteChronicleReader.FROM_END:
+                # the last message is sent too, so the subscriber knows where it is
+                self.chron.set_end()
+                if self.chron.get_index() > self.chron.to_full_index(self.chron.get_date(), 0):
+                    self.chron.set_index(self.chron.get_index()-1)
+            elif start_index != RemoteChronicleReader.FROM_START:
+                self.chron.set_index(start_index)
+            synced_index = self.chron.get_index()
+        except NoData:
+            synced_index = start_index
+            if start_index not in (RemoteChronicleReader.FROM_START, RemoteChronicleReader.FROM_END):
+                # e.g. today's before its first message, so nothing is sent (from an earlier cycle) until it exists
+                self.start_index = start_index
+        self.queue(RemoteChronicleReader.HEADER.pack(RemoteChronicleReader.IN_SYNC, 0))
+        self.queue(RemoteChronicleReader.HEADER.pack(RemoteChronicleReader.SYNCED_OK, synced_index))
+
+    def queue(self, buffer):
+        self.buffers += [buffer]
+
+    # Queues the headers and bodies of up to max_messages new messages, returning the number queued
+    def queue_messages(self, max_messages):
+        if self.start_index is not None:
+            try:
+                self.chron.set_index(self.start_index)
+            except NoData:
+                return 0
+            self.start_index = None
+        try:
+            batch = self.chron.next_batch(max_messages)
+        except NoData:
+            return 0
+        index = self.chron.get_index() - len(batch)
+        views = dict()
+        for reader in batch:
+            mm = reader.get_bytes()
+            view = views.get(id(mm))
+            if view is None:
+                view = views[id(mm)] = memoryview(mm)
+            offset = reader.get_offset()
+            length = reader.get_length()
+            self.buffers += [RemoteChronicleReader.HEADER.pack(length, index), view[offset:offset+length]]
+            index += 1
+        self.views += views.values()
+        return len(batch)
+
+    # Sends as much as possible without blocking, returning whether everything queued was sent
+    def send(self):
+        while self.buffers:
+            try:
+                sent = self.soc.sendmsg(self.buffers[:SERVER_MAX_IOV])
+            except BlockingIOError:
+                return False
+            self.last_sent = time.monotonic()
+            while sent:
+                length = len(self.buffers[0])
+                if sent < length:
+                    self.buffers[0] = memoryview(self.buffers[0])[sent:]
+                    break
+                sent -= length
+                self.buffers.pop(0)
+        self.release()
+        return True
+
+    def release(self):
+        self.buffers = []
+        for view in self.views:
+            view.release()
+        self.views = []
+
+    def close(self):
+        self.release()
+        self.soc.close()
+        if self.chron:
+            self.chron.close()
+
+
+class ChronicleServer:
+    # Serves the chronicle at base_dir to RemoteChronicleReader subscribers over TCP, from a single thread
+    # calling serve_forever(). Each subscriber is sent batches of up to batch_size messages with one sendmsg,
+    # the message bodies directly from the data files. When all subscribers are caught up, the server waits
+    # for the writers' notification of a new message (through the chronicle's ChronicleWatcher), or polls
+    # every polling_interval if given. Idle subscribers are sent a heartbeat every heartbeat_interval.
+    #
+    # Remaining arguments are passed to each subscriber's VanillaChronicleReader.
+    #
+
+    def __init__(self, base_dir, host='', port=0, batch_size=256, polling_interval=None,
+                 heartbeat_interval=SERVER_HEARTBEAT_INTERVAL, **kwargs):
+        self._base_dir = base_dir
+        self._batch_size = min(batch_size, SERVER_MAX_IOV//2)
+        self._polling_interval = polling_interval
+        self._heartbeat_interval = heartbeat_interval
+        self._reader_kwargs = kwargs
+        self._reader_kwargs['polling_interval'] = None
+        self._subscriptions = dict()
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+        self._watcher = None
+        self._notify_pending = False
+        self._next_heartbeat = 0
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._listener = socket.create_server((host, port))
+        self._listener.setblocking(False)
+        self._selector.register(self._listener, selectors.EVENT_READ)
+
+    def __str__(self):
+        return '<ChronicleServer dir:%s port:%s subscribers:%s>' % (self._base_dir, self.get_port(),
+                                                                    len(self._subscriptions))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_port(self):
+        return self._listener.getsockname()[1]
+
+    def get_num_subscribers(self):
+        return len([s for s in self._subscriptions.values() if s.chron])
+
+    def serve_forever(self):
+        self._running = True
+        if self._polling_interval is None:
+            self._watcher = ChronicleWatcher.acquire(self._base_dir,
+                                                     self._reader_kwargs.get('utcnow', datetime.datetime.utcnow))
+        try:
+            idle = True
+            while self._running:
+                if idle and self._watcher and not self._notify_pending:
+                    # registered before checking for new messages, so none written meanwhile is missed
+                    self._notify_pending = True
+                    self._watcher.add_callback(self._notified)
+                idle = self._serve_subscribers()
+                if not idle:
+                    timeout = 0
+                elif not self._watcher:
+                    timeout = self._polling_interval
+                elif self._notify_pending:
+                    timeout = max(0, self._next_heartbeat - time.monotonic())
+                else:
+                    # notified since registering, so register again before waiting
+                    timeout = 0
+                for key, events in self._selector.select(timeout):
+                    if key.fileobj is self._listener:
+                        self._accept()
+                    elif key.fileobj is self._wake_r:
+                        self._wake_r.recv(4096)
+                    else:
+                        subscription = key.data
+                        if events & selectors.EVENT_READ:
+                            self._receive(subscription)
+                        if events & selectors.EVENT_WRITE and subscription.soc.fileno() >= 0:
+                            self._send(subscription)
+        finally:
+            if self._watcher:
+                self._watcher.release()
+                self._watcher = None
+
+    # Called by the watcher thread
+    def _notified(self):
+        self._notify_pending = False
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            # closed
+            pass
+
+    # May be called from any thread
+    def shutdown(self):
+        self._running = False
+        self._wake_w.send(b'\0')
+
+    def close(self):
+        for subscription in list(self._subscriptions.values()):
+            self._drop(subscription)
+        self._selector.close()
+        self._listener.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _accept(self):
+        try:
+            soc, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        soc.setblocking(False)
+        soc.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscription = ChronicleSubscription(soc)
+        self._subscriptions[soc] = subscription
+        self._selector.register(soc, selectors.EVENT_READ, subscription)
+
+    def _drop(self, subscription):
+        self._selector.unregister(subscription.soc)
+        del self._subscriptions[subscription.soc]
+        subscription.close()
+
+    def _receive(self, subscription):
+        try:
+            data = subscription.soc.recv(16 - len(subscription.request) if not subscription.chron else 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(subscription)
+            return
+        if subscription.chron:
+            return
+        subscription.request += data
+        if len(subscription.request) < 16:
+            return
+        request, start_index = struct.unpack('qq', subscription.request)
+        if request != RemoteChronicleReader.SUBSCRIBE:
+            self._drop(subscription)
+            return
+        try:
+            subscription.subscribe(self._base_dir, start_index, self._reader_kwargs)
+        except Exception:
+            # e.g. an index out of range, or no chronicle at base_dir, which must not stop the server
+            _logger.exception('Unable to subscribe from index %s', start_index)
+            self._drop(subscription)
+            return
+        self._send(subscription)
+
+    def _send(self, subscription):
+        try:
+            sent = subscription.send()
+        except OSError:
+            self._drop(subscription)
+            return False
+        self._selector.modify(subscription.soc, selectors.EVENT_READ if sent else
+                              selectors.EVENT_READ | selectors.EVENT_WRITE, subscription)
+        return sent
+
+    # Queues and sends new messages to all subscribers not waiting to send, returning whether all are
+    # caught up
+    def _serve_subscribers(self):
+        idle = True
+        now = time.monotonic()
+        self._next_heartbeat = now + self._heartbeat_interval
+        for subscription in list(self._subscriptions.values()):
+            if not subscription.chron or subscription.buffers:
+                continue
+            if subscription.queue_messages(self._batch_size):
+                idle = False
+            elif now - subscription.last_sent >= self._heartbeat_interval:
+                subscription.queue(RemoteChronicleReader.HEADER.pack(RemoteChronicleReader.IN_SYNC, 0))
+            else:
+                self._next_heartbeat = min(self._next_heartbeat, subscription.last_sent + self._heartbeat_interval)
+                continue
+            self._send(subscription)
+        return idle
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python -m pychro.server base_dir port', file=sys.stderr)
+        sys.exit(1)
+    with ChronicleServer(sys.argv[1], port=int(sys.argv[2])) as server:
+        server.serve_forever()
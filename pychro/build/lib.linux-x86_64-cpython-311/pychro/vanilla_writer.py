@@ -0,0 +1,982 @@
+#
+#  Copyright 2015 Jon Turner 
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from .common import *
+from . import _pychro
+from . import pychroc
+
+import array
+import fcntl
+import struct
+import os
+import mmap
+import queue
+import threading
+import time
+import weakref
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DEFAULT_MAX_MSG_SIZE = 64*1024
+
+
+# Opens fn for update, creating it with size bytes if it does not exist. It is created atomically so that
+# it is never seen partially sized, with its blocks allocated up front if allocate.
+def open_sized_file(fn, size, allocate=False):
+    if not os.path.exists(fn):
+        tmp_fn = '%s.%s.%s' % (fn, os.getpid(), _pychro.get_thread_id())
+        with open(tmp_fn, 'wb') as fh:
+            fh.truncate(size)
+            if allocate:
+                try:
+                    os.posix_fallocate(fh.fileno(), 0, size)
+                except OSError:
+                    # e.g. not supported by the file system
+                    pass
+        try:
+            os.link(tmp_fn, fn)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_fn)
+    fh = open(fn, 'r+b')
+    if os.fstat(fh.fileno()).st_size < size:
+        # being created by an earlier writer
+        fh.truncate(size)
+    return fh
+
+
+# Writers holding their cycle exclusively, which a forked child must not write to as if it did too
+_exclusive_writers = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for writer in list(_exclusive_writers):
+        writer._lose_cycle_lock()
+    _exclusive_writers.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class FilePreallocator(threading.Thread):
+    # Creates, allocates and pre-faults data and index files ahead of need, for a writer to take when it
+    # moves on to them, so appending does not wait on file creation or first touch page faults.
+    # Index files are mapped with _pychro, data files with mmap.
+    #
+    # The files of the next cycle are prepared at a scheduled time (of clock) in a hidden directory, and
+    # moved into the cycle directory by adopt() on rollover.
+
+    def __init__(self, clock=time.time):
+        super().__init__(name='pychro-preallocator', daemon=True)
+        self._clock = clock
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        # notified when a file being prepared (by the thread) is registered or given up
+        self._prepared_cond = threading.Condition(self._lock)
+        self._preparing = None
+        self._prepared = dict()
+        self._scheduled = []
+        self._cycles = dict()
+
+    def request(self, fn, size, index):
+        self._requests.put((fn, size, index))
+
+    # Prepares index-0 and the first data file of each of get_tids() for cycle_dir at when
+    def schedule_cycle(self, when, cycle_dir, get_tids):
+        with self._lock:
+            self._scheduled = sorted(self._scheduled + [(when, cycle_dir, get_tids)], key=lambda s: s[0])
+        self._requests.put(())
+
+    @staticmethod
+    def get_hidden_dir(cycle_dir):
+        base_dir, name = os.path.split(cycle_dir)
+        return os.path.join(base_dir, '.%s.%s' % (name, os.getpid()))
+
+    # Returns (fh, mapping) of fn if prepared, otherwise None
+    def take(self, fn):
+        with self._lock:
+            prepared = self._prepared.pop(fn, None)
+        return prepared and prepared[:2]
+
+    def stop(self):
+        self._requests.put(None)
+
+    def run(self):
+        while True:
+            try:
+                request = self._requests.get(timeout=self._get_timeout())
+            except queue.Empty:
+                request = ()
+            if request is None:
+                break
+            if request:
+                self._prepare_file(*request)
+            self._prepare_scheduled()
+        self.discard()
+        for hidden_dir in self._cycles.values():
+            FilePreallocator._remove_dir(hidden_dir)
+
+    # Until the next scheduled preparation, checking the clock (which may not be real time) every second
+    def _get_timeout(self):
+        with self._lock:
+            if not self._scheduled:
+                return None
+            return min(max(self._scheduled[0][0] - self._clock(), 0), 1.0)
+
+    def _prepare_scheduled(self):
+        while True:
+            with self._lock:
+                if not self._scheduled or self._scheduled[0][0] > self._clock():
+                    return
+                when, cycle_dir, get_tids = self._scheduled.pop(0)
+                hidden_dir = FilePreallocator.get_hidden_dir(cycle_dir)
+                self._cycles[cycle_dir] = hidden_dir
+            try:
+                os.makedirs(hidden_dir, exist_ok=True)
+            except OSError:
+                continue
+            self._prepare_file(os.path.join(hidden_dir, 'index-0'), INDEX_FILE_SIZE, True)
+            for tid in get_tids():
+                self._prepare_file(os.path.join(hidden_dir, 'data-%s-0' % tid), DATA_FILE_SIZE, False)
+
+    def _prepare_file(self, fn, size, index):
+        with self._lock:
+            if fn in self._prepared:
+                return
+            self._preparing = fn
+        prepared = []
+        try:
+            if os.path.exists(fn):
+                return
+            try:
+                files = FilePreallocator._prepare(fn, size, index)
+            except OSError:
+                # e.g. the cycle has since been removed, the writer creates files as usual
+                return
+            with self._lock:
+                directory = os.path.dirname(fn)
+                if os.path.basename(directory).startswith('.') and directory not in self._cycles.values():
+                    # already adopted (or given up) by the writer
+                    prepared = [files]
+                else:
+                    self._prepared[fn] = files
+        finally:
+            with self._lock:
+                self._preparing = None
+                self._prepared_cond.notify_all()
+            FilePreallocator._close(prepared)
+
+    @staticmethod
+    def _prepare(fn, size, index):
+        fh = open_sized_file(fn, size, allocate=True)
+        if index:
+            mapping = _pychro.open_write_mmap(fh, size)
+            _pychro.populate_mmap(mapping, size)
+        else:
+            mapping = mmap.mmap(fh.fileno(), 0, prot=mmap.PROT_READ | mmap.PROT_WRITE)
+            _pychro.populate_buffer(mapping)
+        return fh, mapping, size, index
+
+    # Unmaps and closes all files prepared and not yet taken, including one being prepared
+    def discard(self):
+        with self._lock:
+            while self._preparing is not None and threading.current_thread() is not self:
+                self._prepared_cond.wait()
+            prepared, self._prepared = self._prepared, dict()
+        FilePreallocator._close(prepared.values())
+
+    @staticmethod
+    def _close(prepared):
+        for fh, mapping, size, index in prepared:
+            if index:
+                _pychro.close_mmap(mapping, size)
+            else:
+                mapping.close()
+            fh.close()
+
+    @staticmethod
+    def _remove_dir(directory):
+        try:
+            for f in os.listdir(directory):
+                os.remove(os.path.join(directory, f))
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+    # Moves the files prepared for cycle_dir into it (unless already created by another writer), discarding
+    # any others.
+    def adopt(self, cycle_dir):
+        with self._lock:
+            hidden_dir = self._cycles.pop(cycle_dir, None)
+            self._scheduled = [s for s in self._scheduled if s[1] != cycle_dir]
+            prepared, self._prepared = self._prepared, dict()
+        for fn, files in prepared.items():
+            if os.path.dirname(fn) == hidden_dir:
+                new_fn = os.path.join(cycle_dir, os.path.basename(fn))
+                # linked atomically, so it is never seen partially sized, and under the lock, so it can be taken
+                # as soon as it is seen
+                with self._lock:
+                    try:
+                        os.link(fn, new_fn)
+                        self._prepared[new_fn] = files
+                        continue
+                    except OSError:
+                        pass
+            FilePreallocator._close([files])
+        if hidden_dir:
+            FilePreallocator._remove_dir(hidden_dir)
+
+
+class ChronicleSyncer(threading.Thread):
+    # Syncs (fdatasync) the data files and then the index files a writer has written to, so that all messages
+    # it published before a sync started are durable once it completes. Runs every interval when started,
+    # otherwise sync() is called directly. Only the pages dirtied since the last sync are written.
+    #
+    # The files are opened again here, so they can be synced while the writer unmaps and closes its own.
+
+    def __init__(self, interval=DEFAULT_SYNC_INTERVAL):
+        super().__init__(name='pychro-syncer', daemon=True)
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._sync_lock = threading.RLock()
+        self._data_fds = dict()
+        self._index_fds = dict()
+        self._published = None
+        self._durable = None
+        self._error = None
+        self._stopped = threading.Event()
+
+    def add(self, fn, index):
+        fds = self._index_fds if index else self._data_fds
+        with self._lock:
+            if fn not in fds:
+                fds[fn] = os.open(fn, os.O_RDWR)
+
+    # Records the last index published by the writer, syncing it now if sync. Raises the error of a failed
+    # periodic sync, as no later message can be made durable.
+    def published(self, full_index, sync):
+        if self._error is not None:
+            raise self._error
+        self._published = full_index
+        if sync:
+            self.sync()
+
+    def get_durable_index(self):
+        if self._error is not None:
+            raise self._error
+        return self._durable
+
+    def sync(self):
+        with self._sync_lock:
+            published = self._published
+            with self._lock:
+                fds = list(self._data_fds.values()) + list(self._index_fds.values())
+            for fd in fds:
+                os.fdatasync(fd)
+            if published is not None and (self._durable is None or published > self._durable):
+                self._durable = published
+
+    # Syncs and forgets all files, e.g. those of the previous cycle
+    def clear(self):
+        with self._sync_lock:
+            self.sync()
+            with self._lock:
+                fds = list(self._data_fds.values()) + list(self._index_fds.values())
+                self._data_fds = dict()
+                self._index_fds = dict()
+            for fd in fds:
+                os.close(fd)
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.sync()
+            except OSError as e:
+                self._error = e
+                break
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.clear()
+
+
+class WriterIdLeases:
+    # Logical writer ids (used in place of OS thread ids) for the threads of a process, leased from the
+    # LEASE_FILE_NAME file of base_dir shared by all processes. Each thread keeps its id while alive, then it is
+    # reused by the next new thread. Ids are released on close(), and those of processes no longer running are
+    # taken over, so few data files are created however many threads or processes write.
+    #
+
+    def __init__(self, base_dir, num_ids):
+        self._num_ids = min(num_ids, LEASE_FILE_SIZE//8)
+        self._fh = open_sized_file(os.path.join(base_dir, LEASE_FILE_NAME), LEASE_FILE_SIZE)
+        self._mm = _pychro.open_write_mmap(self._fh, LEASE_FILE_SIZE)
+        self._view = _pychro.mmap_view(self._mm, LEASE_FILE_SIZE, True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        # id: thread, of ids leased by this process
+        self._threads = dict()
+
+    def get_id(self):
+        if self._view is None:
+            raise PychroException('Writer id leases are closed')
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None and lease[0] == os.getpid():
+            return lease[1]
+        with self._lock:
+            if self._view is None:
+                raise PychroException('Writer id leases are closed')
+            if self._pid != os.getpid():
+                # forked, the leases are the parent's
+                self._pid = os.getpid()
+                self._threads = dict()
+            thread = threading.current_thread()
+            tid = next((tid for tid, t in self._threads.items() if not t.is_alive()), None)
+            if tid is None:
+                tid = self._lease()
+            self._threads[tid] = thread
+            self._local.lease = (self._pid, tid)
+            return tid
+
+    @staticmethod
+    def _is_running(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _lease(self):
+        for tid in range(self._num_ids):
+            holder = self._view[tid]
+            if holder and (holder == self._pid or WriterIdLeases._is_running(holder)):
+                continue
+            if _pychro.try_atomic_write_mmap(self._mm, holder, self._pid, tid*8) == holder:
+                return tid
+        raise PychroException('All %s writer ids are leased' % self._num_ids)
+
+    def get_leased_ids(self):
+        return sorted(self._threads)
+
+    def close(self):
+        if self._view is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                for tid in self._threads:
+                    _pychro.try_atomic_write_mmap(self._mm, self._pid, 0, tid*8)
+            self._threads = dict()
+            _pychro.close_view(self._view)
+            self._view = None
+            self._fh.close()
+
+
+# Field encoding (write_*, fill, advance etc.) is implemented natively by pychroc.Appender,
+# writing directly into the data file memory map.
+class Appender(pychroc.Appender):
+    def __init__(self, chronicle, tid, filenum, pos, utcnow, max_msg_size=DEFAULT_MAX_MSG_SIZE):
+        self._tid = tid
+        self._utcnow = utcnow
+        self._chronicle = chronicle
+        self._filenum = filenum
+        self._pos = pos
+        self._start_pos = self._pos
+        self._limit = DATA_FILE_SIZE
+        self._max_msg_size = max_msg_size
+        self._started = 0
+        self._mm = None
+        self._staged = []
+
+    def get_bytes(self):
+        self._start()
+        return self._mm
+
+    def _start(self):
+        if not self._started:
+            if self._chronicle._clock() >= self._chronicle._rollover_deadline:
+                if self._staged:
+                    # the staged messages move to the new cycle, before this one
+                    self._rollover_staged()
+                else:
+                    self._chronicle._day_rollover(self._utcnow().date())
+                    self._pos = 4
+                    self._start_pos = self._pos
+                    self._filenum = 0
+                    self._mm = None
+            self._started = 1
+        if self._mm is None:
+            self._mm = self._chronicle._get_data_memory_map(self._filenum, self._tid)
+        return self._mm
+
+    def finish(self):
+        if self._staged:
+            # after those staged, in order
+            self.stage()
+            self.publish()
+            return
+
+        length = self._pos - self._start_pos
+        if self._chronicle._clock() >= self._chronicle._rollover_deadline:
+            # need to rewrite pos-start_pos bytes
+            bytes = self._mm[self._start_pos:self._pos]
+            if not self._chronicle._day_rollover(self._utcnow().date()):
+                raise PartialWriteLostOnRollover()
+            self._pos = length + 4
+            self._start_pos = 4
+            self._filenum = 0
+            self._mm = self._chronicle._get_data_memory_map(self._filenum, self._tid)
+            self._mm[self._start_pos:self._pos] = bytes
+
+        self._write_length()
+
+        self._chronicle._set_index(self._tid, self._filenum, self._start_pos)
+        if self._chronicle._syncer:
+            self._chronicle._published()
+
+        self._next_message()
+        self._chronicle._set_appender_pos(self._tid, self._filenum, self._pos)
+
+    def _next_message(self):
+        if self._pos + self._max_msg_size > DATA_FILE_SIZE:
+            self._pos = 0
+            self._filenum += 1
+            self._mm = None
+        self._pos += 4
+        self._start_pos = self._pos
+        self._started = 0
+
+    # Completes the message as finish(), but it is only committed to the index (and seen by readers) by
+    # publish(), together with all others staged since the last publish()
+    def stage(self):
+        if self._chronicle._clock() >= self._chronicle._rollover_deadline:
+            self._rollover_staged()
+        self._write_length()
+        self._staged += [(self._filenum << FILENUM_FROM_POS_SHIFT) | self._start_pos]
+        self._next_message()
+
+    # Commits the messages staged to consecutive index slots, returning the number committed
+    def publish(self):
+        if not self._staged:
+            return 0
+        if self._chronicle._clock() >= self._chronicle._rollover_deadline:
+            self._rollover_staged()
+        staged, self._staged = self._staged, []
+        self._chronicle._set_indexes(self._tid, staged)
+        if self._chronicle._syncer:
+            self._chronicle._published()
+        self._chronicle._set_appender_pos(self._tid, self._filenum, self._pos)
+        return len(staged)
+
+    # The last index published by the chronicle's writer known to be durable, or None
+    def get_durable_index(self):
+        return self._chronicle.get_durable_index()
+
+    def get_num_staged(self):
+        return len(self._staged)
+
+    # Stages count empty messages after those staged, sharing a single empty message in the data file, e.g. to
+    # fill index slots whose messages are unknown (as readers stop at an empty slot)
+    def stage_empty(self, count):
+        if count <= 0:
+            return
+        if self._pos != self._start_pos:
+            raise PychroException('A message is being written')
+        self.stage()
+        self._staged += [self._staged[-1]] * (count - 1)
+
+    # Moves the staged messages, and any message being written, into the new cycle
+    def _rollover_staged(self):
+        messages = []
+        for offset in self._staged:
+            mm = self._chronicle._get_data_memory_map(offset >> FILENUM_FROM_POS_SHIFT, self._tid)
+            pos = offset & POS_MASK
+            messages += [mm[pos:pos + ~struct.unpack_from('i', mm, pos-4)[0]]]
+        current = self._mm[self._start_pos:self._pos] if self._mm is not None else b''
+        if not self._chronicle._day_rollover(self._utcnow().date()):
+            raise PartialWriteLostOnRollover()
+        self._staged = []
+        self._pos = 4
+        self._start_pos = 4
+        self._filenum = 0
+        self._mm = None
+        for message in messages:
+            self.write_raw(message)
+            self._write_length()
+            self._staged += [(self._filenum << FILENUM_FROM_POS_SHIFT) | self._start_pos]
+            self._next_message()
+        if current:
+            self.write_raw(current)
+
+    # Appends the whole body of the (unread) message of reader, e.g. from another chronicle, as one message
+    def append_message_from(self, reader):
+        self.write_raw(reader.get_bytes(), reader.get_offset(), reader.get_length())
+        self.finish()
+
+    # As append_message_from() for each of readers, e.g. a batch or read_range(), staging them and publishing
+    # batch_size at a time. Returns the number appended.
+    def append_messages_from(self, readers, batch_size=1024):
+        count = 0
+        for reader in readers:
+            self.write_raw(reader.get_bytes(), reader.get_offset(), reader.get_length())
+            self.stage()
+            count += 1
+            if len(self._staged) >= batch_size:
+                self.publish()
+        self.publish()
+        return count
+
+
+class VanillaChronicleWriter(VanillaChronicleReader):
+    # preallocate starts a FilePreallocator thread, creating and pre-faulting the next data file of each
+    # appender and the next index file before they are needed. This uses up to a data file (64MB) of
+    # memory per appender and an index file (16MB) ahead, and the thread stops on close().
+    #
+    # Writers take an advisory flock of each cycle directory they write to, shared unless exclusive. An
+    # exclusive writer is the only writer of the cycle, so it takes the next index slot without compare and
+    # swap, and publishes it with an ordered store. When another writer already holds the cycle it writes as
+    # any other (until its next cycle), and other writers raise ChronicleLocked while it holds the cycle.
+    # Only pychro writers take these locks.
+    #
+    # durability is one of the DURABILITY_* policies, each message published being durable (synced to disk)
+    # after finish() or publish() with DURABILITY_BATCH, or within about sync_interval with DURABILITY_PERIODIC.
+    # get_durable_index() is the last index published by the writer known to be durable.
+    #
+    # leased_ids writes with logical writer ids leased by WriterIdLeases rather than OS thread ids, so
+    # threads and processes coming and going reuse the same data files.
+    #
+
+    def __init__(self, base_dir, polling_interval=None,
+                 max_mapped_memory=DEFAULT_MAX_MAPPED_MEMORY_PER_READER,
+                 thread_id_bits=None, utcnow=datetime.datetime.utcnow, preallocate=False,
+                 leased_ids=False, exclusive=False, durability=DURABILITY_NONE,
+                 sync_interval=DEFAULT_SYNC_INTERVAL):
+        try:
+            os.makedirs(base_dir)
+        except FileExistsError:
+            pass
+        self._preallocator = None
+        self._leases = None
+        self._durability = durability
+        self._syncer = None
+        self._exclusive_requested = exclusive
+        self._exclusive = False
+        self._exclusive_index = None
+        self._cycle_lock_fd = None
+        self._cycle_lock_dir = None
+        # serialises the threads of an exclusive writer, which take slots without compare and swap
+        self._claim_lock = threading.Lock()
+        self._positions_fh = None
+        self._positions_mm = None
+        self._positions_view = None
+        self._position_slots = dict()
+        # seconds since the epoch of utcnow, so that it is only called on rollover
+        self._clock = time.time if utcnow == datetime.datetime.utcnow else \
+            lambda: (utcnow() - EPOCH).total_seconds()
+        self._rollover_deadline = None
+        super().__init__(base_dir=base_dir, polling_interval=polling_interval,
+                         max_mapped_memory=max_mapped_memory, thread_id_bits=thread_id_bits,
+                         utcnow=utcnow)
+        if durability not in (DURABILITY_NONE, DURABILITY_PERIODIC, DURABILITY_BATCH):
+            raise ConfigError('Unsupported durability %s' % durability)
+        if leased_ids:
+            self._leases = WriterIdLeases(base_dir, self._thread_id_mask+1)
+        if durability != DURABILITY_NONE:
+            self._syncer = ChronicleSyncer(sync_interval)
+            if durability == DURABILITY_PERIODIC:
+                self._syncer.start()
+        if preallocate:
+            self._preallocator = FilePreallocator(self._clock)
+            self._preallocator.start()
+        self._positions = dict()
+        self._update_date_and_index_base(self._utcnow().date())
+        self._set_rollover_deadline()
+        todays_dir = os.path.join(self._base_dir, '%4d%02d%02d' % (self._date.year, self._date.month, self._date.day))
+        if self._cycle_dir != todays_dir:
+            self._cycle_dir = todays_dir
+            try:
+                os.makedirs(todays_dir)
+            except FileExistsError:
+                pass
+        self._lock_cycle()
+        self.set_end_index_today()
+
+    def close(self):
+        if self._preallocator:
+            self._preallocator.stop()
+            self._preallocator = None
+        super().close()
+        self._unlock_cycle()
+        if self._syncer:
+            self._syncer.stop()
+            self._syncer = None
+        if self._leases:
+            self._leases.close()
+            self._leases = None
+
+    # Also syncs the files of the cycle, keeping the preallocator, syncer, leases and cycle lock for the next.
+    # The lock is taken for the new cycle by its first write.
+    def _close_cycle(self):
+        if self._syncer:
+            self._syncer.clear()
+        self._close_positions()
+        super()._close_cycle()
+
+    # The start of the next cycle, and when preallocating, schedules the preparation of its files
+    def _set_rollover_deadline(self):
+        next_date = self._date + datetime.timedelta(days=1)
+        self._rollover_deadline = (datetime.datetime(next_date.year, next_date.month, next_date.day)
+                                   - EPOCH).total_seconds()
+        if self._preallocator:
+            next_dir = os.path.join(self._base_dir, '%4d%02d%02d' % (next_date.year, next_date.month, next_date.day))
+            self._preallocator.schedule_cycle(self._rollover_deadline - ROLLOVER_PREPARE_AHEAD, next_dir,
+                                              lambda: list(self._positions))
+
+    def _preallocate_index(self, file_num):
+        if self._preallocator:
+            self._preallocator.request(os.path.join(self._cycle_dir, 'index-%s' % file_num), INDEX_FILE_SIZE, True)
+
+    def _set_appender_pos(self, tid, filenum, pos):
+        self._positions[tid] = (filenum, pos)
+        slot = self._position_slots.get(tid)
+        if slot is None:
+            slot = self._get_position_slot(tid, True)
+            if slot < 0:
+                return
+        self._positions_view[slot*2+1] = (filenum << FILENUM_FROM_POS_SHIFT) | pos
+
+    def _open_positions(self):
+        if self._positions_view is None:
+            self._positions_fh = open_sized_file(os.path.join(self._cycle_dir, POSITIONS_FILE_NAME),
+                                                 POSITIONS_FILE_SIZE)
+            self._positions_mm = _pychro.open_write_mmap(self._positions_fh, POSITIONS_FILE_SIZE)
+            self._positions_view = _pychro.mmap_view(self._positions_mm, POSITIONS_FILE_SIZE, True)
+
+    def _close_positions(self):
+        self._position_slots = dict()
+        if self._positions_view is not None:
+            _pychro.close_view(self._positions_view)
+            self._positions_view = None
+            self._positions_mm = None
+            self._positions_fh.close()
+            self._positions_fh = None
+
+    # Returns the entry of tid in the positions file, claiming one if claim, None if it has none, or -1 if the
+    # file is full (so tid may have written without one)
+    def _get_position_slot(self, tid, claim):
+        self._open_positions()
+        entries = POSITIONS_FILE_SIZE//16
+        key = tid + 1
+        for i in range(entries):
+            slot = (tid + i) % entries
+            prev = self._positions_view[slot*2]
+            if prev == 0 and claim:
+                prev = _pychro.try_atomic_write_mmap(self._positions_mm, 0, key, slot*16) or key
+            if prev == key:
+                self._position_slots[tid] = slot
+                return slot
+            if prev == 0:
+                return None
+        return -1
+
+    # The next write position of tid today, or None if it has not written today.
+    # From the positions file if present, else by a (native) reverse scan of the index, then moving past any
+    # messages written since (by a writer which stopped before updating the positions file).
+    # The scan is only needed if tid has a data file without an entry, e.g. after the positions file was created
+    # by a writer which started after tid wrote, or tid's writer stopped before claiming an entry.
+    def _recover_appender_pos(self, tid):
+        position = None
+        slot = self._get_position_slot(tid, False)
+        if slot is None and not os.path.exists(os.path.join(self._cycle_dir, 'data-%s-0' % tid)):
+            return None
+        if slot is not None and slot >= 0 and self._positions_view[slot*2+1]:
+            val = self._positions_view[slot*2+1]
+            position = val >> FILENUM_FROM_POS_SHIFT, val & POS_MASK
+        else:
+            end = self.get_end_index_today() - self._full_index_base
+            for index_filenum in range((end - 1)//ENTRIES_PER_INDEX_FILE, -1, -1):
+                count = min(end - index_filenum*ENTRIES_PER_INDEX_FILE, ENTRIES_PER_INDEX_FILE)
+                slot = _pychro.find_last_thread_slot(self._index_views[index_filenum], count, tid,
+                                                     self._thread_id_bits)
+                if slot >= 0:
+                    val = self._index_views[index_filenum][slot] & self._index_data_offset_mask
+                    position = val >> FILENUM_FROM_POS_SHIFT, val & POS_MASK
+                    break
+        if position is None:
+            return None
+
+        filenum, pos = position
+        while True:
+            mm = self._get_data_memory_map(filenum, tid)
+            header = struct.unpack_from('i', mm, pos-4)[0]
+            if not header:
+                return filenum, pos
+            pos += ~header + 4
+            if pos + DEFAULT_MAX_MSG_SIZE > DATA_FILE_SIZE:
+                filenum += 1
+                pos = 4
+
+    # Returns whether rollover succeeded or not
+    def _day_rollover(self, new_date):
+        todays_dir = os.path.join(self._base_dir, '%4d%02d%02d'
+                                  % (new_date.year, new_date.month, new_date.day))
+        try:
+            os.makedirs(todays_dir)
+            ret = True
+        except FileExistsError:
+            # todo: wait here for rollover initiated by another to complete
+            ret = False
+        # wake readers waiting on the previous day so they move to the new one
+        if self._control_mm:
+            _pychro.notify_mmap(self._control_mm, CONTROL_NOTIFY_SLOT*8)
+        self._close_cycle()
+        if self._preallocator:
+            self._preallocator.adopt(todays_dir)
+        self._positions = dict()
+        self._cycle_dir = todays_dir
+        self._lock_cycle()
+        self._open_next_index()
+        self._update_date_and_index_base(new_date)
+        self._set_rollover_deadline()
+        return ret
+
+    def _set_index(self, tid, data_filenum, offset):
+        assert self._clock() < self._rollover_deadline
+
+        index_val = (tid << (64-self._thread_id_bits)) | (data_filenum << FILENUM_FROM_POS_SHIFT) | offset
+
+        if self._cycle_lock_dir != self._cycle_dir:
+            self._relock_cycle()
+
+        if self._exclusive:
+            with self._claim_lock:
+                if self._index != self._exclusive_index:
+                    # the first write, or moved since (e.g. by set_index()) so the slot may be taken
+                    self._claim_index_slot(index_val)
+                    self._exclusive_index = self._index
+                    return
+                # the slot following the last this writer published, which no other writer can take
+                index = self._index + 1
+                index_filenum, slot = divmod(index, ENTRIES_PER_INDEX_FILE)
+                while len(self._index_mm) <= index_filenum:
+                    self._open_next_index()
+                if self._control_mm or self._open_control():
+                    _pychro.publish_index_slot(self._index_mm[index_filenum], slot*8, index_val, self._control_mm,
+                                               CONTROL_HWM_SLOT*8, index+1, CONTROL_NOTIFY_SLOT*8)
+                self._index = self._exclusive_index = index
+            return
+
+        self._claim_index_slot(index_val)
+
+    def _claim_index_slot(self, index_val):
+        if self._index == 0:
+            self.set_end_index_today()
+        if not self._control_mm:
+            self._open_control()
+
+        # slots taken by other writers are skipped natively, a call per index file, which also raises the
+        # high-water mark and wakes any readers waiting with WAIT_NOTIFY
+        index_filenum, slot = divmod(self._index, ENTRIES_PER_INDEX_FILE)
+        while True:
+            while len(self._index_mm) <= index_filenum:
+                self._open_next_index()
+            slot = _pychro.claim_index_slot(self._index_mm[index_filenum], slot, ENTRIES_PER_INDEX_FILE, index_val,
+                                            self._control_mm, CONTROL_HWM_SLOT*8,
+                                            index_filenum*ENTRIES_PER_INDEX_FILE, CONTROL_NOTIFY_SLOT*8)
+            if slot >= 0:
+                break
+            index_filenum += 1
+            slot = 0
+        self._index = index_filenum*ENTRIES_PER_INDEX_FILE + slot
+
+    # As _set_index for each of the data offsets (filenum << FILENUM_FROM_POS_SHIFT | pos) in turn, claiming
+    # consecutive slots unless other writers take some in between
+    def _set_indexes(self, tid, offsets):
+        assert self._clock() < self._rollover_deadline
+
+        tid_val = tid << (64-self._thread_id_bits)
+        vals = memoryview(array.array('Q', [tid_val | offset for offset in offsets]))
+
+        if self._cycle_lock_dir != self._cycle_dir:
+            self._relock_cycle()
+
+        if self._exclusive:
+            with self._claim_lock:
+                self._claim_index_slots(vals)
+                self._exclusive_index = self._index
+        else:
+            self._claim_index_slots(vals)
+
+    def _claim_index_slots(self, vals):
+        if self._index == 0:
+            self.set_end_index_today()
+        if not self._control_mm:
+            self._open_control()
+        index_filenum, slot = divmod(self._index, ENTRIES_PER_INDEX_FILE)
+        while True:
+            while len(self._index_mm) <= index_filenum:
+                self._open_next_index()
+            claimed, slot = _pychro.claim_index_slots(self._index_mm[index_filenum], slot, ENTRIES_PER_INDEX_FILE,
+                                                      vals, self._control_mm, CONTROL_HWM_SLOT*8,
+                                                      index_filenum*ENTRIES_PER_INDEX_FILE, CONTROL_NOTIFY_SLOT*8)
+            vals = vals[claimed:]
+            if not vals:
+                break
+            index_filenum += 1
+            slot = 0
+        self._index = index_filenum*ENTRIES_PER_INDEX_FILE + slot - 1
+
+    # Takes the lock of the current cycle, exclusively if requested and no other writer holds it
+    def _lock_cycle(self):
+        self._unlock_cycle()
+        self._exclusive_index = None
+        fd = os.open(self._cycle_dir, os.O_RDONLY)
+        try:
+            if self._exclusive_requested:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    self._exclusive = True
+                    _exclusive_writers.add(self)
+                except BlockingIOError:
+                    pass
+            if not self._exclusive:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise ChronicleLocked('%s is held by an exclusive writer' % self._cycle_dir)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._cycle_lock_fd = fd
+        self._cycle_lock_dir = self._cycle_dir
+
+    # Once another cycle is written to, e.g. after set_index(), by any of the threads of the writer
+    def _relock_cycle(self):
+        with self._claim_lock:
+            if self._cycle_lock_dir != self._cycle_dir:
+                self._lock_cycle()
+
+    def _unlock_cycle(self):
+        if self._cycle_lock_fd is not None:
+            os.close(self._cycle_lock_fd)
+            self._cycle_lock_fd = None
+        self._cycle_lock_dir = None
+        self._exclusive = False
+        _exclusive_writers.discard(self)
+
+    # The lock is still held by the parent, so the next write takes it again (or raises ChronicleLocked)
+    def _lose_cycle_lock(self):
+        os.close(self._cycle_lock_fd)
+        self._cycle_lock_fd = None
+        self._cycle_lock_dir = None
+        self._exclusive = False
+
+    def is_exclusive(self):
+        return self._exclusive
+
+    def get_durable_index(self):
+        return self._syncer.get_durable_index() if self._syncer else None
+
+    def _published(self):
+        self._syncer.published(self.get_index(), self._durability == DURABILITY_BATCH)
+
+    # Creates the control file if required, atomically so that it is never seen partially sized
+    def _open_control(self):
+        if self._control_view is not None:
+            return True
+        self._control_fh = open_sized_file(os.path.join(self._cycle_dir, CONTROL_FILE_NAME), CONTROL_FILE_SIZE)
+        self._control_mm = _pychro.open_write_mmap(self._control_fh, CONTROL_FILE_SIZE)
+        self._control_writable = True
+        self._control_view = _pychro.mmap_view(self._control_mm, CONTROL_FILE_SIZE)
+        return True
+
+    def _get_tid(self):
+        if self._leases:
+            return self._leases.get_id()
+        return _pychro.get_thread_id() & self._thread_id_mask
+        # thread_id_bits not large enough? have to live with this..
+        # assert get_thread_id() == tid
+
+    def _open_next_index(self):
+        file_num = len(self._index_fh)
+        fn = os.path.join(self._cycle_dir, 'index-%s' % file_num)
+        prepared = self._preallocator and self._preallocator.take(fn)
+        if prepared:
+            fh, mh = prepared
+        else:
+            fh = open(fn, 'a+b')
+            fh.truncate(INDEX_FILE_SIZE)
+            fh.flush()
+            mh = _pychro.open_write_mmap(fh, INDEX_FILE_SIZE)
+        if self._syncer:
+            self._syncer.add(fn, True)
+        self._index_fh += [fh]
+        self._index_mm += [mh]
+        self._index_views += [_pychro.mmap_view(self._index_mm[-1], INDEX_FILE_SIZE)]
+        self._preallocate_index(file_num+1)
+
+    def _open_data_file(self, filenum, thread):
+        fn = os.path.join(self._cycle_dir, 'data-%s-%s' % (thread, filenum))
+        fh = open(fn, 'a+b')
+        fh.truncate(DATA_FILE_SIZE)
+        return fh
+
+    def _open_data_memory_map(self, filenum, thread):
+        if self._preallocator:
+            self._preallocator.request(os.path.join(self._cycle_dir, 'data-%s-%s' % (thread, filenum+1)),
+                                       DATA_FILE_SIZE, False)
+            prepared = self._preallocator.take(os.path.join(self._cycle_dir, 'data-%s-%s' % (thread, filenum)))
+            if prepared:
+                self._data_fhs[(filenum, thread)] = prepared[0]
+                if self._syncer:
+                    # not its name, which may be of the hidden directory it was prepared in
+                    self._syncer.add(os.path.join(self._cycle_dir, 'data-%s-%s' % (thread, filenum)), False)
+                return prepared[1]
+
+        fh = self._data_fhs.get((filenum, thread))
+        if not fh:
+            fh = self._open_data_file(filenum, thread)
+            self._data_fhs[(filenum, thread)] = fh
+        if self._syncer:
+            self._syncer.add(fh.name, False)
+
+        while True:
+            try:
+                return mmap.mmap(fh.fileno(), 0, prot=mmap.PROT_READ | mmap.PROT_WRITE)
+            except ValueError:
+                pass
+                # Alternative to this ugliness appears to be os.fsync(), but is much slower.
+                # A thread lazily creating new data and index files would be a good optimisation.
+
+    def __str__(self):
+        return '<VanillaChronicleWriter dir:%s idx:%s tid:%s>' % (self._cycle_dir, self._index, self._get_tid())
+
+    def get_appender(self):
+        tid = self._get_tid()
+
+        filenum_pos = self._positions.get(tid) or self._recover_appender_pos(tid)
+        if filenum_pos:
+            filenum, pos = filenum_pos
+        else:
+            filenum = 0
+            pos = 4
+        return Appender(self, tid, filenum, pos, self._utcnow)
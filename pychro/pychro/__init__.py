@@ -15,7 +15,7 @@
 #
 
 
-__all__ = ['vanilla_reader', 'vanilla_writer', '_pychro', 'pychroc']
+__all__ = ['vanilla_reader', 'vanilla_writer', 'schema', 'async_reader', 'server', 'replicator', 'queued_writer', '_pychro', 'pychroc']
 
 
 from .common import *
\ No newline at end of file
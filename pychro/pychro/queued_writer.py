@@ -0,0 +1,152 @@
+#
+#  Copyright 2015 Jon Turner
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from .common import *
+
+import collections
+import threading
+
+
+class QueuedChronicleWriter:
+    # Many threads of a process writing to the chronicle at base_dir through one appender thread, so there is
+    # a single set of data files and no contention on the index between them.
+    #
+    # put() copies an encoded message (any bytes-like object, e.g. a bytearray encoded with
+    # MessageSchema or struct) onto a queue, which is never locked by producers. The appender thread stages
+    # up to batch_size messages at a time and publishes them together. Producers wait only when max_pending
+    # messages are queued.
+    #
+    # flush() waits until all messages put (by any thread) are committed. Remaining arguments are passed to
+    # the VanillaChronicleWriter.
+    #
+
+    def __init__(self, base_dir, batch_size=256, max_pending=64*1024, **kwargs):
+        self._chron = VanillaChronicleWriter(base_dir, **kwargs)
+        self._batch_size = batch_size
+        self._max_pending = max_pending
+        # deque append and popleft are atomic, so producers and the appender thread need no lock
+        self._queue = collections.deque()
+        self._idle = False
+        self._wakeup = threading.Event()
+        self._space = threading.Event()
+        self._exception = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='pychro-appender:%s' % base_dir, daemon=True)
+        self._thread.start()
+
+    def __str__(self):
+        return '<QueuedChronicleWriter %s pending:%s>' % (self._chron, len(self._queue))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_chronicle(self):
+        return self._chron
+
+    def get_num_pending(self):
+        return len(self._queue)
+
+    def put(self, message):
+        if self._exception is not None:
+            raise self._exception
+        if len(self._queue) >= self._max_pending:
+            self._wait_for_space()
+        self._queue.append(bytes(message))
+        if self._idle:
+            self._wakeup.set()
+
+    # As put() for each of messages
+    def put_all(self, messages):
+        if self._exception is not None:
+            raise self._exception
+        if len(self._queue) >= self._max_pending:
+            self._wait_for_space()
+        self._queue.extend([bytes(message) for message in messages])
+        if self._idle:
+            self._wakeup.set()
+
+    def _wait_for_space(self):
+        while len(self._queue) >= self._max_pending and self._exception is None:
+            self._space.clear()
+            if len(self._queue) >= self._max_pending:
+                self._space.wait(NOTIFY_MAX_WAIT)
+
+    def flush(self, timeout=None):
+        if self._exception is not None:
+            raise self._exception
+        done = threading.Event()
+        self._queue.append(done)
+        self._wakeup.set()
+        # unless the appender thread has failed (and drained the queue) since
+        if self._exception is None and not done.wait(timeout):
+            raise TimeoutError('Messages not committed within %s seconds' % timeout)
+        if self._exception is not None:
+            raise self._exception
+
+    # Commits all messages put, then stops the appender thread and closes the chronicle, raising the error of
+    # the appender thread if it failed
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.append(None)
+            self._wakeup.set()
+            self._thread.join()
+        exception, self._exception = self._exception, PychroException('QueuedChronicleWriter closed')
+        self._chron.close()
+        if exception is not None:
+            raise exception
+
+    def _run(self):
+        queue = self._queue
+        try:
+            appender = self._chron.get_appender()
+            while True:
+                if not queue:
+                    # a producer seeing idle after its append sets wakeup, otherwise the queue is not empty here
+                    self._wakeup.clear()
+                    self._idle = True
+                    if not queue:
+                        self._wakeup.wait()
+                    self._idle = False
+                for _ in range(self._batch_size):
+                    if not queue:
+                        break
+                    message = queue.popleft()
+                    if message.__class__ is bytes:
+                        appender.write_raw(message)
+                        appender.stage()
+                        continue
+                    appender.publish()
+                    if message is None:
+                        return
+                    message.set()
+                appender.publish()
+                if not self._space.is_set():
+                    self._space.set()
+        except BaseException as e:
+            # raised by the next put(), flush() or close()
+            self._exception = e
+            self._space.set()
+            # the messages queued are not committed, so wake those waiting in flush()
+            while queue:
+                message = queue.popleft()
+                if message is not None and message.__class__ is not bytes:
+                    message.set()
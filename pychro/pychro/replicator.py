@@ -0,0 +1,152 @@
+#
+#  Copyright 2015 Jon Turner
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from .common import *
+
+import datetime
+
+
+class ChronicleReplicator:
+    # Replicates the remote chronicle at host:port into the local chronicle at base_dir, over a single
+    # ResilientRemoteChronicleReader subscription, so that local readers can use VanillaChronicleReader.
+    #
+    # Each message is written at the same index (and in the same cycle) as upstream, its body copied
+    # as a whole, and those received together are published together. A new local chronicle starts at
+    # the first message replicated, so local readers of it should start from that index (or its end).
+    # Index slots of messages missed upstream (see the reader's get_gaps()), including those at the start
+    # of a later cycle, are filled with empty messages, as local readers would otherwise stop at them.
+    # These have get_length() == 0, so check it before decoding. A gap of more than max_fill messages
+    # raises PychroException. A local chronicle which already has messages is resumed from its end,
+    # otherwise replication starts from where (as RemoteChronicleReader).
+    #
+    # run() replicates until shutdown(), which may be called from any thread. Remaining arguments are
+    # passed to the ResilientRemoteChronicleReader, which is zero_copy by default as each message is
+    # written before the next is received.
+    #
+
+    def __init__(self, host, port, base_dir, where='start', batch_size=1024, thread_id_bits=None, max_fill=65536,
+                 **kwargs):
+        self._batch_size = batch_size
+        self._max_fill = max_fill
+        self._running = False
+        self._date = None
+        self._idx = None
+        # the index of the first message staged, and following the last
+        self._first_index = None
+        self._next_index = None
+        with VanillaChronicleReader(base_dir, thread_id_bits=thread_id_bits) as local:
+            try:
+                local.set_end()
+                if local.get_index() > VanillaChronicleReader.to_full_index(local.get_date(), 0):
+                    self._idx = local.get_index() - 1
+                    self._date = local.get_date()
+                    where = self._idx + 1
+            except NoData:
+                pass
+        self._base_dir = base_dir
+        self._thread_id_bits = thread_id_bits
+        # created with the first message, so that no cycle is created before it is known
+        self._writer = None
+        self._appender = None
+        kwargs.setdefault('zero_copy', True)
+        self._reader = ResilientRemoteChronicleReader(host, port, where, **kwargs)
+
+    def __str__(self):
+        return '<ChronicleReplicator %s -> %s idx:%s>' % (self._reader, self._writer, self._idx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # The writer's clock follows the cycle of the message being replicated
+    def _utcnow(self):
+        return datetime.datetime(self._date.year, self._date.month, self._date.day)
+
+    # Index of the last message replicated
+    def get_index(self):
+        return self._idx
+
+    def get_reader(self):
+        return self._reader
+
+    def get_writer(self):
+        return self._writer
+
+    # Replicates the messages received (up to batch_size), waiting for at least one, returning the number
+    # replicated
+    def replicate(self):
+        self._stage(self._reader.next_reader())
+        count = min(self._batch_size, self._reader.get_num_received() + 1)
+        for _ in range(count - 1):
+            self._stage(self._reader.next_reader())
+        self._publish()
+        return count
+
+    def _stage(self, reader):
+        index = self._reader.get_index()
+        if index != self._next_index:
+            self._publish()
+            if self._idx is not None and index <= self._idx:
+                # already replicated
+                return
+            date, day_index = VanillaChronicleReader.from_full_index(index)
+            if self._idx is None:
+                first_index = index
+            elif date == self._date:
+                first_index = self._idx + 1
+            else:
+                first_index = index - day_index
+            if index - first_index > self._max_fill:
+                raise PychroException('Gap of %d messages before index %d exceeds max_fill' %
+                                      (index - first_index, index))
+            self._date = date
+            if self._writer is None:
+                self._writer = VanillaChronicleWriter(self._base_dir, thread_id_bits=self._thread_id_bits,
+                                                      utcnow=self._utcnow)
+                self._appender = self._writer.get_appender()
+            self._first_index = first_index
+            self._appender.stage_empty(index - first_index)
+        self._appender.write_raw(reader.get_bytes(), reader.get_offset(), reader.get_length())
+        self._appender.stage()
+        self._next_index = index + 1
+
+    def _publish(self):
+        if self._appender is None or not self._appender.get_num_staged():
+            return
+        self._writer.set_index(self._first_index)
+        self._appender.publish()
+        self._idx = self._next_index - 1
+        self._first_index = self._next_index
+
+    def run(self):
+        self._running = True
+        try:
+            while self._running:
+                self.replicate()
+        except ConnectionAbortedError:
+            if self._running:
+                raise
+
+    def shutdown(self):
+        self._running = False
+        self._reader.close()
+
+    def close(self):
+        self._reader.close()
+        if self._writer:
+            self._writer.close()
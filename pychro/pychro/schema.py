@@ -0,0 +1,157 @@
+#
+#  Copyright 2015 Jon Turner
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from .common import *
+
+import collections
+import struct
+
+
+# struct formats (standard sizes, no padding) for the fixed width field types
+FIXED_WIDTH_FORMATS = {
+    'int': 'i',
+    'long': 'q',
+    'double': 'd',
+    'float': 'f',
+    'short': 'h',
+    'byte': 'B',
+    'boolean': '?',
+}
+
+
+class MessageSchema:
+    # fields is the ordered sequence of field types, each one of the FIXED_WIDTH_FORMATS keys, 'stopbit',
+    # 'string' or ('fixed_string', size).
+    #
+    # decode() returns a tuple, unless names are provided when a namedtuple (available as .type) is returned,
+    # or factory is provided in which case it is called with the field values as arguments (e.g. a class
+    # with __slots__).
+    #
+    # Consecutive fixed width fields are encoded/decoded with a single precompiled struct.Struct.
+    #
+
+    def __init__(self, fields, names=None, factory=None):
+        self._fields = [MessageSchema._parse_field(field) for field in fields]
+        self._num_fields = len(self._fields)
+        self._names = list(names) if names is not None else ['f%s' % i for i in range(self._num_fields)]
+        self.type = None
+        if names is not None:
+            if len(names) != self._num_fields:
+                raise InvalidArgumentError('Expected %s field names, got %s' % (self._num_fields, len(names)))
+            self.type = collections.namedtuple('Message', names)
+        if factory is not None:
+            self._make = lambda values: factory(*values)
+        else:
+            self._make = self.type._make if self.type else tuple
+        self._steps = MessageSchema._compile(self._fields)
+        self._struct = self._steps[0][1] if len(self._steps) == 1 and self._steps[0][0] == 'struct' else None
+
+    def __str__(self):
+        return '<MessageSchema fields:%s>' % self._fields
+
+    @staticmethod
+    def _parse_field(field):
+        if isinstance(field, str):
+            if field in FIXED_WIDTH_FORMATS or field in ('stopbit', 'string'):
+                return field, None
+        elif isinstance(field, (tuple, list)) and len(field) == 2 and field[0] == 'fixed_string' and \
+                isinstance(field[1], int):
+            return field[0], field[1]
+        raise InvalidArgumentError('Unsupported field type %s' % (field,))
+
+    @staticmethod
+    def _compile(fields):
+        steps = []
+        run = ''
+        for field_type, size in fields:
+            if field_type in FIXED_WIDTH_FORMATS:
+                run += FIXED_WIDTH_FORMATS[field_type]
+                continue
+            if run:
+                steps += [('struct', struct.Struct('=' + run), len(run))]
+                run = ''
+            steps += [(field_type, size, 1)]
+        if run:
+            steps += [('struct', struct.Struct('=' + run), len(run))]
+        return steps
+
+    def get_num_fields(self):
+        return self._num_fields
+
+    def get_names(self):
+        return self._names
+
+    def get_field_types(self):
+        return [field_type for field_type, _ in self._fields]
+
+    def is_fixed_width(self):
+        return self._struct is not None
+
+    # numpy dtype of a packed record of the (fixed width only) fields
+    def get_dtype(self):
+        import numpy
+        if not self.is_fixed_width():
+            raise InvalidArgumentError('Only fixed width fields can be represented as a numpy dtype')
+        return numpy.dtype({'names': self._names,
+                            'formats': ['=' + FIXED_WIDTH_FORMATS[field_type] for field_type, _ in self._fields]})
+
+    def decode(self, reader):
+        if self._struct:
+            offset = reader.get_offset()
+            values = self._struct.unpack_from(reader.get_bytes(), offset)
+            reader.set_offset(offset + self._struct.size)
+            return self._make(values)
+
+        values = []
+        for step, arg, _ in self._steps:
+            if step == 'struct':
+                offset = reader.get_offset()
+                values += arg.unpack_from(reader.get_bytes(), offset)
+                reader.set_offset(offset + arg.size)
+            elif step == 'string':
+                values.append(reader.read_string())
+            elif step == 'stopbit':
+                values.append(reader.read_stopbit())
+            else:
+                values.append(reader.read_fixed_string(arg))
+        return self._make(values)
+
+    def encode(self, appender, *values):
+        if len(values) != self._num_fields:
+            raise InvalidArgumentError('Expected %s fields, got %s' % (self._num_fields, len(values)))
+        # relative to the start of the message, which starting it may move (e.g. day rollover)
+        written = appender.bytes_written()
+        i = 0
+        try:
+            for step, arg, count in self._steps:
+                if step == 'struct':
+                    appender.write_raw(arg.pack(*values[i:i+count]))
+                elif step == 'string':
+                    appender.write_string(values[i])
+                elif step == 'stopbit':
+                    appender.write_stopbit(values[i])
+                else:
+                    appender.write_fixed_string(values[i], arg)
+                i += count
+        except Exception:
+            # discard the fields of this message written, so the appender is left as before
+            appender._pos = appender._start_pos + written
+            raise
+
+    # encode and commit as one message
+    def append(self, appender, *values):
+        self.encode(appender, *values)
+        appender.finish()
@@ -35,12 +35,14 @@ class VanillaChronicleReader:
     #
     # max mapped memory only relevant on windows due to the way memory mapped files are handled
     #
+    # wait_strategy (WAIT_SLEEP, WAIT_NOTIFY or WAIT_SPIN) determines how to wait for new messages when polling
+    #
     # close() resets to chronicle, releasing all resources. Reading will begin again from the start.
     #
 
     def __init__(self, base_dir, polling_interval=None, date=None, full_index=None,
                  max_mapped_memory=DEFAULT_MAX_MAPPED_MEMORY_PER_READER,
-                 thread_id_bits=None, utcnow=datetime.datetime.utcnow):
+                 thread_id_bits=None, utcnow=datetime.datetime.utcnow, wait_strategy=WAIT_SLEEP, spin_count=0):
         self._index_file_size = INDEX_FILE_SIZE
         self._utcnow = utcnow
         self._thread_id_bits = thread_id_bits
@@ -57,6 +59,8 @@ class VanillaChronicleReader:
         if self._max_maps is not None and self._max_maps < 1:
             raise ConfigError('max_mapped_memory must be >= 64MB')
         self._polling_interval = polling_interval
+        self._wait_strategy = wait_strategy
+        self._spin_count = spin_count
         self._base_dir = base_dir
 
         self._max_index = 0
@@ -66,8 +70,15 @@ class VanillaChronicleReader:
         self._full_index_base = None
         self._index_fh = []
         self._index_mm = []
+        self._index_views = []
+        self._control_fh = None
+        self._control_mm = None
+        self._control_view = None
+        self._control_writable = False
         self._data_fhs = dict()
         self._data_mms = collections.OrderedDict()
+        if wait_strategy not in (WAIT_SLEEP, WAIT_NOTIFY, WAIT_SPIN):
+            raise ConfigError('Unknown wait_strategy %s' % wait_strategy)
         index = None
 
         if full_index:
@@ -119,7 +130,7 @@ class VanillaChronicleReader:
         return date, index
 
     def _update_cycle_dir(self, fp):
-        self.close()
+        self._close_cycle()
         self._cycle_dir = fp
         dstr = os.path.split(self._cycle_dir)[1]
         self._update_date_and_index_base(datetime.date(int(dstr[:4]), int(dstr[4:6]), int(dstr[6:8])))
@@ -137,6 +148,51 @@ class VanillaChronicleReader:
         except FileNotFoundError:
             raise EndOfIndexfile
         self._index_mm += [_pychro.open_read_mmap(self._index_fh[-1], INDEX_FILE_SIZE)]
+        self._index_views += [_pychro.mmap_view(self._index_mm[-1], INDEX_FILE_SIZE)]
+
+    # Maps the control file of the current cycle if present, returning whether it is
+    def _open_control(self):
+        if self._control_view is not None:
+            return True
+        if not self._cycle_dir:
+            return False
+        fn = os.path.join(self._cycle_dir, CONTROL_FILE_NAME)
+        try:
+            # writable if possible, to register as a waiter for notifications
+            try:
+                fh = open(fn, 'r+b')
+                self._control_writable = True
+            except PermissionError:
+                fh = open(fn, 'rb')
+                self._control_writable = False
+        except FileNotFoundError:
+            return False
+        # never map beyond the end of a file which is not fully created
+        if os.fstat(fh.fileno()).st_size < CONTROL_FILE_SIZE:
+            fh.close()
+            return False
+        self._control_fh = fh
+        if self._control_writable:
+            self._control_mm = _pychro.open_write_mmap(fh, CONTROL_FILE_SIZE)
+        else:
+            self._control_mm = _pychro.open_read_mmap(fh, CONTROL_FILE_SIZE)
+        self._control_view = _pychro.mmap_view(self._control_mm, CONTROL_FILE_SIZE, self._control_writable)
+        return True
+
+    def _close_control(self):
+        if self._control_view is not None:
+            _pychro.close_view(self._control_view)
+            self._control_view = None
+        self._control_mm = None
+        if self._control_fh:
+            self._control_fh.close()
+            self._control_fh = None
+
+    # Advisory, so may be 0 or behind the actual end (e.g. after a crash of a writer), but never ahead of it
+    def _get_high_water_mark(self):
+        if not self._open_control():
+            return 0
+        return self._control_view[CONTROL_HWM_SLOT]
 
     def _open_data_file(self, filenum, thread):
         if self._cycle_dir is None:
@@ -183,19 +239,35 @@ class VanillaChronicleReader:
                 return True
         return False
 
-    def _get_index_value(self, index_offset):
-        index_offset *= 8
-        index_filenum = index_offset >> FILENUM_FROM_INDEX_SHIFT
-        index_offset &= INDEX_OFFSET_MASK
-        while index_filenum >= len(self._index_mm):
+    def _get_index_value(self, index):
+        index_filenum, slot = divmod(index, ENTRIES_PER_INDEX_FILE)
+        while index_filenum >= len(self._index_views):
             try:
                 self._open_next_index()
             except EndOfIndexfile:
                 return 0
-        return _pychro.read_mmap(self._index_mm[index_filenum], index_offset)
-
+        return self._index_views[index_filenum][slot]
+
+    # Returns a memoryview of the 8 byte slots of today's index file index_filenum, opening it if required.
+    # The view is released by close(), while the file stays mapped for any slices (or exports) of it.
+    def get_index_view(self, index_filenum):
+        while index_filenum >= len(self._index_views):
+            self._open_next_index()
+        return self._index_views[index_filenum]
+
+    # Decodes (numpy uint64 arrays of) index slot values into thread, filenum and pos arrays
+    def decode_index_slots(self, slots):
+        import numpy
+        offsets = slots & numpy.uint64(self._index_data_offset_mask)
+        threads = slots >> numpy.uint64(self._index_data_offset_bits)
+        filenums = offsets >> numpy.uint64(FILENUM_FROM_POS_SHIFT)
+        positions = offsets & numpy.uint64(POS_MASK)
+        return threads, filenums, positions
+
+    # Least recently used maps are closed beyond max_mapped_memory
     def _get_data_memory_map(self, filenum, thread):
         if (filenum, thread) in self._data_mms:
+            self._data_mms.move_to_end((filenum, thread))
             return self._data_mms[(filenum, thread)]
 
         fm = self._open_data_memory_map(filenum, thread)
@@ -213,16 +285,24 @@ class VanillaChronicleReader:
 
     def _prev_position_today(self):
         while self._index > 0:
-            self._index -= 1
-
-            val = self._get_index_value(self._index)
-            pos = val & self._index_data_offset_mask
-
-            if pos:
-                filenum = (pos >> FILENUM_FROM_POS_SHIFT)
-                pos = pos & POS_MASK
-                thread = (val & self._thread_id_idx_mask) >> self._index_data_offset_bits
-                return filenum, pos, thread
+            index_filenum, slot = divmod(self._index - 1, ENTRIES_PER_INDEX_FILE)
+            self._get_index_value(self._index - 1)
+            if index_filenum >= len(self._index_views):
+                # index file not (yet) present
+                self._index = index_filenum*ENTRIES_PER_INDEX_FILE
+                continue
+            view = self._index_views[index_filenum]
+            while slot >= 0:
+                val = view[slot]
+                pos = val & self._index_data_offset_mask
+                if pos:
+                    self._index = index_filenum*ENTRIES_PER_INDEX_FILE + slot
+                    filenum = (pos >> FILENUM_FROM_POS_SHIFT)
+                    pos = pos & POS_MASK
+                    thread = (val & self._thread_id_idx_mask) >> self._index_data_offset_bits
+                    return filenum, pos, thread
+                slot -= 1
+            self._index = index_filenum*ENTRIES_PER_INDEX_FILE
         raise NoData
 
     def _next_position(self):
@@ -235,8 +315,7 @@ class VanillaChronicleReader:
                     continue
                 if self._polling_interval is None:
                     raise NoData
-                if self._polling_interval != 0:
-                    time.sleep(self._polling_interval)
+                self._wait_for_data()
                 continue
             break
 
@@ -248,7 +327,48 @@ class VanillaChronicleReader:
 
         return filenum, pos, thread
 
+    def _wait_for_data(self):
+        if self._wait_strategy == WAIT_NOTIFY and self._open_control() and self._control_writable:
+            # read the sequence before checking the index again, so no notification is missed
+            seq = self._control_view[CONTROL_NOTIFY_SLOT] & 0xffffffff
+            if not self._get_index_value(self._index):
+                _pychro.wait_notify_mmap(self._control_view, CONTROL_NOTIFY_SLOT*8, seq,
+                                         self._polling_interval or NOTIFY_MAX_WAIT, self._spin_count)
+        elif self._wait_strategy == WAIT_SPIN and self._index_file_exists(self._index//ENTRIES_PER_INDEX_FILE):
+            index_filenum, slot = divmod(self._index, ENTRIES_PER_INDEX_FILE)
+            self._get_index_value(self._index)
+            _pychro.wait_mmap(self._index_views[index_filenum], slot*8, self._index_data_offset_mask,
+                              self._polling_interval or NOTIFY_MAX_WAIT, self._spin_count, SPIN_YIELDS)
+        elif self._polling_interval != 0:
+            time.sleep(self._polling_interval)
+
+    # As _next_position() for the first, then drains up to max_positions-1 further
+    # consecutive index entries (of the same day) in a single native call per index file.
+    def _next_positions(self, max_positions):
+        positions = [self._next_position()]
+        while len(positions) < max_positions:
+            index_offset = self._index*8
+            index_filenum = index_offset >> FILENUM_FROM_INDEX_SHIFT
+            index_offset &= INDEX_OFFSET_MASK
+            if index_filenum >= len(self._index_mm):
+                try:
+                    self._open_next_index()
+                except EndOfIndexfile:
+                    break
+            count = min(max_positions - len(positions), (INDEX_FILE_SIZE - index_offset)//8)
+            batch = _pychro.read_index_range(self._index_mm[index_filenum], index_offset, count,
+                                             self._thread_id_bits)
+            self._index += len(batch)
+            positions += batch
+            if len(batch) < count:
+                break
+        return positions
+
     def close(self):
+        self._close_cycle()
+
+    # Releases the files of the current cycle, as on moving to another
+    def _close_cycle(self):
         while True:
             try:
                 self._data_mms.popitem()[1].close()
@@ -263,11 +383,14 @@ class VanillaChronicleReader:
             except KeyError:
                 break
         
+        self._close_control()
+
+        # each unmapped once any slices of its view (e.g. from get_index_view()) are released
         try:
-            [_pychro.close_mmap(mm, self._index_file_size) for mm in self._index_mm if mm and _pychro and _pychro.close_mmap]
+            [_pychro.close_view(view) for view in self._index_views if _pychro and _pychro.close_view]
         except TypeError:
             pass
-
+        self._index_views = []
         self._index_mm = []
 
         [fh.close() for fh in self._index_fh if fh]
@@ -325,28 +448,159 @@ class VanillaChronicleReader:
         if not self._get_index_value(low_idx):
             return low_idx + self._full_index_base
 
-        # find the maximum possible
-        high_idx = ENTRIES_PER_INDEX_FILE-1
-        while self._get_index_value(high_idx):
-            high_idx += ENTRIES_PER_INDEX_FILE
-
-        while True:
-            current_idx = (low_idx + high_idx) // 2
-            if self._get_index_value(current_idx):
-                low_idx = current_idx
-                if high_idx == low_idx + 1:
-                    break
+        # validate the high-water mark, then a short scan forward from it usually finds the end
+        hwm = self._get_high_water_mark()
+        if hwm > low_idx and self._get_index_value(hwm-1):
+            low_idx = hwm-1
+        for idx in range(low_idx+1, low_idx+1+HWM_SCAN_LIMIT):
+            if not self._get_index_value(idx):
+                return idx + self._full_index_base
+            low_idx = idx
+
+        # the end is within the last index file in use, found without opening any beyond it
+        index_filenum = low_idx // ENTRIES_PER_INDEX_FILE
+        while self._index_file_exists(index_filenum+1) and \
+                self._get_index_value((index_filenum+1)*ENTRIES_PER_INDEX_FILE):
+            index_filenum += 1
+
+        view = self._index_views[index_filenum]
+        low_slot = max(low_idx - index_filenum*ENTRIES_PER_INDEX_FILE, 0)
+        high_slot = ENTRIES_PER_INDEX_FILE
+        while high_slot - low_slot > 1:
+            slot = (low_slot + high_slot) // 2
+            if view[slot]:
+                low_slot = slot
             else:
-                high_idx = current_idx
-                if low_idx == high_idx - 1:
-                    break
-        return high_idx + self._full_index_base
+                high_slot = slot
+        return index_filenum*ENTRIES_PER_INDEX_FILE + high_slot + self._full_index_base
+
+    def _index_file_exists(self, index_filenum):
+        return index_filenum < len(self._index_views) or \
+            os.path.exists(os.path.join(self._cycle_dir, 'index-%s' % index_filenum))
 
     def next_reader(self):
         return RawByteReader(*self.next_raw_bytes())
 
+    # Returns a list of between 1 and max_messages readers for consecutive messages.
+    # Blocks or raises NoData as next_reader() when none are available.
+    # The batch ends before a message in another data file would close the map of an earlier reader.
+    def next_batch(self, max_messages=1024):
+        positions = self._next_positions(max_messages)
+        batch = []
+        data_files = set()
+        for filenum, pos, thread in positions:
+            if (filenum, thread) not in data_files:
+                if self._max_maps and len(data_files) >= self._max_maps:
+                    self._index -= len(positions) - len(batch)
+                    break
+                data_files.add((filenum, thread))
+            batch += [RawByteReader(*self.get_raw_bytes(filenum, pos, thread))]
+        return batch
+
+    # Yields readers for messages from start_index (inclusive) to end_index (exclusive)
+    # or until there is no more data.
+    def read_range(self, start_index, end_index, batch_size=1024):
+        self.set_index(start_index)
+        while True:
+            try:
+                batch = self.next_batch(batch_size)
+            except NoData:
+                return
+            first_index = self.get_index() - len(batch)
+            if first_index >= end_index:
+                self._index -= len(batch)
+                return
+            if self.get_index() > end_index:
+                self._index -= self.get_index() - end_index
+                yield from batch[:end_index - first_index]
+                return
+            yield from batch
+
+    # Returns the messages in [start_index, end_index) of a single day, or all of date, as a numpy structured
+    # array with one column per field of schema (which must be fixed width).
+    # The reader is left positioned at the end of the range.
+    def read_array(self, schema, start_index=None, end_index=None, date=None):
+        import numpy
+
+        dtype = schema.get_dtype()
+        if date is not None:
+            if start_index is not None or end_index is not None:
+                raise InvalidArgumentError('Providing indexes and date are mutually exclusive')
+            self.set_date(date)
+            if self._date != date:
+                return numpy.zeros(0, dtype=dtype)
+            start_index = self._full_index_base
+        elif start_index is None:
+            start_index = self.get_index()
+        self.set_index(start_index)
+        if end_index is None or end_index > self.get_end_index_today():
+            end_index = self.get_end_index_today()
+
+        slots = self._read_index_slots(numpy, self._index, max(0, end_index - start_index))
+        self._index += len(slots)
+        if not len(slots):
+            return numpy.zeros(0, dtype=dtype)
+
+        threads, filenums, positions = self.decode_index_slots(slots)
+        positions = positions.astype(numpy.int64)
+
+        records = numpy.empty(len(slots), dtype=dtype)
+        # the messages of each data file, grouped by a (stable) sort of its (thread, filenum) key
+        files, inverse, counts = numpy.unique((threads << numpy.uint64(32)) | filenums, return_inverse=True,
+                                              return_counts=True)
+        order = numpy.argsort(inverse.reshape(-1), kind='stable')
+        ends = numpy.cumsum(counts)
+        for file_key, end, count in zip(files.tolist(), ends.tolist(), counts.tolist()):
+            thread, filenum = file_key >> 32, file_key & 0xffffffff
+            selected = order[end - count:end]
+            file_positions = positions[selected]
+            mm = self._get_data_memory_map(filenum, thread)
+            for name in dtype.names:
+                field_dtype, offset = dtype.fields[name][:2]
+                # a (strided) view of the field at every byte of the data file, gathered at the messages' positions
+                column = numpy.ndarray((len(mm) - offset - field_dtype.itemsize + 1,), dtype=field_dtype, buffer=mm,
+                                       offset=offset, strides=(1,))
+                try:
+                    records[name][selected] = column[file_positions]
+                finally:
+                    # release the buffer so the data file can be closed
+                    del column
+        return records
+
+    # Returns the (up to count) consecutive non-zero index slots from index as a numpy uint64 array.
+    def _read_index_slots(self, numpy, index, count):
+        slots = []
+        while count > 0:
+            index_filenum, slot = divmod(index, ENTRIES_PER_INDEX_FILE)
+            try:
+                view = self.get_index_view(index_filenum)
+            except EndOfIndexfile:
+                break
+            n = min(count, ENTRIES_PER_INDEX_FILE - slot)
+            # copied, so as not to hold an export of the view
+            chunk = numpy.frombuffer(view[slot:slot+n], dtype=numpy.uint64).copy()
+            empty = numpy.flatnonzero(chunk & numpy.uint64(self._index_data_offset_mask) == 0)
+            if len(empty):
+                slots += [chunk[:empty[0]]]
+                break
+            slots += [chunk]
+            index += n
+            count -= n
+        return numpy.concatenate(slots) if slots else numpy.zeros(0, dtype=numpy.uint64)
+
+    # Iterates over readers for the remaining messages, as next_reader() but batching index reads.
+    def __iter__(self):
+        while True:
+            try:
+                batch = self.next_batch()
+            except NoData:
+                return
+            yield from batch
+
 
 class RemoteChronicleReader:
+    HEADER = struct.Struct('=iq')
+    LENGTH = struct.Struct('i')
     HEADER_LENGTH = 12
     IN_SYNC = -128
     PAD = -127
@@ -358,46 +612,96 @@ class RemoteChronicleReader:
     SUBSCRIBE = 1
 
     # where in 'start', 'end'/'now', index or date (YYYY-MM-DD)
-    def __init__(self, host, port, where):
+    #
+    # Messages are received with recv_into a buffer of buffer_size bytes (grown for larger messages), and
+    # all complete messages in it are parsed per receive. Those messages are copied out together (a single
+    # copy per receive), so readers remain valid. With zero_copy readers refer to the receive buffer
+    # instead, so are only valid until the next receive, i.e. the next call to next_reader() or next_batch()
+    # once the messages already received have been consumed.
+    def __init__(self, host, port, where, buffer_size=1024*1024, zero_copy=False):
         self._host = host
         self._port = port
         self._idx = None
         self._soc = None
-
-        if where == 'start':
-            self._startidx = RemoteChronicleReader.FROM_START
-        elif where == 'now' or where == 'end':
-            self._startidx = RemoteChronicleReader.FROM_END
-        else:
-            try:
-                self._startidx = int(where)
-            except ValueError:
-                try:
-                    if where == 'today':
-                        date = datetime.datetime.utcnow().date()
-                    else:
-                        date = datetime.date(*map(int, where.split('-')))
-                    dt = datetime.datetime(date.year, date.month, date.day, tzinfo=datetime.timezone.utc)
-                    self._startidx = (int(dt.timestamp()) << CYCLE_INDEX_POS)*86400
-                except Exception as e:
-                    raise InvalidArgumentError('Unable to determine start position for remote tailer from %s'
-                                                      % where)
-
-        self._soc = socket.create_connection((self._host, self._port))
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self._zero_copy = zero_copy
+        # the buffer of the pending messages, and the offset in _buf it starts from
+        self._received = self._buf
+        self._received_offset = 0
+        self._pending = collections.deque()
+
+        self._startidx = RemoteChronicleReader.get_start_index(where)
+        self._subscribe(self._startidx)
+        if where == 'now': # consume last message which we get with end..
+            self.next_reader()
+
+    def _connect(self):
+        return socket.create_connection((self._host, self._port))
+
+    # Connects and subscribes from startidx, discarding anything previously received
+    def _subscribe(self, startidx):
+        self._start = self._end = 0
+        self._pending.clear()
+        self._soc = self._connect()
         # subscribe to -1 start -2 end
-        self._soc.send(struct.pack('qq', RemoteChronicleReader.SUBSCRIBE, self._startidx))
+        self._soc.send(struct.pack('qq', RemoteChronicleReader.SUBSCRIBE, startidx))
         while True:
-            msg = self._soc.recv(RemoteChronicleReader.HEADER_LENGTH)
-            length, index = struct.unpack('=iq', msg)
+            while self._end - self._start < RemoteChronicleReader.HEADER_LENGTH:
+                self._fill()
+            length, index = RemoteChronicleReader.HEADER.unpack_from(self._buf, self._start)
+            self._start += RemoteChronicleReader.HEADER_LENGTH
             if length in (RemoteChronicleReader.IN_SYNC, RemoteChronicleReader.PAD): # in-sync, pad
                 continue
             elif length == RemoteChronicleReader.SYNCED_OK: # synced OK
                 self._idx = index
-                if where == 'now': # consume last message which we get with end..
-                    self.next_reader()
                 return
             else:
-                raise Exception('In-Sync not received as expected (length:%s, index:%s)' % (length, index))
+                raise PychroException('In-Sync not received as expected (length:%s, index:%s)' % (length, index))
+
+    # Returns the index to subscribe from for where in 'start', 'end'/'now', 'today', index or date (YYYY-MM-DD)
+    @staticmethod
+    def get_start_index(where):
+        if where == 'start':
+            return RemoteChronicleReader.FROM_START
+        elif where == 'now' or where == 'end':
+            return RemoteChronicleReader.FROM_END
+        try:
+            return int(where)
+        except ValueError:
+            try:
+                if where == 'today':
+                    date = datetime.datetime.utcnow().date()
+                else:
+                    date = datetime.date(*map(int, where.split('-')))
+                return VanillaChronicleReader.to_full_index(date, 0)
+            except Exception as e:
+                raise InvalidArgumentError('Unable to determine start position for remote tailer from %s'
+                                           % where)
+
+    # Parses the complete frames in buf (a bytearray) from pos to end, skipping in-sync and pad frames.
+    # Each header is rewritten in place so that the (inverted) body length immediately precedes the
+    # body, as RawByteReader expects.
+    # Returns a list of (body offset, index) and the offset following the last complete frame.
+    @staticmethod
+    def _parse_frames(buf, pos, end):
+        frames = []
+        while end - pos >= RemoteChronicleReader.HEADER_LENGTH:
+            length, index = RemoteChronicleReader.HEADER.unpack_from(buf, pos)
+            if length < 0:
+                if length in (RemoteChronicleReader.IN_SYNC, RemoteChronicleReader.PAD):
+                    pos += RemoteChronicleReader.HEADER_LENGTH
+                    continue
+                raise PychroException('Unexpected frame (length:%s, index:%s)' % (length, index))
+            body_offset = pos + RemoteChronicleReader.HEADER_LENGTH
+            if end - body_offset < length:
+                break
+            RemoteChronicleReader.LENGTH.pack_into(buf, body_offset-4, ~length)
+            frames += [(body_offset, index)]
+            pos = body_offset + length
+        return frames, pos
 
     def __str__(self):
         return '<RemoteChronicleReader host:%s port:%s idx:%s>' % (self._host, self._port, self._idx)
@@ -405,6 +709,10 @@ class RemoteChronicleReader:
     def get_index(self):
         return self._idx
 
+    # Number of messages received but not yet read, i.e. available without blocking
+    def get_num_received(self):
+        return len(self._pending)
+
     def close(self):
         if self._soc:
             self._soc.close()
@@ -413,28 +721,147 @@ class RemoteChronicleReader:
     def __del__(self):
         self.close()
 
+    # Receives more data after any partial message, reusing the buffer from the start when possible
+    def _fill(self):
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buf):
+            partial = self._buf[self._start:self._end]
+            if self._start == 0: # a single message larger than the buffer
+                self._buf = bytearray(2*len(self._buf))
+                self._view = memoryview(self._buf)
+            self._buf[:len(partial)] = partial
+            self._start, self._end = 0, len(partial)
+        received = self._soc.recv_into(self._view[self._end:])
+        if not received:
+            raise ConnectionResetError('Connection to %s:%s closed' % (self._host, self._port))
+        self._end += received
+
+    def _receive(self):
+        while not self._pending:
+            start = self._start
+            frames, self._start = RemoteChronicleReader._parse_frames(self._buf, start, self._end)
+            if not frames:
+                self._fill()
+                continue
+            self._pending.extend(frames)
+            if self._zero_copy:
+                self._received, self._received_offset = self._buf, 0
+            else:
+                self._received, self._received_offset = self._buf[start:self._start], start
+
     def next_reader(self):
-        while True:
+        self._receive()
+        offset, self._idx = self._pending.popleft()
+        return RawByteReader(offset - self._received_offset, self._received)
+
+    # Returns all messages received (up to max_messages), waiting for at least one
+    def next_batch(self, max_messages=1024):
+        self._receive()
+        batch = []
+        while self._pending and len(batch) < max_messages:
+            offset, self._idx = self._pending.popleft()
+            batch += [RawByteReader(offset - self._received_offset, self._received)]
+        return batch
+
+
+class ResilientRemoteChronicleReader(RemoteChronicleReader):
+    # RemoteChronicleReader which reconnects when the connection fails or nothing (not even a heartbeat)
+    # is received for timeout seconds, retrying with a backoff from initial_backoff doubling up to
+    # max_backoff. It resubscribes from the index following the last message delivered, and any
+    # messages received again are skipped.
+    #
+    # get_reconnect_count() is the number of reconnections, and get_gaps() a list of the number of
+    # messages missed, where the first message received after a reconnection was not the next index.
+    #
 
-            hdr_chunks = []
-            hdr_length = RemoteChronicleReader.HEADER_LENGTH
-            while hdr_length > 0:
-                hdr_chunks += [self._soc.recv(hdr_length)]
-                hdr_length -= len(hdr_chunks[-1])
+    def __init__(self, host, port, where, buffer_size=1024*1024, timeout=10.0, initial_backoff=0.1,
+                 max_backoff=10.0, zero_copy=False):
+        self._timeout = timeout
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._last_idx = None
+        self._reconnect_count = 0
+        self._resumed = False
+        self._gaps = []
+        self._closed = False
+        super().__init__(host, port, where, buffer_size, zero_copy)
 
-            body_length, index = struct.unpack('=iq', b''.join(hdr_chunks))
-            if body_length in (RemoteChronicleReader.IN_SYNC, RemoteChronicleReader.PAD): # in-sync, pad
+    def __str__(self):
+        return '<ResilientRemoteChronicleReader host:%s port:%s idx:%s reconnects:%s>' % (
+            self._host, self._port, self._idx, self._reconnect_count)
+
+    def get_reconnect_count(self):
+        return self._reconnect_count
+
+    def get_gaps(self):
+        return self._gaps
+
+    def _connect(self):
+        soc = socket.create_connection((self._host, self._port), self._timeout)
+        soc.settimeout(self._timeout)
+        return soc
+
+    # Stops any subscription, including from another thread blocked receiving
+    def close(self):
+        self._closed = True
+        self._disconnect()
+
+    def _disconnect(self):
+        if self._soc:
+            try:
+                self._soc.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        super().close()
+
+    def _reconnect(self):
+        backoff = self._initial_backoff
+        self._reconnect_count += 1
+        while True:
+            self._disconnect()
+            if self._closed:
+                raise ConnectionAbortedError('Subscription to %s:%s closed' % (self._host, self._port))
+            time.sleep(backoff)
+            try:
+                self._subscribe(self._startidx if self._last_idx is None else self._last_idx+1)
+                self._resumed = self._last_idx is not None
+                return
+            except (OSError, PychroException):
+                backoff = min(backoff*2, self._max_backoff)
+
+    def _receive(self):
+        while not self._pending:
+            try:
+                super()._receive()
+            except (OSError, PychroException):
+                self._reconnect()
                 continue
+            while self._pending and self._last_idx is not None and self._pending[0][1] <= self._last_idx:
+                self._pending.popleft()
+        if self._resumed:
+            self._resumed = False
+            self._gaps += [gap for gap in [self._get_gap(self._pending[0][1])] if gap]
+
+    def _get_gap(self, index):
+        last_date, last_index = VanillaChronicleReader.from_full_index(self._last_idx)
+        date, index = VanillaChronicleReader.from_full_index(index)
+        # messages at the end of the previous day cannot be known
+        return index - last_index - 1 if date == last_date else index
 
-            self._idx = index
-            body_chunks = [struct.pack('i', ~body_length)]
-            while body_length > 0:
-                body_chunks += [self._soc.recv(body_length)]
-                body_length -= len(body_chunks[-1])
-            return RawByteReader(4, b''.join(body_chunks))
+    def next_reader(self):
+        reader = super().next_reader()
+        self._last_idx = self._idx
+        return reader
 
+    def next_batch(self, max_messages=1024):
+        batch = super().next_batch(max_messages)
+        self._last_idx = self._idx
+        return batch
 
-class RawByteReader:
+
+# Pure python implementation of RawByteReader, the reference the native one (in pychroc) is tested against.
+class PyRawByteReader:
     __slots__ = ['_offset', '_bytes']
 
     def __init__(self, offset, _bytes):
@@ -557,7 +984,4 @@ class RawByteReader:
         return self._bytes[self._offset: self._offset + l].decode()
 
 
-
-
-
-
+from .pychroc import RawByteReader
@@ -7,6 +7,7 @@ setup(name='pychro',
       description='Memory-mapped message journal',
       url='https://github.com/jontuk/pychro',
       license='Apache 2.0',
+      # required, there is no pure Python fallback
       ext_modules=[Extension('pychro.pychroc', sources=['_pychroc/pychroc.c'])],
       classifiers=['Development Status :: 4 - Beta',
                    'Intended Audience :: Developers',
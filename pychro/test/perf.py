@@ -21,5 +21,14 @@ def main():
     case.test_perf_mixed()
     case.tearDown()
 
+    case = test_pychro.TestContentionPerf()
+    case.setUp()
+    case.n = N
+    case.test_perf_threads()
+
+    case.setUp()
+    case.n = N
+    case.test_perf_processes()
+
 if __name__ == '__main__':
     main()
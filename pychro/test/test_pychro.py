@@ -18,6 +18,7 @@
 #
 
 import unittest
+import array
 import zipfile
 import datetime
 import os
@@ -31,6 +32,9 @@ import random
 import shutil
 import tempfile
 import subprocess
+import asyncio
+import socket
+import signal
 
 subprocess.check_call([sys.executable, 'setup.py', 'build'], cwd=os.path.split(os.path.dirname(__file__))[0])
 
@@ -115,6 +119,569 @@ class TestNewAppenderFiles(unittest.TestCase):
         pass
 
 
+class TestAppenderRecovery(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+
+    # writes values with a new writer, returning the appender's next position
+    def write(self, values):
+        chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        appender = chron.get_appender()
+        for value in values:
+            appender.write_int(value)
+            appender.finish()
+        position = appender._filenum, appender._pos
+        chron.close()
+        return position
+
+    def check(self, position):
+        chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        appender = chron.get_appender()
+        self.assertEqual(position, (appender._filenum, appender._pos))
+        chron.close()
+        position = self.write([3])
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        self.assertEqual([0, 1, 2, 3], [reader.read_int() for reader in read_chron.next_batch(10)])
+        read_chron.close()
+        return position
+
+    def test_positions_file(self):
+        position = self.write([0, 1, 2])
+        self.check(position)
+
+    def test_index_scan(self):
+        position = self.write([0, 1, 2])
+        cycle_dir = os.path.join(self.tempdir.path, os.listdir(self.tempdir.path)[0])
+        os.remove(os.path.join(cycle_dir, pychro.POSITIONS_FILE_NAME))
+        self.check(position)
+
+    def test_scan_after_close(self):
+        self.write([0, 1, 2])
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        read_chron.next_reader()
+        view = read_chron.get_index_view(0)
+        tid = read_chron._index_views[0][0] >> (64 - read_chron._thread_id_bits)
+        self.assertEqual(2, pychro._pychro.find_last_thread_slot(view, 3, tid, read_chron._thread_id_bits))
+        read_chron.close()
+        # the view is released rather than left referring to unmapped memory
+        self.assertRaises(ValueError, pychro._pychro.find_last_thread_slot, view, 3, tid, read_chron._thread_id_bits)
+
+    def test_new_thread(self):
+        self.write([0, 1, 2])
+        find_last_thread_slot = pychro.vanilla_writer._pychro.find_last_thread_slot
+        scans = []
+        pychro.vanilla_writer._pychro.find_last_thread_slot = lambda *args: scans.append(args) or -1
+        try:
+            # with no entry in the positions file, there is no need to scan the index
+            t = threading.Thread(target=self.write, args=([3],))
+            t.start()
+            t.join()
+        finally:
+            pychro.vanilla_writer._pychro.find_last_thread_slot = find_last_thread_slot
+        self.assertEqual([], scans)
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        self.assertEqual([0, 1, 2, 3], [reader.read_int() for reader in read_chron.next_batch(10)])
+        read_chron.close()
+
+    def test_stale_positions_file(self):
+        self.write([0])
+        cycle_dir = os.path.join(self.tempdir.path, os.listdir(self.tempdir.path)[0])
+        with open(os.path.join(cycle_dir, pychro.POSITIONS_FILE_NAME), 'rb') as fh:
+            positions = fh.read()
+        # the last messages are written, but the positions file is not updated (as a writer which crashed)
+        position = self.write([1, 2])
+        with open(os.path.join(cycle_dir, pychro.POSITIONS_FILE_NAME), 'wb') as fh:
+            fh.write(positions)
+        self.check(position)
+
+
+def write_leased(path, values, close):
+    write_chron = pychro.VanillaChronicleWriter(path, leased_ids=True)
+    appender = write_chron.get_appender()
+    for value in values:
+        appender.write_int(value)
+        appender.finish()
+    if close:
+        write_chron.close()
+
+
+class TestLeasedIds(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+
+    def data_files(self):
+        cycle_dir = os.path.join(self.tempdir.path, [f for f in os.listdir(self.tempdir.path) if f.isdigit()][0])
+        return sorted(f for f in os.listdir(cycle_dir) if f.startswith('data'))
+
+    def read_ints(self):
+        with pychro.VanillaChronicleReader(self.tempdir.path) as read_chron:
+            return [reader.read_int() for reader in read_chron.next_batch(100)]
+
+    def test_threads(self):
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, leased_ids=True)
+        for i in range(5):
+            t = threading.Thread(target=self.append, args=(write_chron, i))
+            t.start()
+            t.join()
+        self.assertEqual([0], write_chron._leases.get_leased_ids())
+
+        # concurrently alive threads have their own ids
+        barrier = threading.Barrier(2)
+        ts = [threading.Thread(target=self.append, args=(write_chron, i, barrier)) for i in range(5, 7)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        self.assertEqual([0, 1], write_chron._leases.get_leased_ids())
+        write_chron.close()
+        self.assertEqual(['data-0-0', 'data-1-0'], self.data_files())
+        self.assertEqual(list(range(7)), sorted(self.read_ints()))
+
+    def append(self, write_chron, value, barrier=None):
+        appender = write_chron.get_appender()
+        if barrier:
+            barrier.wait()
+        appender.write_int(value)
+        appender.finish()
+
+    def test_cycle_change(self):
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, leased_ids=True)
+        leases = write_chron._leases
+        self.append(write_chron, 0)
+        write_chron.set_date(datetime.date(2000, 1, 1))
+        self.assertIs(leases, write_chron._leases)
+        self.append(write_chron, 1)
+        self.assertEqual([0], leases.get_leased_ids())
+        write_chron.close()
+        self.assertRaises(pychro.PychroException, leases.get_id)
+        self.assertEqual([0, 1], self.read_ints())
+
+    def test_processes(self):
+        for values, close in (([0, 1], True), ([2], False), ([3], True)):
+            p = multiprocessing.Process(target=write_leased, args=(self.tempdir.path, values, close))
+            p.start()
+            p.join()
+        # released on close, or taken over once the process has exited
+        write_leased(self.tempdir.path, [4], True)
+        self.assertEqual(['data-0-0'], self.data_files())
+        self.assertEqual([0, 1, 2, 3, 4], self.read_ints())
+
+
+def write_forked(write_chron):
+    appender = write_chron.get_appender()
+    appender.write_int(-1)
+    try:
+        appender.finish()
+    except pychro.ChronicleLocked:
+        sys.exit(3)
+
+
+class TestExclusiveWriter(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+
+    def read_ints(self):
+        with pychro.VanillaChronicleReader(self.tempdir.path) as read_chron:
+            return [reader.read_int() for reader in read_chron.next_batch(100)]
+
+    def write(self, write_chron, values):
+        appender = write_chron.get_appender()
+        for value in values:
+            appender.write_int(value)
+            appender.finish()
+
+    def test_exclusive(self):
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        self.assertTrue(write_chron.is_exclusive())
+        self.write(write_chron, [0, 1, 2])
+        self.assertRaises(pychro.ChronicleLocked, pychro.VanillaChronicleWriter, self.tempdir.path)
+        self.assertRaises(pychro.ChronicleLocked, pychro.VanillaChronicleWriter, self.tempdir.path, exclusive=True)
+        write_chron.close()
+
+        # continues from the end
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        self.write(write_chron, [3])
+        write_chron.set_index(write_chron.get_index() + 2)
+        self.write(write_chron, [5])
+        appender = write_chron.get_appender()
+        appender.write_int(6)
+        appender.stage()
+        appender.publish()
+        self.write(write_chron, [7])
+        write_chron.close()
+        with pychro.VanillaChronicleReader(self.tempdir.path) as read_chron:
+            self.assertEqual([0, 1, 2, 3], [reader.read_int() for reader in read_chron.next_batch(100)])
+            read_chron.set_index(read_chron.get_index() + 1)
+            self.assertEqual([5, 6, 7], [reader.read_int() for reader in read_chron.next_batch(100)])
+
+        with pychro.VanillaChronicleWriter(self.tempdir.path) as write_chron:
+            self.assertFalse(write_chron.is_exclusive())
+
+    def test_set_index_back(self):
+        # moved back, the next message goes to the first free slot rather than over a published one
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        self.write(write_chron, [0, 1, 2])
+        write_chron.set_index(write_chron.get_index() - 1)
+        self.write(write_chron, [99, 100])
+        write_chron.close()
+        self.assertEqual([0, 1, 2, 99, 100], self.read_ints())
+
+    def test_threads(self):
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        ts = [threading.Thread(target=self.write, args=(write_chron, range(i*20000, (i+1)*20000))) for i in range(4)]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for t in ts:
+                t.start()
+            for t in ts:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertTrue(write_chron.is_exclusive())
+        write_chron.close()
+        with pychro.VanillaChronicleReader(self.tempdir.path) as read_chron:
+            self.assertEqual(list(range(80000)), sorted(reader.read_int() for reader in read_chron.read_range(
+                read_chron.get_index(), read_chron.get_index() + 100000)))
+
+    def test_cycle_change(self):
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        self.write(write_chron, [0])
+        write_chron.set_date(datetime.date(2000, 1, 1))
+        self.assertTrue(write_chron.is_exclusive())
+        self.assertRaises(pychro.ChronicleLocked, pychro.VanillaChronicleWriter, self.tempdir.path)
+        self.write(write_chron, [1])
+        write_chron.close()
+        self.assertEqual([0, 1], self.read_ints())
+
+    def test_shared(self):
+        write_chron1 = pychro.VanillaChronicleWriter(self.tempdir.path)
+        write_chron2 = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        # falls back to compare and swap
+        self.assertFalse(write_chron2.is_exclusive())
+        self.write(write_chron1, [0])
+        # from another thread, so to other data files
+        t = threading.Thread(target=self.write, args=(write_chron2, [1]))
+        t.start()
+        t.join()
+        self.write(write_chron1, [2])
+        write_chron1.close()
+        write_chron2.close()
+        self.assertEqual([0, 1, 2], self.read_ints())
+
+    def test_fork(self):
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, exclusive=True)
+        self.write(write_chron, [0])
+        p = multiprocessing.get_context('fork').Process(target=write_forked, args=(write_chron,))
+        p.start()
+        p.join()
+        self.assertEqual(3, p.exitcode)
+        self.assertTrue(write_chron.is_exclusive())
+        self.write(write_chron, [1])
+        write_chron.close()
+        self.assertEqual([0, 1], self.read_ints())
+
+
+class TestDurability(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+
+    def test_none(self):
+        with pychro.VanillaChronicleWriter(self.tempdir.path) as write_chron:
+            appender = write_chron.get_appender()
+            appender.write_int(0)
+            appender.finish()
+            self.assertIsNone(appender.get_durable_index())
+
+    def test_batch(self):
+        with pychro.VanillaChronicleWriter(self.tempdir.path, durability=pychro.DURABILITY_BATCH) as write_chron:
+            appender = write_chron.get_appender()
+            self.assertIsNone(appender.get_durable_index())
+            appender.write_int(0)
+            appender.finish()
+            self.assertEqual(write_chron.get_index(), appender.get_durable_index())
+            for i in range(3):
+                appender.write_int(i)
+                appender.stage()
+            appender.publish()
+            self.assertEqual(write_chron.get_index(), write_chron.get_durable_index())
+            cycle_dir = write_chron._cycle_dir
+            self.assertEqual(sorted([os.path.join(cycle_dir, 'data-%s-0' % appender._tid)]),
+                             sorted(write_chron._syncer._data_fds))
+
+    def test_periodic(self):
+        with pychro.VanillaChronicleWriter(self.tempdir.path, durability=pychro.DURABILITY_PERIODIC,
+                                           sync_interval=0.01) as write_chron:
+            appender = write_chron.get_appender()
+            appender.write_int(0)
+            appender.finish()
+            for _ in range(500):
+                if appender.get_durable_index() == write_chron.get_index():
+                    break
+                time.sleep(0.01)
+            self.assertEqual(write_chron.get_index(), appender.get_durable_index())
+
+    def test_rollover(self):
+        self.now = datetime.datetime(2015, 1, 1, 23, 59, 59)
+        with pychro.VanillaChronicleWriter(self.tempdir.path, utcnow=lambda: self.now,
+                                           durability=pychro.DURABILITY_BATCH) as write_chron:
+            appender = write_chron.get_appender()
+            appender.write_int(0)
+            appender.finish()
+            self.assertEqual(pychro.VanillaChronicleReader.to_full_index(datetime.date(2015, 1, 1), 0),
+                             appender.get_durable_index())
+            self.now = datetime.datetime(2015, 1, 2, 0, 0, 1)
+            appender.write_int(1)
+            appender.finish()
+            self.assertEqual(pychro.VanillaChronicleReader.to_full_index(datetime.date(2015, 1, 2), 0),
+                             appender.get_durable_index())
+            self.assertEqual([os.path.join(self.tempdir.path, '20150102', 'index-0')],
+                             list(write_chron._syncer._index_fds))
+
+    def test_cycle_change(self):
+        with pychro.VanillaChronicleWriter(self.tempdir.path, durability=pychro.DURABILITY_PERIODIC,
+                                           sync_interval=0.01) as write_chron:
+            syncer = write_chron._syncer
+            # moves to (and back to) today's cycle, the syncer is kept
+            write_chron.set_date(datetime.date(2000, 1, 1))
+            self.assertIs(syncer, write_chron._syncer)
+            self.assertTrue(syncer.is_alive())
+            appender = write_chron.get_appender()
+            appender.write_int(0)
+            appender.finish()
+            for _ in range(500):
+                if appender.get_durable_index() == write_chron.get_index():
+                    break
+                time.sleep(0.01)
+            self.assertEqual(write_chron.get_index(), appender.get_durable_index())
+
+    def test_sync_error(self):
+        syncer = pychro.ChronicleSyncer(0.01)
+        # fdatasync fails on a pipe
+        r, w = os.pipe()
+        syncer._data_fds['pipe'] = r
+        syncer.start()
+        syncer.join(5)
+        self.assertFalse(syncer.is_alive())
+        self.assertRaises(OSError, syncer.get_durable_index)
+        self.assertRaises(OSError, syncer.published, 1, False)
+        del syncer._data_fds['pipe']
+        syncer.stop()
+        os.close(r)
+        os.close(w)
+
+    def test_invalid(self):
+        self.assertRaises(pychro.ConfigError, pychro.VanillaChronicleWriter, self.tempdir.path, durability='always')
+
+
+class TestStagedAppend(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+
+    def tearDown(self):
+        self.write_chron.close()
+        self.read_chron.close()
+
+    def test_publish(self):
+        appender = self.write_chron.get_appender()
+        self.assertEqual(0, appender.publish())
+        for i in range(3):
+            appender.write_int(i)
+            appender.write_string(str(i))
+            appender.stage()
+        self.assertEqual(3, appender.get_num_staged())
+        # not visible until published
+        self.assertRaises(pychro.NoData, self.read_chron.next_reader)
+        self.assertEqual(3, appender.publish())
+        self.assertEqual(0, appender.get_num_staged())
+        self.assertEqual(self.write_chron.get_index(), self.read_chron.get_end_index_today()-1)
+        for i in range(3):
+            reader = self.read_chron.next_reader()
+            self.assertEqual(i, reader.read_int())
+            self.assertEqual(str(i), reader.read_string())
+        self.assertRaises(pychro.NoData, self.read_chron.next_reader)
+
+    def test_finish_after_stage(self):
+        appender = self.write_chron.get_appender()
+        appender.write_int(0)
+        appender.stage()
+        # publishes those staged first
+        appender.write_int(1)
+        appender.finish()
+        appender.write_int(2)
+        appender.finish()
+        self.assertEqual([0, 1, 2], [reader.read_int() for reader in self.read_chron.next_batch(10)])
+
+    def test_interleaved(self):
+        appender1 = self.write_chron.get_appender()
+        appender2 = pychro.Appender(self.write_chron, appender1._tid + 1, 0, 4, self.write_chron._utcnow)
+        for i in range(4):
+            appender1.write_int(i)
+            appender1.stage()
+        appender2.write_int(-1)
+        appender2.finish()
+        appender1.publish()
+        self.assertEqual([-1, 0, 1, 2, 3], [reader.read_int() for reader in self.read_chron.next_batch(10)])
+
+
+class TestQueuedWriter(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+
+    def put_messages(self, write_chron, id, n):
+        for i in range(n):
+            write_chron.put(struct.pack('ii', id, i))
+
+    def test_threads(self):
+        num_threads = 8
+        n = TEST_SIZE//8
+        with pychro.QueuedChronicleWriter(self.tempdir.path, batch_size=64, max_pending=256) as write_chron:
+            ts = [threading.Thread(target=self.put_messages, args=(write_chron, id, n)) for id in range(num_threads)]
+            for t in ts:
+                t.start()
+            for t in ts:
+                t.join()
+            write_chron.flush(10)
+            self.assertEqual(0, write_chron.get_num_pending())
+
+            next_i = [0]*num_threads
+            with pychro.VanillaChronicleReader(self.tempdir.path) as read_chron:
+                for reader in read_chron.next_batch(num_threads*n+1):
+                    id = reader.read_int()
+                    self.assertEqual(next_i[id], reader.read_int())
+                    next_i[id] += 1
+            self.assertEqual([n]*num_threads, next_i)
+            # all written by the one appender thread
+            cycle_dir = write_chron.get_chronicle()._cycle_dir
+            self.assertEqual(1, len([f for f in os.listdir(cycle_dir) if f.startswith('data')]))
+
+    def test_close(self):
+        write_chron = pychro.QueuedChronicleWriter(self.tempdir.path)
+        write_chron.put_all([b'a', bytearray(b'bc'), memoryview(b'def')])
+        write_chron.close()
+        self.assertRaises(pychro.PychroException, write_chron.put, b'g')
+        with pychro.VanillaChronicleReader(self.tempdir.path) as read_chron:
+            readers = read_chron.next_batch(10)
+            self.assertEqual([b'a', b'bc', b'def'], [bytes(r.get_bytes()[r.get_offset():r.get_offset()+r.get_length()])
+                                                    for r in readers])
+
+    def flush(self, write_chron, errors):
+        try:
+            write_chron.flush()
+        except Exception as e:
+            errors.append(e)
+
+    def test_error(self):
+        write_chron = pychro.QueuedChronicleWriter(self.tempdir.path)
+        # larger than a data file
+        write_chron.put(bytes(pychro.DATA_FILE_SIZE))
+        errors = []
+        flushes = [threading.Thread(target=self.flush, args=(write_chron, errors)) for _ in range(4)]
+        for t in flushes:
+            t.start()
+        for t in flushes:
+            t.join(10)
+            self.assertFalse(t.is_alive())
+        self.assertEqual([pychro.NoSpace]*4, [e.__class__ for e in errors])
+        self.assertRaises(pychro.NoSpace, write_chron.put, b'a')
+        self.assertRaises(pychro.NoSpace, write_chron.close)
+        self.assertRaises(pychro.PychroException, write_chron.put, b'a')
+        write_chron.close()
+
+
+class TestPreallocate(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+
+    @staticmethod
+    def wait_for(fn):
+        for _ in range(500):
+            if os.path.exists(fn):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_preallocate(self):
+        chron = pychro.VanillaChronicleWriter(self.tempdir.path, preallocate=True)
+        preallocator = chron._preallocator
+        appender = chron.get_appender()
+        appender.write_int(0)
+        appender.finish()
+        cycle_dir = chron._cycle_dir
+        data_fn = os.path.join(cycle_dir, 'data-%s-%%s' % appender._tid)
+        self.assertTrue(self.wait_for(os.path.join(cycle_dir, 'index-1')))
+        self.assertTrue(self.wait_for(data_fn % 1))
+        self.assertEqual(pychro.INDEX_FILE_SIZE, os.path.getsize(os.path.join(cycle_dir, 'index-1')))
+        self.assertEqual(pychro.DATA_FILE_SIZE, os.path.getsize(data_fn % 1))
+
+        # moves on to the next data file, prepared ahead
+        count = 1
+        while appender._filenum == 0:
+            appender.write_string('x' * 60000)
+            appender.finish()
+            count += 1
+        appender.write_int(1)
+        appender.finish()
+        self.assertTrue(self.wait_for(data_fn % 2))
+        chron.close()
+        preallocator.join(5)
+        self.assertFalse(preallocator.is_alive())
+
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        readers = list(read_chron.read_range(read_chron.get_index(), read_chron.get_index() + count + 1))
+        self.assertEqual(count + 1, len(readers))
+        self.assertEqual(1, readers[-1].read_int())
+        read_chron.close()
+        self.assertEqual(['data-%s-%s' % (appender._tid, i) for i in range(3)] + ['index-0', 'index-1'],
+                         sorted(f for f in os.listdir(cycle_dir) if f.startswith(('data', 'index'))))
+
+    def test_discard_while_preparing(self):
+        preallocator = pychro.vanilla_writer.FilePreallocator()
+        prepare = pychro.vanilla_writer.FilePreallocator._prepare
+        started = threading.Event()
+
+        def slow_prepare(fn, size, index):
+            started.set()
+            time.sleep(0.2)
+            return prepare(fn, size, index)
+
+        pychro.vanilla_writer.FilePreallocator._prepare = staticmethod(slow_prepare)
+        try:
+            preallocator.start()
+            fn = os.path.join(self.tempdir.path, 'index-0')
+            preallocator.request(fn, pychro.INDEX_FILE_SIZE, True)
+            self.assertTrue(started.wait(5))
+            # waits for the file being prepared, so it is discarded too
+            preallocator.discard()
+            self.assertIsNone(preallocator.take(fn))
+        finally:
+            pychro.vanilla_writer.FilePreallocator._prepare = staticmethod(prepare)
+            preallocator.stop()
+            preallocator.join(5)
+
+    def test_adopt(self):
+        preallocator = pychro.vanilla_writer.FilePreallocator()
+        preallocator.start()
+        cycle_dir = os.path.join(self.tempdir.path, '20150601')
+        preallocator.schedule_cycle(0, cycle_dir, lambda: [])
+        hidden_fn = os.path.join(preallocator.get_hidden_dir(cycle_dir), 'index-0')
+        for _ in range(500):
+            with preallocator._lock:
+                if hidden_fn in preallocator._prepared:
+                    break
+            time.sleep(0.01)
+        os.makedirs(cycle_dir)
+        preallocator.adopt(cycle_dir)
+        fh, mapping = preallocator.take(os.path.join(cycle_dir, 'index-0'))
+        self.assertEqual(os.fstat(fh.fileno()).st_ino, os.stat(os.path.join(cycle_dir, 'index-0')).st_ino)
+        pychro._pychro.close_mmap(mapping, pychro.INDEX_FILE_SIZE)
+        fh.close()
+        preallocator.stop()
+        preallocator.join(5)
+
+
 class WriteOMThread(threading.Thread):
     def __init__(self, path, id, num_msgs, initial_sleep, write_sleep):
         super().__init__()
@@ -375,6 +942,101 @@ class TestWriteOverMidnight(unittest.TestCase):
                 self.assertEqual(ints.__contains__((i+1)*1000+j), True)
         self.read_chron.close()
 
+    def read_day(self, date):
+        # as of that day, so as not to move on to the next
+        with pychro.VanillaChronicleReader(self.tempdir.path, date=date,
+                                           utcnow=lambda: datetime.datetime(date.year, date.month, date.day)) \
+                as read_chron:
+            ints = []
+            while True:
+                try:
+                    ints += [read_chron.next_reader().read_int()]
+                except pychro.NoData:
+                    return ints
+
+    def test_partial_write(self):
+        self.now = datetime.datetime(2015, 1, 1, 23, 59, 59)
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, utcnow=lambda: self.now)
+        appender = write_chron.get_appender()
+        appender.write_int(1)
+        appender.finish()
+        appender.write_int(2)
+        self.now = datetime.datetime(2015, 1, 2, 0, 0, 1)
+        # rewritten to the new cycle
+        appender.finish()
+        write_chron.close()
+        self.assertEqual([1], self.read_day(datetime.date(2015, 1, 1)))
+        self.assertEqual([2], self.read_day(datetime.date(2015, 1, 2)))
+
+    def test_staged_rollover(self):
+        self.now = datetime.datetime(2015, 1, 1, 23, 59, 59)
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, utcnow=lambda: self.now)
+        appender = write_chron.get_appender()
+        appender.write_int(1)
+        appender.stage()
+        appender.publish()
+        appender.write_int(2)
+        appender.stage()
+        appender.write_int(3)
+        appender.stage()
+        appender.write_int(4)
+        self.now = datetime.datetime(2015, 1, 2, 0, 0, 1)
+        # staged and partial messages are rewritten to the new cycle
+        self.assertEqual(2, appender.publish())
+        appender.finish()
+        write_chron.close()
+        self.assertEqual([1], self.read_day(datetime.date(2015, 1, 1)))
+        self.assertEqual([2, 3, 4], self.read_day(datetime.date(2015, 1, 2)))
+
+    def test_staged_start_rollover(self):
+        # the next message is started after midnight while earlier ones are staged
+        self.now = datetime.datetime(2015, 1, 1, 23, 59, 59)
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, utcnow=lambda: self.now)
+        appender = write_chron.get_appender()
+        appender.write_int(0)
+        appender.finish()
+        appender.write_int(1)
+        appender.stage()
+        self.now = datetime.datetime(2015, 1, 2, 0, 0, 1)
+        appender.write_int(2)
+        appender.stage()
+        self.assertEqual(2, appender.publish())
+        write_chron.close()
+        self.assertEqual([0], self.read_day(datetime.date(2015, 1, 1)))
+        self.assertEqual([1, 2], self.read_day(datetime.date(2015, 1, 2)))
+
+    def test_prepared_rollover(self):
+        self.now = datetime.datetime(2015, 1, 1, 23, 58)
+        write_chron = pychro.VanillaChronicleWriter(self.tempdir.path, utcnow=lambda: self.now, preallocate=True)
+        appender = write_chron.get_appender()
+        appender.write_int(1)
+        appender.finish()
+        hidden_dir = os.path.join(self.tempdir.path, '.20150102.%s' % os.getpid())
+        self.assertFalse(os.path.exists(hidden_dir))
+
+        self.now = datetime.datetime(2015, 1, 1, 23, 59, 30)
+        prepared = ['data-%s-0' % appender._tid, 'index-0']
+        for _ in range(500):
+            if sorted(os.listdir(hidden_dir) if os.path.exists(hidden_dir) else []) == prepared:
+                break
+            time.sleep(0.01)
+        self.assertEqual(prepared, sorted(os.listdir(hidden_dir)))
+        # not visible to readers until the rollover
+        self.assertEqual(['20150101'], [f for f in os.listdir(self.tempdir.path) if not f.startswith('.')])
+        time.sleep(0.1)
+
+        self.now = datetime.datetime(2015, 1, 2, 0, 0, 1)
+        appender.write_int(2)
+        appender.finish()
+        self.assertFalse(os.path.exists(hidden_dir))
+        cycle_dir = os.path.join(self.tempdir.path, '20150102')
+        self.assertLessEqual(set(prepared), set(os.listdir(cycle_dir)))
+        # taken by the writer
+        self.assertFalse(set(os.path.join(cycle_dir, f) for f in prepared) & set(write_chron._preallocator._prepared))
+        write_chron.close()
+        self.assertEqual([1], self.read_day(datetime.date(2015, 1, 1)))
+        self.assertEqual([2], self.read_day(datetime.date(2015, 1, 2)))
+
 
 class MultiWriteChronThread(threading.Thread):
     def __init__(self, n, _id, _chron):
@@ -585,6 +1247,808 @@ class TestWriteChron(unittest.TestCase):
         self.read_chron.close()
 
 
+class TestBatchRead(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        self.n = TEST_SIZE
+        appender = self.write_chron.get_appender()
+        for i in range(self.n):
+            appender.write_int(i)
+            appender.write_string(str(i))
+            appender.finish()
+
+    def test_many_data_files(self):
+        # a batch across more data files than may be mapped at once
+        tempdir = TempDir()
+        write_chron = pychro.VanillaChronicleWriter(tempdir.path)
+        appenders = []
+        ts = [threading.Thread(target=lambda: appenders.append(write_chron.get_appender())) for _ in range(6)]
+        for t in ts:
+            t.start()
+            t.join()
+        for i in range(30):
+            appenders[i % 6].write_int(i)
+            appenders[i % 6].finish()
+        write_chron.close()
+        read_chron = pychro.VanillaChronicleReader(tempdir.path, max_mapped_memory=128*1024*1024)
+        received = []
+        while len(received) < 30:
+            batch = read_chron.next_batch(10)
+            self.assertLessEqual(len(batch), 2)
+            received += [reader.read_int() for reader in batch]
+        self.assertEqual(list(range(30)), received)
+        self.assertEqual(list(range(30)), [reader.read_int() for reader in
+                                           read_chron.read_range(read_chron.get_index() - 30, read_chron.get_index())])
+        read_chron.close()
+
+    def test_next_batch(self):
+        i = 0
+        while True:
+            try:
+                batch = self.read_chron.next_batch(100)
+            except pychro.NoData:
+                break
+            self.assertTrue(1 <= len(batch) <= 100)
+            for reader in batch:
+                self.assertEqual(i, reader.read_int())
+                self.assertEqual(str(i), reader.read_string())
+                i += 1
+            self.assertEqual(i, self.read_chron.get_index() - self.read_chron.to_full_index(
+                self.read_chron.get_date(), 0))
+        self.assertEqual(self.n, i)
+
+    def test_read_range(self):
+        base = self.read_chron.to_full_index(self.read_chron.get_date(), 0)
+        values = [reader.read_int() for reader in self.read_chron.read_range(base+10, base+20, batch_size=3)]
+        self.assertEqual(list(range(10, 20)), values)
+        self.assertEqual(base+20, self.read_chron.get_index())
+        values = [reader.read_int() for reader in self.read_chron.read_range(base+self.n-5, base+self.n+5)]
+        self.assertEqual(list(range(self.n-5, self.n)), values)
+
+    def test_iter(self):
+        self.assertEqual(list(range(self.n)), [reader.read_int() for reader in self.read_chron])
+
+    def tearDown(self):
+        self.write_chron.close()
+        self.read_chron.close()
+
+
+class TestHighWaterMark(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.n = 1000
+        appender = self.write_chron.get_appender()
+        for i in range(self.n):
+            appender.write_int(i)
+            appender.finish()
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        self.control_path = os.path.join(self.read_chron._cycle_dir, pychro.CONTROL_FILE_NAME)
+        self.base = self.read_chron.get_index()
+
+    def tearDown(self):
+        self.write_chron.close()
+        self.read_chron.close()
+
+    def set_hwm(self, hwm):
+        self.read_chron.close()
+        with open(self.control_path, 'r+b') as fh:
+            fh.seek(pychro.CONTROL_HWM_SLOT*8)
+            fh.write(struct.pack('Q', hwm))
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+
+    def test_written(self):
+        self.assertEqual(pychro.CONTROL_FILE_SIZE, os.path.getsize(self.control_path))
+        self.assertEqual(self.n, self.read_chron._get_high_water_mark())
+        self.assertEqual(self.base+self.n, self.read_chron.get_end_index_today())
+
+    def test_stale(self):
+        for hwm in (0, 1, self.n//2, self.n-pychro.HWM_SCAN_LIMIT-1, self.n-1, self.n+1, self.n*1000):
+            self.set_hwm(hwm)
+            self.assertEqual(self.base+self.n, self.read_chron.get_end_index_today())
+
+    def test_missing(self):
+        self.read_chron.close()
+        self.write_chron.close()
+        os.remove(self.control_path)
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        self.assertEqual(self.base+self.n, self.read_chron.get_end_index_today())
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        appender = self.write_chron.get_appender()
+        appender.write_int(self.n)
+        appender.finish()
+        self.assertEqual(self.n+1, self.read_chron._get_high_water_mark())
+
+
+class TailThread(threading.Thread):
+    def __init__(self, chron, n):
+        super().__init__()
+        self.chron = chron
+        self.n = n
+        self.received = []
+
+    def run(self):
+        for _ in range(self.n):
+            reader = self.chron.next_reader()
+            self.received += [(reader.read_int(), time.time())]
+
+
+class TestWaitNotify(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+
+    def tearDown(self):
+        self.write_chron.close()
+
+    def test_invalid_strategy(self):
+        self.assertRaises(pychro.ConfigError, pychro.VanillaChronicleReader, self.tempdir.path,
+                          polling_interval=1, wait_strategy='unknown')
+
+    def do_test_wakeup(self, spin_count, wait_strategy=pychro.WAIT_NOTIFY):
+        appender = self.write_chron.get_appender()
+        appender.write_int(-1)
+        appender.finish()
+        # a long polling interval, so only a notification wakes the reader in time
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path, polling_interval=30,
+                                                   wait_strategy=wait_strategy, spin_count=spin_count)
+        self.assertEqual(-1, read_chron.next_reader().read_int())
+        t = TailThread(read_chron, 3)
+        t.start()
+        sent = []
+        for i in range(3):
+            time.sleep(0.2)
+            sent += [time.time()]
+            appender.write_int(i)
+            appender.finish()
+        t.join(10)
+        self.assertFalse(t.is_alive())
+        self.assertEqual([0, 1, 2], [i for i, _ in t.received])
+        for (_, received), sent_time in zip(t.received, sent):
+            self.assertLess(received - sent_time, 1)
+        read_chron.close()
+
+    def test_wakeup(self):
+        self.do_test_wakeup(0)
+
+    def test_wakeup_spin(self):
+        self.do_test_wakeup(1000)
+
+    def test_native_spin(self):
+        self.do_test_wakeup(1000, pychro.WAIT_SPIN)
+
+    def test_native_spin_releases_gil(self):
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path, polling_interval=0,
+                                                   wait_strategy=pychro.WAIT_SPIN, spin_count=10**9)
+        appender = self.write_chron.get_appender()
+        appender.write_int(1)
+        appender.finish()
+        read_chron.next_reader()
+        t = TailThread(read_chron, 1)
+        t.start()
+        # this thread must keep running while the reader spins
+        count = 0
+        end = time.time() + 0.5
+        while time.time() < end:
+            count += 1
+        appender.write_int(2)
+        appender.finish()
+        t.join(10)
+        self.assertEqual([2], [i for i, _ in t.received])
+        self.assertGreater(count, 10000)
+        read_chron.close()
+
+    def test_wait_mmap_timeout(self):
+        appender = self.write_chron.get_appender()
+        appender.write_int(1)
+        appender.finish()
+        mm = self.write_chron._index_views[0]
+        t = time.time()
+        self.assertEqual(0, pychro._pychro.wait_mmap(mm, 8, 0xffffffffffffffff, 0.2, 1000, 10))
+        self.assertGreaterEqual(time.time() - t, 0.19)
+        self.assertNotEqual(0, pychro._pychro.wait_mmap(mm, 0, 0xffffffffffffffff, 0.2))
+        # the timeout also ends a spin
+        t = time.time()
+        self.assertEqual(0, pychro._pychro.wait_mmap(mm, 8, 0xffffffffffffffff, 0.2, 2**32-1))
+        self.assertLess(time.time() - t, 5)
+
+    def test_wait_signal(self):
+        mm = self.write_chron._index_views[0]
+        timer = threading.Timer(0.2, signal.raise_signal, (signal.SIGINT,))
+        timer.start()
+        t = time.time()
+        self.assertRaises(KeyboardInterrupt, pychro._pychro.wait_mmap, mm, 8, 0xffffffffffffffff, -1, 2**32-1)
+        self.assertLess(time.time() - t, 5)
+        timer.join()
+
+    def do_test_close_while_waiting(self, wait_strategy):
+        appender = self.write_chron.get_appender()
+        appender.write_int(-1)
+        appender.finish()
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path, polling_interval=0.5,
+                                                   wait_strategy=wait_strategy)
+        read_chron.next_reader()
+        t = threading.Thread(target=read_chron._wait_for_data)
+        t.start()
+        time.sleep(0.1)
+        # the files stay mapped until the wait returns
+        read_chron.close()
+        appender.write_int(0)
+        appender.finish()
+        t.join(10)
+        self.assertFalse(t.is_alive())
+
+    def test_close_while_waiting(self):
+        self.do_test_close_while_waiting(pychro.WAIT_NOTIFY)
+
+    def test_close_while_spinning(self):
+        self.do_test_close_while_waiting(pychro.WAIT_SPIN)
+
+    def test_timeout(self):
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path, polling_interval=0.1,
+                                                   wait_strategy=pychro.WAIT_NOTIFY)
+        appender = self.write_chron.get_appender()
+        appender.write_int(1)
+        appender.finish()
+        read_chron.next_reader()
+        self.assertTrue(read_chron._open_control())
+        t = time.time()
+        read_chron._wait_for_data()
+        self.assertGreaterEqual(time.time() - t, 0.09)
+        read_chron.close()
+
+
+class TestAsyncReader(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+
+    def tearDown(self):
+        self.write_chron.close()
+
+    def write(self, values, delay):
+        appender = self.write_chron.get_appender()
+        for i in values:
+            time.sleep(delay)
+            appender.write_int(i)
+            appender.write_double(time.time())
+            appender.finish()
+
+    def test_tail(self):
+        self.write(range(3), 0)
+
+        async def tail(n):
+            received = []
+            with pychro.AsyncVanillaChronicleReader(self.tempdir.path) as chron:
+                async for reader in chron:
+                    received += [(reader.read_int(), time.time() - reader.read_double())]
+                    if len(received) == n:
+                        return received
+
+        async def run():
+            tailers = asyncio.gather(*[tail(8) for _ in range(3)])
+            await asyncio.get_running_loop().run_in_executor(None, self.write, range(3, 8), 0.1)
+            return await asyncio.wait_for(tailers, 10)
+
+        for received in asyncio.run(run()):
+            self.assertEqual(list(range(8)), [i for i, _ in received])
+            for _, latency in received[3:]:
+                self.assertLess(latency, 0.5)
+
+    def test_next_batch(self):
+        async def run():
+            chron = pychro.AsyncVanillaChronicleReader(self.tempdir.path, batch_size=4)
+            await asyncio.get_running_loop().run_in_executor(None, self.write, range(10), 0)
+            batches = [[reader.read_int() for reader in await chron.next_batch()] for _ in range(3)]
+            self.assertEqual(chron.get_chronicle().get_index(), chron.get_index())
+            chron.close()
+            return batches
+
+        self.assertEqual([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]], asyncio.run(run()))
+
+    def test_no_chronicle_yet(self):
+        tempdir = TempDir()
+
+        async def run():
+            chron = pychro.AsyncVanillaChronicleReader(tempdir.path)
+            loop = asyncio.get_running_loop()
+            write = loop.run_in_executor(None, self.write_new, tempdir.path)
+            reader = await asyncio.wait_for(chron.next_reader(), 10)
+            await write
+            return reader.read_int()
+
+        self.assertEqual(42, asyncio.run(run()))
+
+    def test_watcher(self):
+        self.write(range(1), 0)
+        key = os.path.realpath(self.tempdir.path)
+
+        async def run():
+            chron = pychro.AsyncVanillaChronicleReader(self.tempdir.path)
+            other = pychro.AsyncVanillaChronicleReader(self.tempdir.path)
+            watcher = pychro.async_reader.ChronicleWatcher._watchers[key]
+            self.assertEqual(0, (await chron.next_reader()).read_int())
+            loop = asyncio.get_running_loop()
+            for i in range(1, 4):
+                write = loop.run_in_executor(None, self.write, [i], 0.05)
+                t = time.time()
+                self.assertEqual(i, (await asyncio.wait_for(chron.next_reader(), 10)).read_int())
+                self.assertLess(time.time() - t, 0.5)
+                await write
+            # the same thread serves every wait, while any reader is open
+            self.assertIs(watcher, pychro.async_reader.ChronicleWatcher._watchers[key])
+            chron.close()
+            self.assertTrue(watcher.is_alive())
+            other.close()
+            return watcher
+
+        watcher = asyncio.run(run())
+        watcher.join(5)
+        self.assertFalse(watcher.is_alive())
+        self.assertNotIn(key, pychro.async_reader.ChronicleWatcher._watchers)
+
+    def test_watcher_seq(self):
+        # a waiter registered before the watcher has seen the control file is woken if it changed since
+        self.write(range(1), 0)
+        watcher = pychro.async_reader.ChronicleWatcher(self.tempdir.path, datetime.datetime.utcnow)
+        loop = asyncio.new_event_loop()
+        future = watcher.add_waiter(loop)
+        watcher._refs = 1
+        watcher.start()
+        loop.run_until_complete(asyncio.wait_for(future, 0.5))
+        watcher._refs = 0
+        watcher.join(5)
+        loop.close()
+
+    @staticmethod
+    def write_new(path):
+        time.sleep(0.2)
+        with pychro.VanillaChronicleWriter(path) as chron:
+            appender = chron.get_appender()
+            appender.write_int(42)
+            appender.finish()
+
+
+class FakeChronicleServer(threading.Thread):
+    # Accepts a subscription per list of frames and sends them, chunk bytes at a time
+    def __init__(self, frames, chunk, *reconnect_frames):
+        super().__init__(daemon=True)
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.data = [b''.join(f) for f in (frames,) + reconnect_frames]
+        self.chunk = chunk
+        self.subscriptions = []
+        self.subscription = None
+
+    def run(self):
+        for data in self.data:
+            conn, _ = self.sock.accept()
+            self.subscriptions += [struct.unpack('qq', conn.recv(16))]
+            self.subscription = self.subscriptions[0]
+            for i in range(0, len(data), self.chunk):
+                conn.sendall(data[i:i+self.chunk])
+                time.sleep(0.001)
+            time.sleep(0.2)
+            conn.close()
+        self.sock.close()
+
+    @staticmethod
+    def frame(length, index, body=b''):
+        return struct.pack('=iq', length, index) + body
+
+
+class TestRemoteReader(unittest.TestCase):
+    def test_buffer_sizes(self):
+        # 16 bytes is smaller than a single message so the buffer must grow
+        for buffer_size, chunk, zero_copy in ((16, 5, False), (64, 1, True), (64, 4096, False), (1024*1024, 7, True)):
+            server = FakeChronicleServer(TestAsyncRemoteReader.messages(100, 20), chunk)
+            server.start()
+            chron = pychro.RemoteChronicleReader('127.0.0.1', server.port, 'start', buffer_size=buffer_size,
+                                                 zero_copy=zero_copy)
+            received = []
+            while len(received) < 20:
+                reader = chron.next_reader()
+                received += [(chron.get_index(), reader.read_int(), reader.read_string())]
+            self.assertEqual([(100+i, i, 'm%02d' % i) for i in range(20)], received)
+            with self.assertRaises(ConnectionError):
+                chron.next_reader()
+            chron.close()
+            server.join()
+
+    def test_readers_kept(self):
+        # readers remain valid after later receives (reusing the buffer), unless zero_copy
+        server = FakeChronicleServer(TestAsyncRemoteReader.messages(100, 20), 5)
+        server.start()
+        chron = pychro.RemoteChronicleReader('127.0.0.1', server.port, 'start', buffer_size=64)
+        readers = [chron.next_reader() for _ in range(20)]
+        self.assertEqual([(i, 'm%02d' % i) for i in range(20)],
+                         [(reader.read_int(), reader.read_string()) for reader in readers])
+        chron.close()
+        server.join()
+
+    def test_next_batch(self):
+        server = FakeChronicleServer(TestAsyncRemoteReader.messages(0, 10), 4096)
+        server.start()
+        chron = pychro.RemoteChronicleReader('127.0.0.1', server.port, 'now')
+        received = []
+        while len(received) < 9:
+            batch = chron.next_batch(4)
+            self.assertLessEqual(len(batch), 4)
+            received += [(reader.read_int(), reader.read_string()) for reader in batch]
+        self.assertEqual(9, chron.get_index())
+        self.assertEqual([(i, 'm%02d' % i) for i in range(1, 10)], received)
+        chron.close()
+        server.join()
+
+
+class TestResilientRemoteReader(unittest.TestCase):
+    @staticmethod
+    def messages(indices):
+        frames = [FakeChronicleServer.frame(pychro.RemoteChronicleReader.SYNCED_OK, indices[0])]
+        for index in indices:
+            frames += [FakeChronicleServer.frame(4, index, struct.pack('i', index))]
+        return frames
+
+    def test_reconnect(self):
+        # resubscribes after 109 and 112, with 105-109 received again and 113-114 missing
+        server = FakeChronicleServer(self.messages(range(100, 110)), 64, self.messages(range(105, 113)),
+                                     self.messages(range(115, 120)))
+        server.start()
+        chron = pychro.ResilientRemoteChronicleReader('127.0.0.1', server.port, 'start', initial_backoff=0.01)
+        received = []
+        while len(received) < 18:
+            received += [reader.read_int() for reader in chron.next_batch()]
+            self.assertEqual(received[-1], chron.get_index())
+        self.assertEqual(list(range(100, 113)) + list(range(115, 120)), received)
+        self.assertEqual([pychro.RemoteChronicleReader.FROM_START, 110, 113], [i for _, i in server.subscriptions])
+        self.assertEqual(2, chron.get_reconnect_count())
+        self.assertEqual([2], chron.get_gaps())
+        chron.close()
+        server.join()
+
+    def test_server_restart(self):
+        tempdir = TempDir()
+        with pychro.VanillaChronicleWriter(tempdir.path) as write_chron:
+            appender = write_chron.get_appender()
+
+            def write(values):
+                for i in values:
+                    appender.write_int(i)
+                    appender.finish()
+
+            def serve(port=0):
+                server = pychro.ChronicleServer(tempdir.path, host='127.0.0.1', port=port)
+                thread = threading.Thread(target=server.serve_forever)
+                thread.start()
+                return server, thread
+
+            write(range(10))
+            server, thread = serve()
+            port = server.get_port()
+            chron = pychro.ResilientRemoteChronicleReader('127.0.0.1', port, 'now', initial_backoff=0.05)
+            write(range(10, 20))
+            received = [chron.next_reader().read_int() for _ in range(10)]
+            server.shutdown()
+            thread.join()
+            server.close()
+            write(range(20, 30))
+            server, thread = serve(port)
+            received += [chron.next_reader().read_int() for _ in range(10)]
+            self.assertEqual(list(range(10, 30)), received)
+            self.assertEqual(1, chron.get_reconnect_count())
+            self.assertEqual([], chron.get_gaps())
+            chron.close()
+            server.shutdown()
+            thread.join()
+            server.close()
+
+
+class TestAsyncRemoteReader(unittest.TestCase):
+    def run_reader(self, where, frames, chunk, n):
+        server = FakeChronicleServer(frames, chunk)
+        server.start()
+
+        async def run():
+            chron = await pychro.AsyncRemoteChronicleReader.connect('127.0.0.1', server.port, where)
+            received = []
+            async for reader in chron:
+                received += [(chron.get_index(), reader.read_int(), reader.read_string())]
+                if len(received) == n:
+                    break
+            chron.close()
+            return received
+
+        received = asyncio.run(asyncio.wait_for(run(), 10))
+        server.join()
+        return server.subscription, received
+
+    @staticmethod
+    def messages(start, n):
+        frames = [FakeChronicleServer.frame(pychro.RemoteChronicleReader.IN_SYNC, 0),
+                  FakeChronicleServer.frame(pychro.RemoteChronicleReader.SYNCED_OK, start)]
+        for i in range(n):
+            body = struct.pack('i', i) + bytes([3]) + b'm%02d' % i
+            frames += [FakeChronicleServer.frame(len(body), start+i, body)]
+            if i % 3 == 0:
+                frames += [FakeChronicleServer.frame(pychro.RemoteChronicleReader.PAD, 0)]
+        return frames
+
+    def test_fragmented(self):
+        for chunk in (1, 7, 4096):
+            subscription, received = self.run_reader('start', self.messages(100, 20), chunk, 20)
+            self.assertEqual((pychro.RemoteChronicleReader.SUBSCRIBE, pychro.RemoteChronicleReader.FROM_START),
+                             subscription)
+            self.assertEqual([(100+i, i, 'm%02d' % i) for i in range(20)], received)
+
+    def test_now(self):
+        subscription, received = self.run_reader('now', self.messages(5, 3), 64, 2)
+        self.assertEqual(pychro.RemoteChronicleReader.FROM_END, subscription[1])
+        self.assertEqual([(6, 1, 'm01'), (7, 2, 'm02')], received)
+
+    def test_connection_closed(self):
+        server = FakeChronicleServer(self.messages(0, 1), 64)
+        server.start()
+
+        async def run():
+            chron = await pychro.AsyncRemoteChronicleReader.connect('127.0.0.1', server.port, 'end')
+            batch = await chron.next_batch()
+            with self.assertRaises(ConnectionError):
+                await chron.next_reader()
+            return len(batch)
+
+        self.assertEqual(1, asyncio.run(asyncio.wait_for(run(), 10)))
+        server.join()
+
+    def test_start_index(self):
+        self.assertEqual(pychro.VanillaChronicleReader.to_full_index(datetime.date(2015, 3, 4), 0),
+                         pychro.RemoteChronicleReader.get_start_index('2015-03-04'))
+        self.assertEqual(123, pychro.RemoteChronicleReader.get_start_index('123'))
+        with self.assertRaises(pychro.InvalidArgumentError):
+            pychro.RemoteChronicleReader.get_start_index('yesterday')
+
+
+class TestChronicleServer(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.appender = self.write_chron.get_appender()
+        self.write(range(1000))
+        self.server = pychro.ChronicleServer(self.tempdir.path, host='127.0.0.1', heartbeat_interval=0.05)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        self.write_chron.close()
+
+    def write(self, values):
+        for i in values:
+            self.appender.write_int(i)
+            self.appender.write_string('m%s' % i)
+            self.appender.finish()
+
+    def read(self, chron, n):
+        received = []
+        while len(received) < n:
+            received += [(reader.read_int(), reader.read_string()) for reader in chron.next_batch()]
+        return received
+
+    def test_subscribe(self):
+        start = pychro.RemoteChronicleReader('127.0.0.1', self.server.get_port(), 'start')
+        base = start.get_index()
+        now = pychro.RemoteChronicleReader('127.0.0.1', self.server.get_port(), 'now')
+        self.assertEqual(base + 999, now.get_index())
+        index = pychro.RemoteChronicleReader('127.0.0.1', self.server.get_port(), str(base + 500))
+        self.assertEqual([(i, 'm%s' % i) for i in range(1000)], self.read(start, 1000))
+        self.write(range(1000, 1010))
+        self.assertEqual([(i, 'm%s' % i) for i in range(1000, 1010)], self.read(start, 10))
+        self.assertEqual([(i, 'm%s' % i) for i in range(1000, 1010)], self.read(now, 10))
+        self.assertEqual([(i, 'm%s' % i) for i in range(500, 1010)], self.read(index, 510))
+        self.assertEqual(base + 1009, index.get_index())
+        self.assertEqual(3, self.server.get_num_subscribers())
+        for chron in (start, now, index):
+            chron.close()
+
+    def test_many_subscribers(self):
+        chrons = [pychro.RemoteChronicleReader('127.0.0.1', self.server.get_port(), 'start', buffer_size=1024)
+                  for _ in range(20)]
+        self.write(range(1000, 2000))
+        for chron in chrons:
+            self.assertEqual(list(range(2000)), [i for i, _ in self.read(chron, 2000)])
+            chron.close()
+
+    def test_heartbeat(self):
+        soc = socket.create_connection(('127.0.0.1', self.server.get_port()))
+        soc.sendall(struct.pack('qq', pychro.RemoteChronicleReader.SUBSCRIBE, pychro.RemoteChronicleReader.FROM_END))
+        received = b''
+        while received.count(struct.pack('=iq', pychro.RemoteChronicleReader.IN_SYNC, 0)) < 3:
+            received += soc.recv(4096)
+        soc.close()
+
+    def test_invalid_subscription(self):
+        for start_index in (2**62, -2**63):
+            soc = socket.create_connection(('127.0.0.1', self.server.get_port()))
+            with self.assertLogs('pychro.server'):
+                soc.sendall(struct.pack('qq', pychro.RemoteChronicleReader.SUBSCRIBE, start_index))
+                # dropped, while the server keeps serving
+                self.assertEqual(b'', soc.recv(4096))
+            soc.close()
+        chron = pychro.RemoteChronicleReader('127.0.0.1', self.server.get_port(), 'start')
+        self.assertEqual(list(range(1000)), [i for i, _ in self.read(chron, 1000)])
+        chron.close()
+
+    def test_future_cycle(self):
+        # subscribed to a cycle not yet created, nothing is sent from earlier ones until it is
+        tempdir = TempDir()
+        now = [datetime.datetime(2020, 1, 1, 12)]
+        write_chron = pychro.VanillaChronicleWriter(tempdir.path, utcnow=lambda: now[0])
+        appender = write_chron.get_appender()
+        for i in range(3):
+            appender.write_int(i)
+            appender.finish()
+        server = pychro.ChronicleServer(tempdir.path, host='127.0.0.1', heartbeat_interval=0.05)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        start_index = pychro.VanillaChronicleReader.to_full_index(datetime.date(2020, 1, 2), 0)
+        chron = pychro.RemoteChronicleReader('127.0.0.1', server.get_port(), str(start_index))
+        try:
+            self.assertEqual(start_index, chron.get_index())
+            time.sleep(0.2)
+            now[0] = datetime.datetime(2020, 1, 2, 0, 1)
+            appender.write_int(42)
+            appender.finish()
+            self.assertEqual(42, chron.next_reader().read_int())
+            self.assertEqual(start_index, chron.get_index())
+        finally:
+            chron.close()
+            server.shutdown()
+            thread.join()
+            server.close()
+            write_chron.close()
+
+    def test_notified(self):
+        # without heartbeats, only a notification wakes the server in time
+        server = pychro.ChronicleServer(self.tempdir.path, host='127.0.0.1', heartbeat_interval=30)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        chron = pychro.RemoteChronicleReader('127.0.0.1', server.get_port(), 'now')
+        for i in range(1000, 1005):
+            time.sleep(0.2)
+            t = time.time()
+            self.write([i])
+            self.assertEqual([(i, 'm%s' % i)], self.read(chron, 1))
+            self.assertLess(time.time() - t, 0.5)
+        chron.close()
+        server.shutdown()
+        thread.join()
+        server.close()
+
+
+class TestReplicator(unittest.TestCase):
+    def setUp(self):
+        self.source = TempDir()
+        self.local = TempDir()
+        self.now = datetime.datetime(2015, 6, 1, 23, 0)
+        self.write_chron = pychro.VanillaChronicleWriter(self.source.path, utcnow=lambda: self.now)
+        self.appender = self.write_chron.get_appender()
+        self.server = pychro.ChronicleServer(self.source.path, host='127.0.0.1')
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        self.write_chron.close()
+
+    def write(self, values):
+        for i in values:
+            self.appender.write_int(i)
+            self.appender.write_string('m' * (i % 100))
+            self.appender.finish()
+
+    def replicate(self, n, **kwargs):
+        replicator = pychro.ChronicleReplicator('127.0.0.1', self.server.get_port(), self.local.path, **kwargs)
+        replicated = 0
+        while replicated < n:
+            replicated += replicator.replicate()
+        self.assertEqual(n, replicated)
+        return replicator
+
+    def read_all(self, path):
+        with pychro.VanillaChronicleReader(path) as chron:
+            messages = []
+            while True:
+                try:
+                    reader = chron.next_reader()
+                except pychro.NoData:
+                    return messages
+                messages += [(chron.get_index()-1, reader.read_int(), reader.read_string())]
+
+    def test_replicate_and_resume(self):
+        self.write(range(500))
+        self.now = datetime.datetime(2015, 6, 2, 1, 0)
+        self.write(range(500, 700))
+        replicator = self.replicate(700)
+        self.assertEqual(self.write_chron.get_index(), replicator.get_index())
+        replicator.close()
+        self.assertEqual(self.read_all(self.source.path), self.read_all(self.local.path))
+        self.assertEqual(['20150601', '20150602'], sorted(os.listdir(self.local.path))[:2])
+
+        self.write(range(700, 900))
+        # resumes from the local end rather than where
+        replicator = self.replicate(200, where='start')
+        self.assertEqual(self.write_chron.get_index(), replicator.get_index())
+        replicator.close()
+        self.assertEqual(self.read_all(self.source.path), self.read_all(self.local.path))
+
+    def test_gaps(self):
+        # messages missed upstream are empty locally, while the local chronicle starts at the first replicated
+        days = [pychro.VanillaChronicleReader.to_full_index(datetime.date(2015, 6, d), 0) for d in (1, 2)]
+        sent = [(days[0], i) for i in (3, 4, 5, 8, 9)] + [(days[1], i) for i in (2, 3)]
+        frames = [FakeChronicleServer.frame(pychro.RemoteChronicleReader.SYNCED_OK, days[0] + 3)]
+        frames += [FakeChronicleServer.frame(4, base + i, struct.pack('i', i)) for base, i in sent]
+        server = FakeChronicleServer(frames, 4096)
+        server.start()
+        replicator = pychro.ChronicleReplicator('127.0.0.1', server.port, self.local.path, timeout=0.5)
+        replicated = 0
+        while replicated < len(sent):
+            replicated += replicator.replicate()
+        self.assertEqual(days[1] + 3, replicator.get_index())
+        replicator.shutdown()
+        server.join()
+        replicator.close()
+        received = []
+        with pychro.VanillaChronicleReader(self.local.path, full_index=days[0] + 3) as chron:
+            while chron.get_date() < datetime.date(2015, 6, 2) or chron.get_index() < days[1] + 4:
+                reader = chron.next_reader()
+                received += [(chron.get_index() - 1, reader.get_length() and reader.read_int())]
+            # as the replicator resumes from
+            chron.set_end()
+            self.assertEqual(days[1] + 4, chron.get_index())
+            # with no message before the first replicated, reading from the start of the cycle moves to the next
+            chron.set_index(days[0])
+            chron.next_reader()
+            self.assertEqual(days[1] + 1, chron.get_index())
+        expected = [(base + i, i if (base, i) in sent else 0) for base, start, n in zip(days, (3, 0), (10, 4))
+                    for i in range(start, n)]
+        self.assertEqual(expected, received)
+
+    def test_max_fill(self):
+        day = pychro.VanillaChronicleReader.to_full_index(datetime.date(2015, 6, 1), 0)
+        frames = [FakeChronicleServer.frame(pychro.RemoteChronicleReader.SYNCED_OK, day + 1000)]
+        frames += [FakeChronicleServer.frame(4, day + i, struct.pack('i', i)) for i in (1000, 1100)]
+        server = FakeChronicleServer(frames, 4096)
+        server.start()
+        replicator = pychro.ChronicleReplicator('127.0.0.1', server.port, self.local.path, max_fill=10, timeout=0.5)
+        try:
+            self.assertRaises(pychro.PychroException, lambda: [replicator.replicate() for _ in range(2)])
+            self.assertEqual(day + 1000, replicator.get_index())
+        finally:
+            replicator.shutdown()
+            server.join()
+            replicator.close()
+
+    def test_run(self):
+        self.write(range(100))
+        replicator = pychro.ChronicleReplicator('127.0.0.1', self.server.get_port(), self.local.path)
+        thread = threading.Thread(target=replicator.run)
+        thread.start()
+        self.write(range(100, 200))
+        while replicator.get_index() != self.write_chron.get_index():
+            time.sleep(0.01)
+        replicator.shutdown()
+        thread.join()
+        replicator.close()
+        self.assertEqual(list(range(200)), [i for _, i, _ in self.read_all(self.local.path)])
+
+
 class TestChronPerf(unittest.TestCase):
     def setUp(self):
         self.n = TEST_SIZE
@@ -817,6 +2281,55 @@ class TestMMapWrite(unittest.TestCase):
             self.assertEqual(TEST_SIZE, sum(tcount.values()))
 
 
+def write_contended(path, id, n):
+    write_chron = pychro.VanillaChronicleWriter(path)
+    appender = write_chron.get_appender()
+    for i in range(n):
+        appender.write_int(id)
+        appender.write_int(i)
+        appender.finish()
+    write_chron.close()
+
+
+class TestContentionPerf(unittest.TestCase):
+    def setUp(self):
+        self.n = TEST_SIZE//4
+        self.num_writers = 4
+        self.tempdir = TempDir()
+
+    def check(self):
+        read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+        next_i = [0]*self.num_writers
+        while True:
+            try:
+                reader = read_chron.next_reader()
+            except pychro.NoData:
+                break
+            id = reader.read_int()
+            self.assertEqual(next_i[id], reader.read_int())
+            next_i[id] += 1
+        read_chron.close()
+        self.assertEqual([self.n]*self.num_writers, next_i)
+
+    def run_writers(self, writers, kind):
+        t = time.time()
+        for w in writers:
+            w.start()
+        for w in writers:
+            w.join()
+        t = time.time() - t
+        print('Write %.2f msgs/s with %s %s' % (self.n*self.num_writers/t, self.num_writers, kind))
+        self.check()
+
+    def test_perf_threads(self):
+        self.run_writers([threading.Thread(target=write_contended, args=(self.tempdir.path, id, self.n))
+                          for id in range(self.num_writers)], 'threads')
+
+    def test_perf_processes(self):
+        self.run_writers([multiprocessing.Process(target=write_contended, args=(self.tempdir.path, id, self.n))
+                          for id in range(self.num_writers)], 'processes')
+
+
 class TestMMap(unittest.TestCase):
     def setUp(self):
         self.size = 4096
@@ -837,6 +2350,50 @@ class TestMMap(unittest.TestCase):
         for i, offset in enumerate(range(0, self.size, 8)):
             self.assertEqual(i, pychro._pychro.read_mmap(self.read_data, offset))
 
+    def test_claim_index_slot(self):
+        count = self.size//8
+        for offset in range(8, self.size, 16):
+            pychro._pychro.unsafe_write_mmap(self.write_data, 0, offset)
+        # slot 0 is also free
+        self.assertEqual(0, pychro._pychro.claim_index_slot(self.write_data, 0, count, 1000))
+        self.assertEqual(1, pychro._pychro.claim_index_slot(self.write_data, 0, count, 1001))
+        self.assertEqual(3, pychro._pychro.claim_index_slot(self.write_data, 2, count, 1003))
+        self.assertEqual(5, pychro._pychro.claim_index_slot(self.write_data, 2, count, 1005))
+        self.assertEqual(1003, pychro._pychro.read_mmap(self.read_data, 3*8))
+        self.assertEqual(count-1, pychro._pychro.claim_index_slot(self.write_data, count-2, count, 1))
+        self.assertEqual(-1, pychro._pychro.claim_index_slot(self.write_data, count-2, count, 1))
+        self.assertEqual(-1, pychro._pychro.claim_index_slot(self.write_data, count, count, 1))
+
+    def test_claim_index_slots(self):
+        count = self.size//8
+        for offset in range(0, self.size, 16):
+            pychro._pychro.unsafe_write_mmap(self.write_data, 0, offset)
+        vals = array.array('Q', [1000, 1001, 1002])
+        # free slots are 0, 2, 4..
+        self.assertEqual((3, 5), pychro._pychro.claim_index_slots(self.write_data, 0, count, vals))
+        self.assertEqual(1002, pychro._pychro.read_mmap(self.read_data, 4*8))
+        self.assertEqual((1, count), pychro._pychro.claim_index_slots(self.write_data, count-2, count, vals))
+        self.assertEqual(1000, pychro._pychro.read_mmap(self.read_data, (count-2)*8))
+
+    def test_claim_high_water_mark(self):
+        # slots of the first half, the second half as a control file
+        count = self.size//16
+        control = self.write_data + self.size//2
+        for offset in range(0, self.size, 8):
+            pychro._pychro.unsafe_write_mmap(self.write_data, 0, offset)
+        pychro._pychro.unsafe_write_mmap(self.write_data, 1, 8)
+        self.assertEqual(2, pychro._pychro.claim_index_slot(self.write_data, 1, count, 1002, control, 0, 1000, 64))
+        self.assertEqual(1003, pychro._pychro.read_mmap(control, 0))
+        self.assertEqual(1, pychro._pychro.read_mmap(control, 64) & 0xffffffff)
+        # not lowered by an earlier slot
+        self.assertEqual(0, pychro._pychro.claim_index_slot(self.write_data, 0, count, 1000, control, 0, 1000, 64))
+        self.assertEqual(1003, pychro._pychro.read_mmap(control, 0))
+        vals = array.array('Q', [1, 2])
+        self.assertEqual((1, count), pychro._pychro.claim_index_slots(self.write_data, count-1, count, vals, control,
+                                                                      0, 1000, 64))
+        self.assertEqual(1000 + count, pychro._pychro.read_mmap(control, 0))
+        self.assertEqual(3, pychro._pychro.read_mmap(control, 64) & 0xffffffff)
+
     def test_write(self):
         for i, offset in enumerate(range(0, self.size, 8)):
             self.assertEqual(i, pychro._pychro.read_mmap(self.write_data, offset))
@@ -944,6 +2501,61 @@ class TestReadWriteTypes(unittest.TestCase):
         read_chron3 = pychro.VanillaChronicleReader(copy_tempdir.path)
         self.verify_complex(read_chron3)
 
+    def test_append_message_from(self):
+        self.write_complex(self.write_chron)
+        copy_tempdir = TempDir()
+        read_chron2 = pychro.VanillaChronicleReader(self.tempdir.path)
+        with pychro.VanillaChronicleWriter(copy_tempdir.path) as write_chron2:
+            write_chron2.get_appender().append_message_from(read_chron2.next_reader())
+        self.verify_complex(pychro.VanillaChronicleReader(copy_tempdir.path))
+
+    def test_append_messages_from(self):
+        appender = self.write_chron.get_appender()
+        for i in range(300):
+            appender.write_int(i)
+            appender.write_string('m%s' % i)
+            appender.finish()
+        copy_tempdir = TempDir()
+        read_chron2 = pychro.VanillaChronicleReader(self.tempdir.path)
+        write_chron2 = pychro.VanillaChronicleWriter(copy_tempdir.path)
+        appender = write_chron2.get_appender()
+        start = read_chron2.to_full_index(read_chron2.get_date(), 0)
+        self.assertEqual(100, appender.append_messages_from(read_chron2.read_range(start, start + 100), 32))
+        self.assertEqual(200, appender.append_messages_from(read_chron2.next_batch()))
+        read_chron3 = pychro.VanillaChronicleReader(copy_tempdir.path)
+        self.assertEqual([(i, 'm%s' % i) for i in range(300)],
+                         [(reader.read_int(), reader.read_string()) for reader in read_chron3.next_batch()])
+        write_chron2.close()
+
+    def test_write_raw(self):
+        appender = self.write_chron.get_appender()
+        appender.write_raw(b'abc')
+        appender.write_raw(bytearray(b'0123456789'), 2, 3)
+        appender.write_raw(memoryview(b'xyz'), 1)
+        appender.finish()
+        self.assertRaises(IndexError, appender.write_raw, b'abc', 2, 2)
+        self.assertRaises(pychro.NoSpace, appender.write_raw, bytes(pychro.DATA_FILE_SIZE))
+        self.assertEqual(0, appender.bytes_written())
+        reader = self.read_chron.next_reader()
+        self.assertEqual(8, reader.get_length())
+        self.assertEqual(b'abc234yz', reader.get_bytes()[reader.get_offset():reader.get_offset()+8])
+
+    def test_no_space(self):
+        appender = self.write_chron.get_appender()
+        self.assertRaises(pychro.NoSpace, appender.advance, pychro.DATA_FILE_SIZE)
+        self.assertRaises(pychro.NoSpace, appender.write_string, 'x'*pychro.DATA_FILE_SIZE)
+        self.assertRaises(pychro.InvalidArgumentError, appender.write_fixed_string, 'xx', 1)
+        self.assertEqual(0, appender.bytes_written())
+
+    def test_out_of_range(self):
+        appender = self.write_chron.get_appender()
+        self.assertRaises(OverflowError, appender.write_byte, 256)
+        self.assertRaises(OverflowError, appender.write_int, 2**31)
+        self.assertRaises(OverflowError, appender.write_short, -2**15-1)
+        self.assertRaises(OverflowError, appender.write_float, 1e39)
+        self.assertEqual(0, appender.bytes_written())
+        appender.write_float(float('inf'))
+        self.assertEqual(4, appender.bytes_written())
 
     def test_neg_stop_bit(self):
         appender = self.write_chron.get_appender()
@@ -957,6 +2569,237 @@ class TestReadWriteTypes(unittest.TestCase):
         self.read_chron.close()
 
 
+class TestRawByteReader(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        TestReadWriteTypes.write_complex(self.write_chron)
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+
+    def tearDown(self):
+        self.read_chron.close()
+
+    def read_all(self, reader):
+        ret = [reader.get_length()]
+        ret += [reader.peek_byte()]
+        ret += [reader.read_byte() for _ in range(256)]
+        ret += [reader.read_stopbit() for _ in range(6)]
+        ret += [reader.peek_boolean(), reader.read_boolean(), reader.read_boolean()]
+        ret += [reader.peek_string(), reader.read_string(), reader.read_string()]
+        offset = reader.get_offset()
+        ret += [reader.peek_string_undef_offset()]
+        reader.set_offset(offset)
+        ret += [reader.read_fixed_string(18)]
+        ret += [reader.peek_double(), reader.read_double()]
+        ret += [reader.peek_int(), reader.read_int(), reader.read_int(), reader.read_int()]
+        ret += [reader.peek_long(), reader.read_long(), reader.read_long(), reader.read_long()]
+        ret += [reader.read_float()]
+        reader.advance(1)
+        ret += [reader.read_string(), reader.get_offset()]
+        return ret
+
+    def test_native_matches_python(self):
+        self.assertIsNot(pychro.RawByteReader, pychro.PyRawByteReader)
+        native = self.read_chron.next_reader()
+        python = pychro.PyRawByteReader(native.get_offset(), native.get_bytes())
+        self.assertEqual(self.read_all(python), self.read_all(native))
+
+    def test_bytes(self):
+        data = struct.pack('i', ~8) + struct.pack('hh', -3, 4) + b'\x81\x01' + b'ab'
+        reader = pychro.RawByteReader(4, data)
+        self.assertEqual(8, reader.get_length())
+        self.assertEqual(-3, reader.peek_short())
+        self.assertEqual(-3, reader.read_short())
+        self.assertEqual(4, reader.read_short())
+        self.assertEqual(129, reader.read_stopbit())
+        self.assertEqual(b'ab'.decode('utf16'), reader.read_char())
+        self.assertRaises(IndexError, reader.read_int)
+
+    def test_close_with_reader(self):
+        reader = self.read_chron.next_reader()
+        self.read_chron.close()
+        self.assertRaises(ValueError, reader.read_byte)
+
+class SlottedMessage:
+    __slots__ = ['id', 'name', 'price']
+
+    def __init__(self, id, name, price):
+        self.id = id
+        self.name = name
+        self.price = price
+
+
+class TestMessageSchema(unittest.TestCase):
+    FIELDS = ['int', 'long', 'string', 'double', 'short', 'byte', 'boolean', 'stopbit', ('fixed_string', 12),
+              'float', 'int']
+
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.write_chron = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+
+    def tearDown(self):
+        self.write_chron.close()
+        self.read_chron.close()
+
+    def test_round_trip(self):
+        schema = pychro.MessageSchema(self.FIELDS)
+        appender = self.write_chron.get_appender()
+        values = []
+        for i in range(100):
+            values += [(i, -i*2**40, 'str%s' % i, i/3, -i, i, i % 2 == 0, i*1000, 'fixed%s' % i, 0.5, -i)]
+            schema.append(appender, *values[-1])
+        for i in range(100):
+            self.assertEqual(values[i], schema.decode(self.read_chron.next_reader()))
+
+    def test_matches_field_calls(self):
+        schema = pychro.MessageSchema(['int', 'string', 'double'])
+        appender = self.write_chron.get_appender()
+        schema.append(appender, 1, 'one', 1.5)
+        appender.write_int(2)
+        appender.write_string('two')
+        appender.write_double(2.5)
+        appender.finish()
+        reader = self.read_chron.next_reader()
+        self.assertEqual(1, reader.read_int())
+        self.assertEqual('one', reader.read_string())
+        self.assertEqual(1.5, reader.read_double())
+        self.assertEqual((2, 'two', 2.5), schema.decode(self.read_chron.next_reader()))
+
+    def test_named_and_factory(self):
+        named = pychro.MessageSchema(['int', 'string', 'double'], names=['id', 'name', 'price'])
+        slotted = pychro.MessageSchema(['int', 'string', 'double'], factory=SlottedMessage)
+        fixed = pychro.MessageSchema(['int', 'long'], names=['a', 'b'])
+        appender = self.write_chron.get_appender()
+        named.append(appender, 7, 'seven', 7.7)
+        fixed.append(appender, 1, 2)
+        message = named.decode(self.read_chron.next_reader())
+        self.assertEqual((7, 'seven', 7.7), (message.id, message.name, message.price))
+        self.assertEqual(named.type(7, 'seven', 7.7), message)
+        self.assertEqual(fixed.type(1, 2), fixed.decode(self.read_chron.next_reader()))
+        self.read_chron.set_start_index_today()
+        message = slotted.decode(self.read_chron.next_reader())
+        self.assertEqual((7, 'seven', 7.7), (message.id, message.name, message.price))
+
+    def test_invalid(self):
+        self.assertRaises(pychro.InvalidArgumentError, pychro.MessageSchema, ['int', 'char'])
+        self.assertRaises(pychro.InvalidArgumentError, pychro.MessageSchema, ['int'], names=['a', 'b'])
+        self.assertRaises(pychro.InvalidArgumentError, pychro.MessageSchema, ['int', 12])
+        self.assertRaises(pychro.InvalidArgumentError, pychro.MessageSchema, [('fixed_string',)])
+        schema = pychro.MessageSchema(['int', 'int'])
+        self.assertRaises(pychro.InvalidArgumentError, schema.encode, self.write_chron.get_appender(), 1)
+
+    def test_encode_error(self):
+        schema = pychro.MessageSchema(['int', 'string', 'long'])
+        appender = self.write_chron.get_appender()
+        appender.write_int(0)
+        # the fields of a failed encode are discarded, those written before are kept
+        self.assertRaises(struct.error, schema.encode, appender, 1, 'one', 'x')
+        self.assertRaises(TypeError, schema.encode, appender, 1, 2, 3)
+        self.assertEqual(4, appender.bytes_written())
+        schema.encode(appender, 1, 'one', 2)
+        appender.finish()
+        reader = self.read_chron.next_reader()
+        self.assertEqual(0, reader.read_int())
+        self.assertEqual((1, 'one', 2), schema.decode(reader))
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy not installed')
+class TestReadArray(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TempDir()
+        self.schema = pychro.MessageSchema(['int', 'double', 'boolean', 'long'], names=['i', 'd', 'b', 'l'])
+        self.n = TEST_SIZE
+        self.write_chron1 = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.write_chron2 = pychro.VanillaChronicleWriter(self.tempdir.path)
+        self.read_chron = pychro.VanillaChronicleReader(self.tempdir.path)
+
+    def tearDown(self):
+        self.write_chron1.close()
+        self.write_chron2.close()
+        self.read_chron.close()
+
+    def write(self, n):
+        def run(chron, start):
+            appender = chron.get_appender()
+            for i in range(start, n, 2):
+                self.schema.append(appender, i, i/2, i % 3 == 0, -i)
+                time.sleep(0)
+        # two threads, so two sets of data files
+        ts = [threading.Thread(target=run, args=(self.write_chron1, 0)),
+              threading.Thread(target=run, args=(self.write_chron2, 1))]
+        [t.start() for t in ts]
+        [t.join() for t in ts]
+
+    def test_date(self):
+        self.write(self.n)
+        expected = [self.schema.decode(reader) for reader in self.read_chron]
+        array = self.read_chron.read_array(self.schema, date=self.read_chron.get_date())
+        self.assertEqual(self.n, len(array))
+        self.assertEqual(expected, [self.schema.type(*row) for row in array.tolist()])
+        self.assertEqual(sorted(range(self.n)), sorted(array['i'].tolist()))
+        self.assertEqual((array['i']/2).tolist(), array['d'].tolist())
+        self.assertEqual((-array['i']).tolist(), array['l'].tolist())
+        self.assertEqual((array['i'] % 3 == 0).tolist(), array['b'].tolist())
+
+    def test_range(self):
+        self.write(100)
+        base = self.read_chron.to_full_index(self.read_chron.get_date(), 0)
+        array = self.read_chron.read_array(self.schema, base+10, base+20)
+        self.assertEqual(10, len(array))
+        self.assertEqual(base+20, self.read_chron.get_index())
+        self.read_chron.set_index(base+10)
+        self.assertEqual([self.schema.decode(self.read_chron.next_reader()) for _ in range(10)],
+                         [self.schema.type(*row) for row in array.tolist()])
+        self.assertEqual(90, len(self.read_chron.read_array(self.schema, base+10, base+1000)))
+        self.assertEqual(0, len(self.read_chron.read_array(self.schema, base+100)))
+
+    def test_index_view(self):
+        self.write(100)
+        view = self.read_chron.get_index_view(0)
+        self.assertEqual(pychro.ENTRIES_PER_INDEX_FILE, len(view))
+        slots = numpy.frombuffer(view, dtype=numpy.uint64)[:101].copy()
+        threads, filenums, positions = self.read_chron.decode_index_slots(slots)
+        self.assertEqual(0, slots[100])
+        self.assertEqual(2, len(set(threads[:100].tolist())))
+        self.assertEqual([0]*100, filenums[:100].tolist())
+        expected = []
+        while True:
+            try:
+                filenum, pos, thread = self.read_chron._next_position()
+                expected += [(thread, filenum, pos)]
+            except pychro.NoData:
+                break
+        self.assertEqual(expected, list(zip(threads[:100].tolist(), filenums[:100].tolist(),
+                                            positions[:100].tolist())))
+        self.assertRaises(pychro.EndOfIndexfile, self.read_chron.get_index_view, 1)
+
+    def test_index_view_after_close(self):
+        self.write(10)
+        view = self.read_chron.get_index_view(0)
+        first = view[0]
+        part = view[0:10]
+        array = numpy.frombuffer(view, dtype=numpy.uint64)
+        # still mapped for the slice and array
+        self.read_chron.close()
+        self.assertEqual(first, part[0])
+        self.assertEqual(first, array[0])
+        self.assertRaises(ValueError, len, view)
+        del array
+        part.release()
+
+    def test_variable_width(self):
+        self.write(1)
+        self.assertRaises(pychro.InvalidArgumentError, self.read_chron.read_array,
+                          pychro.MessageSchema(['int', 'string']))
+
+
 class TestDateIndex(unittest.TestCase):
     def test_date_index(self):
         self.assertEqual(18187021835042826, pychro.VanillaChronicleWriter.to_full_index(datetime.date(2015, 4, 16), 10))